@@ -9,4 +9,7 @@ vna.write(f"CALC:PAR:DEL:ALL")
 vna.add_trace(1, 1, VectorNetworkAnalyzerCtg.MEAS_S11)
 vna.write(f"SENS:SWE:POIN 11")
 vna.send_manual_trigger()
-print(vna.get_trace_data(1, 1))
\ No newline at end of file
+
+# Trace data is a complex ndarray
+s11 = vna.get_trace_data(1, 1)
+print(f"S11 [dB]: {lin_to_dB(np.abs(s11))}")
\ No newline at end of file
@@ -38,10 +38,14 @@ if __name__ == '__main__':
 	# login to server with default admin password
 	ca.login("admin", "password")
 	ca.register_client_id("driver_main")
+	ca.negotiate_compression()
 	
 	# Create a driver manager to handle the drivers
 	dm = DriverManager(log, ca)
 	
+	# Let clients fetch large waveforms directly from this host, bypassing the server
+	dm.start_bulk_server()
+	
 	# Create instrument driver and register with server
 	scope1 = RigolDS1000Z("TCPIP0::192.168.1.20::INSTR", log, remote_id="Scope1", client_id=ca.client_id)
 	
@@ -53,21 +57,7 @@ if __name__ == '__main__':
 	
 	while True:
 		
-		# Listen for commands from server
-		net_cmds = ca.dl_listen()
-		
-		# Check for error
-		if net_cmds is None:
+		# Listen for commands from server. Each command is queued to its instrument's
+		# worker thread, which routes it to the driver and sends the reply when done.
+		if dm.listen() is None:
 			log.error("An error occured while fetching NetworkCommands from the server.")
-		
-		# Process each command
-		for nc in net_cmds:
-			
-			# CHeck for None (Shouldn't be possible)
-			if nc is None:
-				log.warning("A 'None' snuck into the NetworkCommands list!")
-				continue
-			
-			# Route command to driver and look for return value
-			status_rval = dm.route_command(nc)
-			dm.dl_reply(nc, status_rval)
\ No newline at end of file
@@ -37,6 +37,7 @@ if __name__ == '__main__':
 	# login to server with default admin password
 	ca.login("admin", "password")
 	ca.register_client_id("terminal_main")
+	ca.negotiate_compression()
 	
 	# Create client options
 	copt = ClientOptions()
@@ -3,12 +3,41 @@ import pylogfile.base as plf
 import numpy as np
 import time
 import inspect
+import functools
+import threading
+import atexit
 from abc import ABC, abstractmethod
+from collections.abc import Mapping
+from contextlib import contextmanager
 from socket import getaddrinfo, gethostname
 import ipaddress
 import fnmatch
 import matplotlib.pyplot as plt
 
+# Max size of response to read in a single read_binary_block() call (1 GB)
+BINARY_BLOCK_MAX_READ_LEN = 1073741824
+# Max number of response-header bytes to skip while looking for the '#' of a binary block
+BINARY_BLOCK_MAX_HEADER_LEN = 64
+# Size of each read when transferring a binary block payload into its buffer
+BINARY_BLOCK_CHUNK_LEN = 1048576
+
+# Default max length of a single ';'-joined message sent by Driver.batch() (characters)
+SCPI_BATCH_MAX_LEN = 1024
+
+# Commands which reset instrument settings, and so invalidate the settings cache
+SCPI_RESET_COMMANDS = ("*RST", "*RCL", "SYST:PRES", "SYSTEM:PRES")
+
+# Strategies used by Driver.wait_ready()
+WAIT_OPC_QUERY = "opc-query" # Blocking *OPC? query with VISA timeout
+WAIT_SRQ = "srq" # *OPC with service request event
+WAIT_POLL = "poll" # *OPC with *ESR? polling and exponential backoff
+
+# Initial period between *ESR? polls for WAIT_POLL (seconds)
+WAIT_POLL_MIN_PERIOD = 0.001
+
+# Max time to wait for a service request before checking *ESR? for WAIT_SRQ (seconds)
+WAIT_SRQ_CHECK_PERIOD = 1
+
 def get_ip(ip_addr_proto="ipv4", ignore_local_ips=True):
 	# By default, this method only returns non-local IPv4 addresses
 	# To return IPv6 only, call get_ip('ipv6')
@@ -50,6 +79,10 @@ def truncate_str(s:str, limit:int=14):
 	''' Used in automatic logs to make sure a value converted to a string isn't super
 	long. '''
 	
+	# Only convert the ends of long sequences (ie. waveforms) to strings
+	if isinstance(s, (list, tuple, np.ndarray)) and len(s) > 2*limit:
+		s = str(s[:limit])[:-1] + " ... " + str(s[-limit:])[1:]
+	
 	s = str(s)
 	
 	if len(s) <= limit:
@@ -106,10 +139,287 @@ class Identifier:
 		
 		return f"idn_model: {self.idn_model}\ncategory: {self.ctg}\ndriver-class: {self.dvr}\nremote-id: {self.remote_id}\nremote-addr: {self.remote_addr}"
 
+class TraceData(Mapping):
+	''' Trace or waveform data read from an instrument. The y data is held as a
+	typed ndarray (ie. float32, float64 or complex128, as sent by the instrument). The
+	x axis is described lazily, either by start/stop (evenly spaced points from x_start
+	to x_stop, inclusive) or by origin/increment (x = x_origin + n*x_increment), and is
+	only generated when accessed.
+	
+	Can be used in place of the waveform dictionaries returned by get_trace_data() and
+	get_waveform(), with keys:
+		* x: X data (ndarray)
+		* y: Y data (ndarray)
+		* x_units: Units of x-axis
+		* y_units: Units of y-axis
+	'''
+	
+	__slots__ = ("y", "x_units", "y_units", "x_start", "x_stop", "x_origin", "x_increment", "timestamp", "_x")
+	
+	KEYS = ("x", "y", "x_units", "y_units")
+	
+	def __init__(self, y, x_units:str="", y_units:str="", x_start:float=None, x_stop:float=None, x_origin:float=None, x_increment:float=None, x=None, timestamp:float=None):
+		
+		self.y = np.asarray(y)
+		self.x_units = x_units
+		self.y_units = y_units
+		
+		# Lazy x-axis definition
+		self.x_start = x_start
+		self.x_stop = x_stop
+		self.x_origin = x_origin
+		self.x_increment = x_increment
+		self._x = None if x is None else np.asarray(x) # Explicit x data, if provided
+		
+		# Time of acquisition (seconds since epoch)
+		self.timestamp = time.time() if timestamp is None else timestamp
+	
+	@property
+	def x(self):
+		''' Returns the x data as an ndarray, generating it if required. '''
+		
+		if self._x is not None:
+			return self._x
+		
+		num_points = len(self.y)
+		if (self.x_start is not None) and (self.x_stop is not None):
+			return np.linspace(self.x_start, self.x_stop, num_points)
+		elif (self.x_origin is not None) and (self.x_increment is not None):
+			return self.x_origin + np.arange(num_points)*self.x_increment
+		else:
+			return np.arange(num_points, dtype=np.float64)
+	
+	def __getitem__(self, key:str):
+		
+		if key not in TraceData.KEYS:
+			raise KeyError(key)
+		
+		return getattr(self, key)
+	
+	def __setitem__(self, key:str, value):
+		
+		if key == "x":
+			self._x = np.asarray(value)
+		elif key == "y":
+			self.y = np.asarray(value)
+		elif key in TraceData.KEYS:
+			setattr(self, key, value)
+		else:
+			raise KeyError(key)
+	
+	def __iter__(self):
+		return iter(TraceData.KEYS)
+	
+	def __len__(self):
+		return len(TraceData.KEYS)
+	
+	def __repr__(self):
+		return f"TraceData(points={len(self.y)}, dtype={self.y.dtype}, x_units={self.x_units}, y_units={self.y_units})"
+	
+	def to_dict(self):
+		''' Returns a plain dictionary with keys x, y, x_units and y_units. '''
+		
+		return {'x':self.x, 'y':self.y, 'x_units':self.x_units, 'y_units':self.y_units}
+
+class VisaSession:
+	''' A pooled PyVISA session, shared by all drivers connected to the same address.
+	The lock must be held for any transaction (ie. a write and its read) so drivers
+	sharing the session do not interleave.'''
+	
+	def __init__(self, inst, backend:str, address:str):
+		self.inst = inst
+		self.backend = backend
+		self.address = address
+		self.lock = threading.RLock()
+		self.refcount = 0
+		self.stale = False # Removed from the pool, and closed once no driver holds it
+
+class VisaRegistry:
+	''' Process-wide registry of PyVISA ResourceManagers and open sessions. One
+	ResourceManager is created per VISA backend, and sessions are pooled by
+	(backend, address) and reference counted. Sessions which are no longer used by
+	any driver are kept open so reconnecting is cheap, until close_idle() or
+	close_all() is called. All functions are thread safe. Resources are opened
+	outside of the registry lock, so drivers at different addresses connect in
+	parallel.'''
+	
+	def __init__(self):
+		self.mtx = threading.RLock()
+		self.managers = {} # Backend string -> ResourceManager
+		self.sessions = {} # (backend, address) -> VisaSession
+		self.open_locks = {} # (backend, address) -> Lock held while the resource is opened
+	
+	def get_manager(self, backend:str=""):
+		''' Returns the shared ResourceManager for the backend, creating it if needed.
+		Backend strings are the same as for pv.ResourceManager (ie. "" for the default
+		backend, "@py" for pyvisa-py).'''
+		
+		with self.mtx:
+			rm = self.managers.get(backend, None)
+			if rm is None:
+				rm = pv.ResourceManager(backend)
+				self.managers[backend] = rm
+			return rm
+	
+	def open_session(self, address:str, backend:str="", discard:bool=False):
+		''' Returns a VisaSession for the address, opening the resource if no pooled
+		session exists. Each call must be matched by a call to release_session().
+		
+		Parameters:
+			address (str): VISA address of the instrument.
+			backend (str): VISA backend string.
+			discard (bool): If True, any existing pooled session is closed first (ie.
+				if it is suspected to be broken).
+		
+		Returns:
+			VisaSession. Raises an exception if the resource could not be opened.
+		'''
+		
+		key = (backend, address)
+		
+		if discard:
+			self.discard_session(address, backend)
+		
+		with self.mtx:
+			
+			sess = self.sessions.get(key, None)
+			if sess is not None:
+				sess.refcount += 1
+				return sess
+			
+			rm = self.get_manager(backend)
+			open_lock = self.open_locks.setdefault(key, threading.Lock())
+		
+		# Only one thread opens each address. Others wait, then use its session.
+		with open_lock:
+			
+			with self.mtx:
+				sess = self.sessions.get(key, None)
+				if sess is not None:
+					sess.refcount += 1
+					return sess
+			
+			inst = rm.open_resource(address)
+			
+			with self.mtx:
+				sess = VisaSession(inst, backend, address)
+				sess.refcount += 1
+				self.sessions[key] = sess
+				return sess
+	
+	def release_session(self, sess:VisaSession):
+		''' Releases a driver's reference to a session. The session stays open in the
+		pool when its reference count reaches zero, unless it was discarded.'''
+		
+		with self.mtx:
+			sess.refcount = max(0, sess.refcount-1)
+			close = sess.stale and (sess.refcount == 0)
+		
+		if close:
+			self._close_session(sess)
+	
+	def discard_session(self, address:str, backend:str=""):
+		''' Removes a session from the pool, so the next open_session() opens a new
+		resource. The session is closed now if no driver holds it, otherwise when the
+		last driver releases it.'''
+		
+		with self.mtx:
+			sess = self.sessions.pop((backend, address), None)
+			if sess is None:
+				return
+			sess.stale = True
+			close = (sess.refcount == 0)
+		
+		if close:
+			self._close_session(sess)
+	
+	def _close_session(self, sess:VisaSession):
+		''' Closes a session which has been removed from the pool. Called without the
+		registry lock, so a session busy in a long transaction only delays its own
+		close.'''
+		
+		with sess.lock:
+			try:
+				sess.inst.close()
+			except Exception:
+				pass
+	
+	def close_idle(self):
+		''' Closes all pooled sessions which are not used by any driver.'''
+		
+		with self.mtx:
+			idle = [s for s in self.sessions.values() if s.refcount == 0]
+		
+		for sess in idle:
+			self.discard_session(sess.address, sess.backend)
+	
+	def close_all(self):
+		''' Closes all sessions, including those still held by drivers, and all
+		ResourceManagers.'''
+		
+		with self.mtx:
+			sessions = list(self.sessions.values())
+			self.sessions = {}
+			managers = list(self.managers.values())
+			self.managers = {}
+		
+		for sess in sessions:
+			sess.stale = True
+			self._close_session(sess)
+		for rm in managers:
+			try:
+				rm.close()
+			except Exception:
+				pass
+
+# Shared registry used by all drivers
+visa_registry = VisaRegistry()
+atexit.register(visa_registry.close_all)
+
+def sessionlocked(func):
+	''' Decorator which holds the driver's session lock for the duration of a Driver
+	method, so multi-step transactions are not interleaved with other drivers
+	sharing the session.'''
+	
+	@functools.wraps(func)
+	def wrapper(self, *args, **kwargs):
+		with self.inst_lock:
+			return func(self, *args, **kwargs)
+	
+	return wrapper
+
 class Driver(ABC):
 	
-	#TODO: Modify all category and drivers to pass kwargs to super
-	def __init__(self, address:str, log:plf.LogPile, expected_idn:str="", is_scpi:bool=True, remote_id:str=None, host_id:HostID=None, client_id:str="", dummy:bool=False):
+	# State parameters which are measurement results rather than settings, and so are
+	# never served from the settings cache.
+	cache_exclude = []
+	
+	# get_ functions which return measurement results rather than settings, and so are
+	# never served from the settings cache.
+	cache_exclude_getters = ["get_trace_data", "get_trace", "get_traces", "get_channel_data", "get_waveform", "get_measurement", "get_last_value", "get_temp"]
+	
+	# Strategies supported by the instrument for wait_ready(), in order of preference.
+	# If a strategy fails (ie. the VISA backend does not support events), the next
+	# one is tried. Drivers opt in to WAIT_SRQ or WAIT_OPC_QUERY by overriding this.
+	wait_strategies = [WAIT_POLL]
+	
+	def __init_subclass__(cls, **kwargs):
+		''' Wraps the get_ and set_ functions of each driver so they can be served by
+		the settings cache (see enable_cache()). '''
+		super().__init_subclass__(**kwargs)
+		
+		for name, func in list(cls.__dict__.items()):
+			if (not inspect.isfunction(func)) or getattr(func, 'cache_wrapped', False):
+				continue
+			
+			if name.startswith("get_"):
+				setattr(cls, name, cached_getter(func))
+			elif name.startswith("set_"):
+				setattr(cls, name, cached_setter(func))
+			elif name in ("connect", "preset", "refresh_state"):
+				setattr(cls, name, cache_invalidating(func))
+	
+	def __init__(self, address:str, log:plf.LogPile, expected_idn:str="", is_scpi:bool=True, remote_id:str=None, host_id:HostID=None, client_id:str="", dummy:bool=False, visa_backend:str="", defer_connect:bool=False):
 		
 		self.address = address
 		self.log = log
@@ -121,8 +431,11 @@ class Driver(ABC):
 		self.verified_hardware = False
 		
 		self.online = False
-		self.rm = pv.ResourceManager()
+		self.visa_backend = visa_backend
+		self.rm = visa_registry.get_manager(visa_backend) if is_scpi else None
+		self.session = None # Pooled VisaSession, see VisaRegistry
 		self.inst = None
+		self.inst_lock = threading.RLock() # Replaced by the session lock when connected
 		
 		# State tracking parameters
 		self.dummy = False
@@ -131,6 +444,26 @@ class Driver(ABC):
 		self.rich_state = {}
 		self.state_change_log_level = plf.DEBUG
 		
+		# Logs below this level are skipped before any message formatting takes place, and
+		# so are neither printed nor recorded in the LogPile. If None (default), every log
+		# is recorded. Set to ie. plf.INFO to speed up frequent writes and queries.
+		self.log_gate_level = None
+		
+		# Settings cache parameters (see enable_cache())
+		self.cache_enabled = False
+		self.cache_ttl_s = None
+		self.cache_hits = 0
+		self.cache_misses = 0
+		self.cache_valid = {} # Time at which each (param, channel) was last known to match the instrument
+		self.cache_lookup = {} # Maps function name and arguments to the (param, channel) it reads or sets
+		self.cache_value_args = {} # Maps set_ function name to the name of its value argument
+		self.cache_records = [] # Stack of modify_state() calls recorded for each nested get/set call
+		
+		# Write batching parameters (see batch())
+		self.batch_depth = 0
+		self.batch_buffer = []
+		self.batch_max_len = SCPI_BATCH_MAX_LEN
+		
 		# Setup ID
 		self.id.remote_addr = client_id + "|" + self.address
 		if remote_id is not None:
@@ -142,32 +475,52 @@ class Driver(ABC):
 		ctg_o = inheritance_list[1]
 		self.id.ctg = f"{ctg_o}"
 		self.id.dvr = f"{dvr_o}"
+		self.update_id_str()
 		
 		# Dummy variables
 		self.dummy = dummy
 		self.dummy_state_machine = {}
 		
 		#TODO: Automatically reconnect
-		# Connect instrument
-		self.connect()
+		# Connect instrument, unless connection is handled later (ie. by DriverFleet)
+		if not defer_connect:
+			self.connect()
+	
+	def update_id_str(self):
+		''' Updates the cached identifier strings used as log prefixes. Must be called
+		after modifying self.id.'''
+		
+		self.id_short_str = f"(Driver: >:q{self.id.short_str()}<) "
+		self.id_long_str = f"({self.id}) "
+	
+	def log_enabled(self, level:int):
+		''' Checks if a log at the specified level would be recorded. Used to skip
+		building log messages in frequently called functions.'''
+		
+		if self.log_gate_level is None:
+			return True
+		return level >= self.log_gate_level
 	
 	def lowdebug(self, message:str, detail:str=""):
-		self.log.lowdebug(f"(Driver: >:q{self.id.short_str()}<) {message}", detail=f"({self.id}) {detail}")
+		if self.log_enabled(plf.LOWDEBUG):
+			self.log.lowdebug(self.id_short_str + message, detail=self.id_long_str + detail)
 	
 	def debug(self, message:str, detail:str=""):
-		self.log.debug(f"(Driver: >:q{self.id.short_str()}<) {message}", detail=f"({self.id}) {detail}")
+		if self.log_enabled(plf.DEBUG):
+			self.log.debug(self.id_short_str + message, detail=self.id_long_str + detail)
 	
 	def info(self, message:str, detail:str=""):
-		self.log.info(f"(Driver: >:q{self.id.short_str()}<) {message}", detail=f"({self.id}) {detail}")
+		if self.log_enabled(plf.INFO):
+			self.log.info(self.id_short_str + message, detail=self.id_long_str + detail)
 	
 	def warning(self, message:str, detail:str=""):
-		self.log.warning(f"(Driver: >:q{self.id.short_str()}<) {message}", detail=f"({self.id}) {detail}")
+		self.log.warning(self.id_short_str + message, detail=self.id_long_str + detail)
 	
 	def error(self, message:str, detail:str=""):
-		self.log.error(f"(Driver: >:q{self.id.short_str()}<) {message}", detail=f"({self.id}) {detail}")
+		self.log.error(self.id_short_str + message, detail=self.id_long_str + detail)
 		
 	def critical(self, message:str, detail:str=""):
-		self.log.critical(f"(Driver: >:q{self.id.short_str()}<) {message}", detail=f"({self.id}) {detail}")
+		self.log.critical(self.id_short_str + message, detail=self.id_long_str + detail)
 	
 	def connect(self, check_id:bool=True):
 		
@@ -176,9 +529,22 @@ class Driver(ABC):
 			self.error(f"Cannot use default connect() function, instrument does recognize SCPI commands.", detail=f"{self.id}")
 			return
 		
+		# Settings may have changed while disconnected
+		self.invalidate_cache()
+		
+		# Release previous session. If the driver went offline, the session may be
+		# broken, so it is reopened.
+		discard = False
+		if self.session is not None:
+			discard = not self.online
+			visa_registry.release_session(self.session)
+			self.session = None
+		
 		# Attempt to connect
 		try:
-			self.inst = self.rm.open_resource(self.address)
+			self.session = visa_registry.open_session(self.address, self.visa_backend, discard=discard)
+			self.inst = self.session.inst
+			self.inst_lock = self.session.lock
 			self.online = True
 			self.debug(f"Connected to address >{self.address}<.", detail=f"{self.id}")
 			
@@ -209,11 +575,19 @@ class Driver(ABC):
 			value, or result of query_func if provided.
 		"""
 		
-		if (query_func is None) or self.dummy or self.blind_state_update:
+		# Record which parameter was touched for the settings cache, by the innermost
+		# get/set call only
+		if len(self.cache_records) > 0:
+			self.cache_records[-1].append((param, channel, value))
+		
+		# With the cache enabled, values written to the instrument are stored without
+		# being read back. The cache marks them unknown, so they are read on the next get.
+		if (query_func is None) or self.dummy or self.blind_state_update or self.cache_enabled:
 			prev_val = self.state[param]
 			
 			# Record ing log
-			self.log.add_log(self.state_change_log_level, f"(Driver: >:q{self.id.short_str()}<) State modified; >{param}<=>:a{truncate_str(value)}<.", detail=f"Previous value was {truncate_str(prev_val)}")
+			if self.log_enabled(self.state_change_log_level):
+				self.log.add_log(self.state_change_log_level, f"{self.id_short_str}State modified; >{param}<=>:a{truncate_str(value)}<.", detail=f"Previous value was {truncate_str(prev_val)}")
 			
 			if channel is None:
 				self.state[param] = value
@@ -264,6 +638,88 @@ class Driver(ABC):
 		self.debug(f"Preset.", detail=f"{self.id}")
 		
 		self.write("*RST")
+		self.invalidate_cache()
+	
+	def enable_cache(self, enable:bool=True, ttl_s:float=None):
+		''' Enables or disables the settings cache. While enabled:
+			* get_ functions return the value in self.state without querying the
+			instrument, if it is known to be current.
+			* set_ functions are skipped if the instrument is already known to have
+			the requested value.
+			* set_ functions do not read the written value back. The parameter is
+			marked unknown instead, so the next get_ call reads the value the
+			instrument actually applied (ie. after rounding or clamping).
+		
+		Measurement results (parameters in cache_exclude and get_ functions in
+		cache_exclude_getters) are always read from the instrument, as are get_
+		functions taking arguments other than channel (ie. a port), because the
+		state only holds one value per parameter and channel. Cached values are invalidated by preset(), *RST/*RCL/SYST:PRES writes,
+		connect(), refresh_state(), and optionally by age.
+		
+		Parameters:
+			enable (bool): Turns the cache on or off.
+			ttl_s (float): Max age of a cached value in seconds. None for no limit.
+		
+		Returns:
+			None
+		'''
+		
+		self.cache_enabled = enable
+		self.cache_ttl_s = ttl_s
+		self.invalidate_cache()
+		self.debug(f"Settings cache >{'enabled' if enable else 'disabled'}< (TTL: {ttl_s} s).")
+	
+	def invalidate_cache(self):
+		''' Marks all cached settings as unknown, so the next get_ call for each
+		parameter queries the instrument. '''
+		
+		self.cache_valid = {}
+	
+	def cache_read(self, param:str, channel:int=None):
+		''' Returns a tuple (hit, value) for a parameter in the settings cache.'''
+		
+		t_valid = self.cache_valid.get((param, channel), None)
+		if t_valid is None:
+			return (False, None)
+		if (self.cache_ttl_s is not None) and (time.time() - t_valid > self.cache_ttl_s):
+			return (False, None)
+		
+		try:
+			if channel is None:
+				return (True, self.state[param])
+			else:
+				return (True, self.state[param][channel-1])
+		except Exception:
+			return (False, None)
+	
+	def cache_run(self, func:callable, args, kwargs, cacheable:bool=True, mark_current:bool=True):
+		''' Calls a get_ or set_ function while recording the first parameter it
+		passes to modify_state(), and marks that parameter as current (or as unknown
+		if mark_current is False). Calls made by nested get_ and set_ functions are
+		recorded by those functions instead. Returns the function's return value and
+		the recorded (param, channel, value) tuple, or None if nothing cacheable was
+		recorded. '''
+		
+		self.cache_records.append([])
+		try:
+			rv = func(self, *args, **kwargs)
+		finally:
+			record = self.cache_records.pop()
+		
+		if (not cacheable) or len(record) == 0 or (not self.online):
+			return rv, None
+		
+		# Only cache scalar settings
+		param, channel, value = record[0]
+		if (param in self.cache_exclude) or (not isinstance(value, (bool, int, float, str, np.generic))):
+			return rv, None
+		
+		if mark_current:
+			self.cache_valid[(param, channel)] = time.time()
+		else:
+			self.cache_valid.pop((param, channel), None)
+		
+		return rv, record[0]
 	
 	def query_id(self):
 		''' Checks the IDN of the instrument, and makes sure it matches up.'''
@@ -275,6 +731,7 @@ class Driver(ABC):
 		
 		# Query IDN model
 		self.id.idn_model = self.query("*IDN?").strip()
+		self.update_id_str()
 		
 		if self.id.idn_model is not None:
 			self.online = True
@@ -302,13 +759,31 @@ class Driver(ABC):
 			self.error(f"Cannot use default close() function, instrument does recognize SCPI commands.")
 			return
 		
-		self.inst.close()
+		# Return session to the pool (see VisaRegistry)
+		if self.session is not None:
+			visa_registry.release_session(self.session)
+			self.session = None
+		self.online = False
 	
-	def wait_ready(self, check_period:float=0.1, timeout_s:float=None):
-		''' Waits until all previous SCPI commands have completed. *CLS 
-		must have been sent prior to the commands in question.
+	def wait_ready(self, check_period:float=0.1, timeout_s:float=None, strategy:str=None):
+		''' Waits until all previous SCPI commands have completed. The strategies
+		listed in self.wait_strategies (WAIT_POLL unless the driver opts in to
+		others) are tried in order until one is supported. Only WAIT_OPC_QUERY
+		changes the instrument on timeout:
+			* WAIT_OPC_QUERY: Blocks on a *OPC? query. On timeout, the device is
+			cleared, which aborts the pending operation on most instruments (see
+			wait_opc_query()).
+			* WAIT_SRQ: Sends *OPC and waits for a service request event, checking
+			*ESR? every WAIT_SRQ_CHECK_PERIOD in case the request is missed. *CLS
+			must have been sent prior to the commands in question.
+			* WAIT_POLL: Sends *OPC and polls *ESR?, starting at WAIT_POLL_MIN_PERIOD
+			and backing off to check_period. *CLS must have been sent prior to the
+			commands in question.
 		
-		Set timeout to None for no timeout.
+		Parameters:
+			check_period (float): Max time between polls for WAIT_POLL (seconds).
+			timeout_s (float): Timeout in seconds. Set to None for no timeout.
+			strategy (str): Optional strategy to use instead of self.wait_strategies.
 		
 		Returns true if operation completed, returns False if timeout occured.'''
 		
@@ -317,47 +792,298 @@ class Driver(ABC):
 			self.error(f"Cannot use default wait_ready() function, instrument does recognize SCPI commands.")
 			return
 		
-		self.write(f"*OPC")
+		# Make sure batched commands have been sent
+		self.flush_batch()
+		
+		if strategy is None:
+			strategies = self.wait_strategies
+		else:
+			strategies = [strategy]
+		
+		# Try each strategy until one returns a result
+		for strat in strategies:
+			
+			if strat == WAIT_OPC_QUERY:
+				rv = self.wait_opc_query(timeout_s)
+			elif strat == WAIT_SRQ:
+				rv = self.wait_srq(timeout_s)
+			elif strat == WAIT_POLL:
+				rv = self.wait_poll(check_period, timeout_s)
+			else:
+				self.error(f"Unrecognized wait strategy >{strat}<.")
+				rv = None
+			
+			if rv is not None:
+				return rv
+			
+			self.debug(f"Wait strategy >{strat}< failed, trying next strategy.")
+		
+		self.error(f"Failed to wait for operation complete. No wait strategy succeeded.")
+		return False
+	
+	@sessionlocked
+	def wait_opc_query(self, timeout_s:float=None, clear_on_timeout:bool=True):
+		''' Waits for operation complete by blocking on a *OPC? query.
+		
+		Parameters:
+			timeout_s (float): Timeout in seconds. Set to None for no timeout.
+			clear_on_timeout (bool): If True, a device clear is sent on timeout so the
+				late reply to *OPC? is not returned by the next read. Note that on most
+				instruments the device clear also aborts the pending operation. If False,
+				the operation continues and the caller must read and discard the late
+				reply before the next query.
+		
+		Returns True if operation completed, False if timeout occured, or None if
+		the query failed.'''
+		
+		if not self.online:
+			self.warning(f"Cannot wait when offline. ()")
+			return None
+		
+		prev_timeout = self.inst.timeout
+		try:
+			self.inst.timeout = None if timeout_s is None else timeout_s*1e3
+			rv = self.inst.query("*OPC?")
+			if self.log_enabled(plf.LOWDEBUG):
+				self.lowdebug(f"Queried instrument, >*OPC?<, receiving >:a{rv}<.")
+		except pv.errors.VisaIOError as e:
+			if e.error_code == pv.constants.StatusCode.error_timeout:
+				
+				# Clear the device so the late reply does not end up in the next read
+				if clear_on_timeout:
+					try:
+						self.inst.clear()
+					except Exception:
+						pass
+				
+				self.debug(f"Timed out waiting for *OPC?.")
+				return False
+			self.debug(f"*OPC? query failed. ({e})")
+			return None
+		except Exception as e:
+			self.debug(f"*OPC? query failed. ({e})")
+			return None
+		finally:
+			try:
+				self.inst.timeout = prev_timeout
+			except Exception:
+				pass
+		
+		if rv.strip() != "1":
+			self.debug(f"Unexpected response to *OPC?: >:a{rv}<.")
+			return None
+		
+		return True
+	
+	@sessionlocked
+	def wait_srq(self, timeout_s:float=None):
+		''' Waits for operation complete by enabling a service request on the ESB bit,
+		sending *OPC, and waiting for the SRQ event. Any batched commands are sent
+		first. *ESR? is checked every WAIT_SRQ_CHECK_PERIOD, so a missed service
+		request does not block the caller forever.
+		
+		Returns True if operation completed, False if timeout occured, or None if
+		service requests are not supported.'''
 		
-		# Check ESR
-		esr_buffer = int(self.query(f"*ESR?"))
+		if not self.online:
+			self.warning(f"Cannot wait when offline. ()")
+			return None
+		
+		evt = pv.constants.EventType.service_request
+		mech = pv.constants.EventMechanism.queue
+		
+		try:
+			self.inst.enable_event(evt, mech)
+		except Exception as e:
+			self.debug(f"Service requests not supported. ({e})")
+			return None
+		
+		try:
+			
+			# Set SRQ on event status bit, which will be set by OPC. Sent directly so
+			# it is not held in a batch while waiting.
+			self.flush_batch()
+			self._write_inst("*ESE 1;*SRE 32;*OPC")
+			
+			t0 = time.time()
+			while True:
+				
+				# Wait for service request, at most WAIT_SRQ_CHECK_PERIOD at a time
+				wait_s = WAIT_SRQ_CHECK_PERIOD
+				if timeout_s is not None:
+					wait_s = max(0, min(wait_s, timeout_s - (time.time() - t0)))
+				resp = self.inst.wait_on_event(evt, int(wait_s*1e3), capture_timeout=True)
+				if not resp.timed_out:
+					break
+				
+				# Check event register in case the service request was missed
+				if int(self.query("*ESR?")) & 1:
+					self.inst.read_stb()
+					return True
+				
+				if (timeout_s is not None) and (time.time() - t0 >= timeout_s):
+					self.debug(f"Timed out waiting for service request.")
+					return False
+			
+			# Clear status byte and event register
+			self.inst.read_stb()
+			self.query("*ESR?")
+		
+		except Exception as e:
+			self.debug(f"Failed to wait on service request. ({e})")
+			return None
+		finally:
+			try:
+				self.inst.disable_event(evt, mech)
+			except Exception:
+				pass
+		
+		return True
+	
+	def wait_poll(self, check_period:float=0.1, timeout_s:float=None):
+		''' Waits for operation complete by sending *OPC and polling *ESR?. The poll
+		period starts at WAIT_POLL_MIN_PERIOD and doubles up to check_period, so short
+		operations return quickly without flooding the instrument for long ones.
+		
+		Returns True if operation completed, False if timeout occured, or None if
+		the ESR could not be read.'''
+		
+		self.flush_batch()
+		self._write_inst(f"*OPC")
 		
 		t0 = time.time()
+		period = min(WAIT_POLL_MIN_PERIOD, check_period)
 		
-		# Loop while ESR bit one is not set
-		while esr_buffer == 0:
+		# Loop until ESR OPC bit is set
+		while True:
 			
 			# Check register state
-			esr_buffer = int(self.query(f"*ESR?"))
+			try:
+				esr_buffer = int(self.query(f"*ESR?"))
+			except Exception as e:
+				self.debug(f"Failed to read ESR. ({e})")
+				return None
 			
-			# Wait prescribed time
-			time.sleep(check_period)
+			if esr_buffer & 1:
+				return True
 			
 			# Timeout handling
 			if (timeout_s is not None) and (time.time() - t0 >= timeout_s):
-				break
+				return False
+			
+			# Wait, then back off
+			time.sleep(period)
+			period = min(period*2, check_period)
+	
+	@contextmanager
+	def batch(self, max_len:int=None):
+		''' Context manager which collects all write() calls made inside the block and
+		sends them as ';'-joined SCPI messages instead of one VISA transaction per
+		command. Commands are flushed when the outermost batch block exits, when the
+		next command would exceed the maximum message length, or when a read or query
+		is made (pending commands are prepended to the query so they still arrive in
+		order and cost no extra round trip). Blocks may be nested.
 		
-		# Return
-		if esr_buffer > 0:
-			return True
-		else:
-			return False
+		Example:
+			with driver.batch():
+				driver.write("WAV:SOUR CHAN1")
+				driver.write("WAV:MODE NORM")
+		
+		Parameters:
+			max_len (int): Max number of characters in a single joined message. Defaults
+				to self.batch_max_len.
+		'''
+		
+		prev_max_len = self.batch_max_len
+		if max_len is not None:
+			self.batch_max_len = max_len
+		
+		self.batch_depth += 1
+		try:
+			yield self
+		finally:
+			self.batch_depth -= 1
+			self.batch_max_len = prev_max_len
+			
+			# Send anything still pending when the outermost block exits
+			if self.batch_depth == 0:
+				self.flush_batch()
+	
+	def _batch_join(self, cmds:list):
+		''' Joins a list of SCPI commands into a single message. Commands are made
+		absolute (prefixed with ':') so the header path of one command does not alter
+		the next.'''
+		
+		if len(cmds) == 1:
+			return cmds[0]
+		
+		return ";".join([c if c[:1] in (":", "*") else ":"+c for c in cmds])
+	
+	def _batch_take(self, cmd:str=None):
+		''' Removes and returns the pending batched commands as a single message. If
+		cmd is provided, it is appended to the message, unless doing so would exceed
+		the batch length limit, in which case the pending commands are flushed first
+		and cmd is returned unchanged.'''
+		
+		if len(self.batch_buffer) == 0:
+			return cmd
 		
+		if cmd is not None:
+			msg = self._batch_join(self.batch_buffer + [cmd.strip()])
+			if len(msg) <= self.batch_max_len:
+				self.batch_buffer = []
+				return msg
+			self.flush_batch()
+			return cmd
+		
+		msg = self._batch_join(self.batch_buffer)
+		self.batch_buffer = []
+		return msg
+	
+	def flush_batch(self):
+		''' Sends any commands collected by batch() which have not yet been sent.'''
+		
+		msg = self._batch_take()
+		if msg is None:
+			return
+		
+		self._write_inst(msg)
+	
 	def write(self, cmd:str):
-		''' Sends a SCPI command via PyVISA'''
+		''' Sends a SCPI command via PyVISA. If called inside a batch() block, the
+		command is queued and sent with the rest of the batch.'''
 		
 		# Abort if not an SCPI instrument
 		if not self.is_scpi:
 			self.error(f"Cannot use default write() function, instrument does recognize SCPI commands.")
 			return
 		
+		# Reset commands invalidate cached settings
+		if self.cache_enabled and any(rc in cmd.upper() for rc in SCPI_RESET_COMMANDS):
+			self.invalidate_cache()
+		
+		# Queue command if batching
+		if self.batch_depth > 0:
+			cmd = cmd.strip()
+			if len(self._batch_join(self.batch_buffer + [cmd])) > self.batch_max_len:
+				self.flush_batch()
+			self.batch_buffer.append(cmd)
+			return
+		
+		self._write_inst(cmd)
+	
+	def _write_inst(self, cmd:str):
+		''' Writes a message to the instrument, bypassing batching.'''
+		
 		if not self.online:
 			self.warning(f"Cannot write when offline. ()")
 			return
 			
 		try:
-			self.inst.write(cmd)
-			self.lowdebug(f"Wrote to instrument: >{cmd}<")
+			with self.inst_lock:
+				self.inst.write(cmd)
+			if self.log_enabled(plf.LOWDEBUG):
+				self.lowdebug(f"Wrote to instrument: >{cmd}<")
 		except Exception as e:
 			self.error(f"Failed to write to instrument {self.address}. ({e})")
 			self.online = False
@@ -372,12 +1098,17 @@ class Driver(ABC):
 			self.error(f"Cannot use default read() function, instrument does recognize SCPI commands.")
 			return
 		
+		# Make sure batched commands have been sent before reading
+		self.flush_batch()
+		
 		if not self.online:
 			self.warning(f"Cannot write when offline. ()")
 		
 		try:
-			rv = self.inst.read()
-			self.lowdebug(f"Read from instrument: >:a{rv}<")
+			with self.inst_lock:
+				rv = self.inst.read()
+			if self.log_enabled(plf.LOWDEBUG):
+				self.lowdebug(f"Read from instrument: >:a{rv}<")
 			return rv
 		except Exception as e:
 			self.error(f"Failed to read from instrument {self.address}. ({e})")
@@ -385,19 +1116,25 @@ class Driver(ABC):
 			return None
 	
 	def query(self, cmd:str):
-		''' Querys a command via PyVISA'''
+		''' Querys a command via PyVISA. If called inside a batch() block, pending
+		batched commands are sent in the same message as the query.'''
 		
 		# Abort if not an SCPI instrument
 		if not self.is_scpi:
 			self.error(f"Cannot use default query() function, instrument does recognize SCPI commands.")
 			return
 		
+		# Prepend pending batched commands
+		cmd = self._batch_take(cmd)
+		
 		if not self.online:
 			self.warning(f"Cannot write when offline. ()")
 		
 		try:
-			rv = self.inst.query(cmd)
-			self.lowdebug(f"Queried instrument, >{cmd}<, receiving >:a{rv}<.")
+			with self.inst_lock:
+				rv = self.inst.query(cmd)
+			if self.log_enabled(plf.LOWDEBUG):
+				self.lowdebug(f"Queried instrument, >{cmd}<, receiving >:a{rv}<.")
 		except Exception as e:
 			self.error(f"Failed to query instrument {self.address}. ({e})")
 			self.online = False
@@ -405,6 +1142,126 @@ class Driver(ABC):
 		
 		return rv
 	
+	@sessionlocked
+	def read_binary_block(self, dtype=np.float32, byteorder:str="<", cmd:str=None, expect_termination:bool=True, single_read:bool=False):
+		''' Reads an IEEE 488.2 definite-length binary block (#<n><len><data>) via
+		PyVISA and returns the payload as a NumPy array. The returned array is a view
+		of the bytes received from PyVISA when the payload arrives in one read, or of
+		a single preallocated buffer otherwise, so the payload is never copied
+		more than once and no per-element conversion takes place.
+		
+		Any response header sent before the block (ie. ':CURVE ') is skipped.
+		
+		Parameters:
+			dtype: NumPy datatype of each element in the block (ie. np.float32 for REAL,32
+				transfers or np.float64 for REAL,64 transfers).
+			byteorder (str): Byte order of the data sent by the instrument. '<' for
+				little-endian (LSB first), '>' for big-endian (MSB first).
+			cmd (str): Optional query to write before reading the block.
+			expect_termination (bool): If True, reads and discards the termination
+				character the instrument sends after the block.
+			single_read (bool): If True, reads the entire response in one VISA read. Use
+				for instruments which become unstable when the header and payload are
+				read separately.
+		
+		Returns:
+			np.ndarray viewing the payload, or None if an error occured.
+		'''
+		
+		# Abort if not an SCPI instrument
+		if not self.is_scpi:
+			self.error(f"Cannot use default read_binary_block() function, instrument does recognize SCPI commands.")
+			return None
+		
+		# Send query if requested, along with any pending batched commands
+		if cmd is not None:
+			self._write_inst(self._batch_take(cmd))
+		else:
+			self.flush_batch()
+		
+		if not self.online:
+			self.warning(f"Cannot read when offline. ()")
+		
+		dt = np.dtype(dtype).newbyteorder(byteorder)
+		
+		try:
+			
+			if single_read:
+				
+				# Read entire response, then locate header in received data
+				data_raw = self.inst.read_bytes(BINARY_BLOCK_MAX_READ_LEN, break_on_termchar=True)
+				hidx = data_raw.find(b'#')
+				if hidx < 0:
+					self.error(f"Failed to read binary block. No block header was found.")
+					return None
+				digits_in_size_num = int(data_raw[hidx+1:hidx+2])
+				packet_size = int(data_raw[hidx+2:hidx+2+digits_in_size_num])
+				payload_start = hidx+2+digits_in_size_num
+				
+				# View payload in received data, which usually holds the complete block
+				buffer = data_raw
+				num_read = max(0, min(len(data_raw)-payload_start, packet_size))
+			
+			else:
+				
+				# Skip any response header preceeding the '#'
+				byte = self.inst.read_bytes(1)
+				num_skipped = 0
+				while byte != b'#':
+					num_skipped += 1
+					if num_skipped > BINARY_BLOCK_MAX_HEADER_LEN:
+						self.error(f"Failed to read binary block. No block header was found.")
+						return None
+					byte = self.inst.read_bytes(1)
+				
+				# Get size of size of packet block (ie. convert #4 -> (int)4 )
+				digits_in_size_num = int(self.inst.read_bytes(1))
+				
+				# Read size of packet
+				packet_size = int(self.inst.read_bytes(digits_in_size_num))
+				payload_start = 0
+				
+				# Payloads which fit in one read are viewed in the received bytes
+				if packet_size <= BINARY_BLOCK_CHUNK_LEN:
+					buffer = self.inst.read_bytes(packet_size)
+					num_read = len(buffer)
+				else:
+					buffer = b""
+					num_read = 0
+			
+			# Read remainder of payload into one preallocated buffer
+			if num_read < packet_size:
+				received = memoryview(buffer)[payload_start:payload_start+num_read]
+				buffer = bytearray(packet_size)
+				buffer_view = memoryview(buffer)
+				buffer_view[:num_read] = received
+				payload_start = 0
+				while num_read < packet_size:
+					chunk = self.inst.read_bytes(min(packet_size-num_read, BINARY_BLOCK_CHUNK_LEN))
+					buffer_view[num_read:num_read+len(chunk)] = chunk
+					num_read += len(chunk)
+			
+			# Discard termination character
+			if expect_termination and not single_read:
+				self.inst.read_bytes(1)
+		
+		except ValueError as e:
+			self.error(f"Failed to read binary block. Could not interpret block header. ({e})")
+			return None
+		except Exception as e:
+			self.error(f"Failed to read binary block from instrument {self.address}. ({e})")
+			self.online = False
+			return None
+		
+		# Check packet size matches datatype
+		if packet_size % dt.itemsize != 0:
+			self.warning(f"Binary block size ({packet_size} bytes) is not a multiple of the element size ({dt.itemsize} bytes). Ignoring trailing bytes.")
+		
+		if self.log_enabled(plf.LOWDEBUG):
+			self.lowdebug(f"Read binary block from instrument, >:a{packet_size}< bytes.")
+		
+		return np.frombuffer(buffer, dtype=dt, count=packet_size//dt.itemsize, offset=payload_start)
+	
 	@abstractmethod
 	def refresh_state(self):
 		"""
@@ -465,11 +1322,11 @@ def s2hms(seconds):
 	return (hours, min, seconds)
 
 def plot_spectrum(spectrum:dict, marker='.', linestyle=':', color=(0, 0, 0.7), autoshow=True):
-	''' Plots a spectrum dictionary, as returned by the Spectrum Analyzer drivers.
+	''' Plots a spectrum dictionary or TraceData object, as returned by the Spectrum Analyzer drivers.
 	
 	Expects keys:
-		* x: X data list (float)
-		* y: Y data list (float)
+		* x: X data list or array (float)
+		* y: Y data list or array (float)
 		* x_units: Units of x-axis
 		* y_units: Units of y-axis
 	
@@ -628,4 +1485,156 @@ def dummyfunction(func):
 		# Call the source function (this should just be 'pass')
 		return func(self, *args, **kwargs)
 
+	return wrapper
+
+def batchfunction(func):
+	'''Decorator which runs a Driver method inside a Driver.batch() block, so all
+	writes made by the method are sent as a single SCPI message.'''
+	
+	@functools.wraps(func)
+	def wrapper(self, *args, **kwargs):
+		with self.batch():
+			return func(self, *args, **kwargs)
+	
+	return wrapper
+
+def cache_match(a, b):
+	''' Checks if two setting values are equal for the settings cache. Bools only
+	match bools, so ie. a channel number of 1 does not match an enable of True.'''
+	
+	if isinstance(a, (bool, np.bool_)) != isinstance(b, (bool, np.bool_)):
+		return False
+	try:
+		return bool(a == b)
+	except Exception:
+		return False
+
+def cached_getter(func):
+	''' Wraps a Driver get_ function so it is served from the settings cache when
+	the cache is enabled and the value is current.'''
+	
+	sig = inspect.signature(func)
+	
+	@functools.wraps(func)
+	def wrapper(self, *args, **kwargs):
+		
+		# Pass through if cache is disabled
+		if not getattr(self, 'cache_enabled', False):
+			return func(self, *args, **kwargs)
+		
+		# Measurement results are never cached, but are still run in their own
+		# record so settings they read are not cached against them
+		if func.__name__ in self.cache_exclude_getters:
+			return self.cache_run(func, args, kwargs, cacheable=False)[0]
+		
+		# Key on bound arguments so ie. get_x() and get_x(channel=1) are the same entry
+		try:
+			bound = sig.bind(self, *args, **kwargs)
+			bound.apply_defaults()
+			arguments = tuple(bound.arguments.items())[1:]
+			key = (func.__name__, arguments)
+			pc = self.cache_lookup.get(key, None)
+		except TypeError: # Unhashable or invalid arguments
+			return func(self, *args, **kwargs)
+		
+		# The state holds one value per parameter and channel, so ie. get_power(channel,
+		# port) can not be cached without returning one port's value for another.
+		if any(k != "channel" for k, v in arguments):
+			return self.cache_run(func, args, kwargs, cacheable=False)[0]
+		
+		# Return cached value if available
+		if pc is not None:
+			hit, val = self.cache_read(*pc)
+			if hit:
+				self.cache_hits += 1
+				return val
+		
+		self.cache_misses += 1
+		rv, record = self.cache_run(func, args, kwargs)
+		if record is not None:
+			self.cache_lookup[key] = record[:2]
+		return rv
+	
+	wrapper.cache_wrapped = True
+	return wrapper
+
+def cached_setter(func):
+	''' Wraps a Driver set_ function so it is skipped when the settings cache
+	shows the instrument already has the requested value. Values are only known
+	after being read back by a get_ call.'''
+	
+	sig = inspect.signature(func)
+	
+	@functools.wraps(func)
+	def wrapper(self, *args, **kwargs):
+		
+		# Pass through if cache is disabled
+		if not getattr(self, 'cache_enabled', False):
+			return func(self, *args, **kwargs)
+		
+		try:
+			bound = sig.bind(self, *args, **kwargs)
+			bound.apply_defaults()
+			arguments = dict(list(bound.arguments.items())[1:])
+		except TypeError:
+			return func(self, *args, **kwargs)
+		
+		# Skip command if value matches cache. The name of the argument holding the
+		# value is learned from the first call. Setters taking arguments other than
+		# channel (ie. a port) are never skipped, for the same reason as in cached_getter().
+		value_arg = self.cache_value_args.get(func.__name__, None)
+		if (value_arg is not None) and all(k in ("channel", value_arg) for k in arguments):
+			try:
+				key = (func.__name__, tuple((k, v) for k, v in arguments.items() if k != value_arg))
+				pc = self.cache_lookup.get(key, None)
+			except TypeError: # Unhashable arguments
+				return func(self, *args, **kwargs)
+			if pc is not None:
+				hit, val = self.cache_read(*pc)
+				if hit and cache_match(val, arguments[value_arg]):
+					self.cache_hits += 1
+					if self.log_enabled(plf.LOWDEBUG):
+						self.lowdebug(f"Skipped {func.__name__}(), value >:a{truncate_str(val)}< already set.")
+					return None
+		
+		# The instrument may round or clamp the value, so it is marked unknown and read
+		# back by the next get_ call rather than cached as written.
+		self.cache_misses += 1
+		rv, record = self.cache_run(func, args, kwargs, mark_current=False)
+		if record is None:
+			return rv
+		param, channel, value = record
+		
+		# Learn which argument contains the value (skipped if ambiguous)
+		if value_arg is None:
+			matches = [k for k, v in arguments.items() if cache_match(v, value)]
+			if len(matches) > 1:
+				matches = [k for k in matches if k != "channel"]
+			if len(matches) != 1:
+				return rv
+			value_arg = matches[0]
+			self.cache_value_args[func.__name__] = value_arg
+		
+		try:
+			key = (func.__name__, tuple((k, v) for k, v in arguments.items() if k != value_arg))
+			self.cache_lookup[key] = (param, channel)
+		except TypeError:
+			pass
+		
+		return rv
+	
+	wrapper.cache_wrapped = True
+	return wrapper
+
+def cache_invalidating(func):
+	''' Wraps a Driver function (ie. connect, preset, refresh_state) so that it
+	invalidates the settings cache before running.'''
+	
+	@functools.wraps(func)
+	def wrapper(self, *args, **kwargs):
+		if getattr(self, 'cache_enabled', False):
+			self.invalidate_cache()
+		return func(self, *args, **kwargs)
+	
+	wrapper.cache_wrapped = True
 	return wrapper
\ No newline at end of file
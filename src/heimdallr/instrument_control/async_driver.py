@@ -0,0 +1,132 @@
+''' asyncio interface for drivers, so acquisitions across many instruments can be
+awaited together from one event loop.
+'''
+
+from heimdallr.base import *
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+# Max number of threads in the executor shared by all AsyncDrivers
+ASYNC_DRIVER_MAX_WORKERS = 16
+
+# Executor shared by AsyncDrivers not given their own. Created on first use.
+async_driver_executor = None
+async_driver_executor_mtx = threading.Lock()
+
+def get_async_driver_executor():
+	''' Returns the executor shared by all AsyncDrivers, creating it if needed.'''
+	global async_driver_executor
+	
+	with async_driver_executor_mtx:
+		if async_driver_executor is None:
+			async_driver_executor = ThreadPoolExecutor(max_workers=ASYNC_DRIVER_MAX_WORKERS, thread_name_prefix="AsyncDriver")
+		return async_driver_executor
+
+def get_driver_async_lock(driver:Driver) -> asyncio.Lock:
+	''' Returns the asyncio.Lock for a driver in the running event loop, creating it
+	if needed. The lock is stored on the driver, so all AsyncDrivers wrapping it
+	share one lock.'''
+	
+	loop = asyncio.get_running_loop()
+	loop_lock = getattr(driver, 'async_lock', None)
+	if (loop_lock is None) or (loop_lock[0] is not loop):
+		loop_lock = (loop, asyncio.Lock())
+		driver.async_lock = loop_lock
+	return loop_lock[1]
+
+def call_locked(driver:Driver, func:callable, args, kwargs):
+	''' Calls a driver function while holding the driver's instrument lock.'''
+	
+	with driver.inst_lock:
+		return func(*args, **kwargs)
+
+class AsyncDriver:
+	''' Wraps a Driver of any category so each of its functions can be awaited. The
+	blocking call runs in a bounded thread pool. Calls to the same instrument are
+	serialized by the driver's instrument lock (Driver.inst_lock), which is also held
+	by synchronous code and other drivers sharing the VISA session, and calls to
+	different instruments run concurrently.
+	
+	Any function of the wrapped driver can be called as a coroutine, and attributes
+	which are not functions (ie. state, id) are returned directly.
+	
+	Example:
+		scope = AsyncDriver(RigolDS1000Z(...))
+		vna = AsyncDriver(RohdeSchwarzZVA(...))
+		wav, trace = await asyncio.gather(scope.get_waveform(1), vna.get_trace_data(1, 1))
+	'''
+	
+	def __init__(self, driver:Driver, executor:ThreadPoolExecutor=None):
+		
+		self.driver = driver
+		self.executor = executor
+	
+	async def call(self, func_name:str, *args, **kwargs):
+		''' Calls a function of the wrapped driver in the executor and returns its
+		result.
+		
+		Parameters:
+			func_name (str): Name of the driver function.
+			*args, **kwargs: Arguments for the driver function.
+		
+		Returns:
+			Return value of the driver function.
+		'''
+		
+		func = getattr(self.driver, func_name)
+		
+		executor = self.executor if self.executor is not None else get_async_driver_executor()
+		loop = asyncio.get_running_loop()
+		
+		# The asyncio lock keeps queued calls to one instrument from occupying executor
+		# threads. The instrument lock serializes with all other users of the driver.
+		async with get_driver_async_lock(self.driver):
+			return await loop.run_in_executor(executor, call_locked, self.driver, func, args, kwargs)
+	
+	async def write(self, cmd:str):
+		return await self.call("write", cmd)
+	
+	async def query(self, cmd:str):
+		return await self.call("query", cmd)
+	
+	async def read(self):
+		return await self.call("read")
+	
+	async def wait_ready(self, *args, **kwargs):
+		return await self.call("wait_ready", *args, **kwargs)
+	
+	async def refresh_state(self):
+		return await self.call("refresh_state")
+	
+	def __getattr__(self, name:str):
+		
+		attr = getattr(self.driver, name)
+		if not callable(attr):
+			return attr
+		
+		async def async_func(*args, **kwargs):
+			return await self.call(name, *args, **kwargs)
+		
+		async_func.__name__ = name
+		async_func.__doc__ = attr.__doc__
+		return async_func
+	
+	def __repr__(self):
+		return f"AsyncDriver({self.driver.id.short_str()})"
+
+async def gather_drivers(calls:list, return_exceptions:bool=False):
+	''' Runs a list of (AsyncDriver, function name, args, kwargs) tuples concurrently.
+	args and kwargs may be omitted.
+	
+	Returns:
+		List of results in the same order as calls.
+	'''
+	
+	coros = []
+	for c in calls:
+		adrv, func_name = c[0], c[1]
+		args = c[2] if len(c) > 2 else []
+		kwargs = c[3] if len(c) > 3 else {}
+		coros.append(adrv.call(func_name, *args, **kwargs))
+	
+	return await asyncio.gather(*coros, return_exceptions=return_exceptions)
@@ -15,8 +15,10 @@ class DigitalMultimeterCtg(Driver):
 	SEL_MEAS = "selected-meas[str]"
 	LAST_MEAS_DATA = "last-meas-value[num]"
 	
-	def __init__(self, address:str, log:plf.LogPile, expected_idn=""):
-		super().__init__(address, log, expected_idn=expected_idn)
+	cache_exclude = [LAST_MEAS_DATA]
+	
+	def __init__(self, address:str, log:plf.LogPile, expected_idn="", **kwargs):
+		super().__init__(address, log, expected_idn=expected_idn, **kwargs)
 		
 		self.state[DigitalMultimeterCtg.LOWPWR_MODE] = None
 		self.state[DigitalMultimeterCtg.SEL_MEAS] = None
@@ -49,7 +51,6 @@ class DigitalMultimeterCtg(Driver):
 		''' Returns the last measured value. Will be in units self.check_units. Will return None on error '''
 		pass
 	
-	@abstractmethod
 	def send_trigger_and_read(self):
 		''' Tells the instrument to read and returns teh measurement result. '''
 		
@@ -2,8 +2,8 @@ from heimdallr.base import *
 
 class LockInAmplifierCtg(Driver):
 	
-	def __init__(self, address:str, log:plf.LogPile, expected_idn="", is_scpi:bool=False):
-		super().__init__(address, log, expected_idn=expected_idn, is_scpi=is_scpi)
+	def __init__(self, address:str, log:plf.LogPile, expected_idn="", is_scpi:bool=False, **kwargs):
+		super().__init__(address, log, expected_idn=expected_idn, is_scpi=is_scpi, **kwargs)
 	
 	@abstractmethod
 	def set_offset(self, offset:float):
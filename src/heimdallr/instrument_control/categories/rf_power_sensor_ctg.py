@@ -5,8 +5,10 @@ class RFPowerSensor(Driver):
 	FREQ = "freq[Hz]"
 	LAST_DATA = "last-data[dBm]"
 	
-	def __init__(self, address:str, log:plf.LogPile, expected_idn=""):
-		super().__init__(address, log, expected_idn=expected_idn)
+	cache_exclude = [LAST_DATA]
+	
+	def __init__(self, address:str, log:plf.LogPile, expected_idn="", **kwargs):
+		super().__init__(address, log, expected_idn=expected_idn, **kwargs)
 	
 	@abstractmethod
 	def set_meas_frequency(self, f_Hz:float):
@@ -16,8 +16,8 @@ class SpectrumAnalyzerCtg(Driver):
 	REF_LEVEL = "ref-level[dBm]"
 	Y_DIV = "y-div[dB]"
 	
-	def __init__(self, address:str, log:plf.LogPile, expected_idn:str=""):
-		super().__init__(address, log, expected_idn=expected_idn)
+	def __init__(self, address:str, log:plf.LogPile, expected_idn:str="", **kwargs):
+		super().__init__(address, log, expected_idn=expected_idn, **kwargs)
 		
 		self.state[SpectrumAnalyzerCtg.FREQ_START] = None
 		self.state[SpectrumAnalyzerCtg.FREQ_END] = None
@@ -2,8 +2,8 @@ from heimdallr.base import *
 
 class PIDTemperatureControllerCtg(Driver):
 	
-	def __init__(self, address:str, log:plf.LogPile, expected_idn:str=""):
-		super().__init__(address, log, expected_idn=expected_idn)
+	def __init__(self, address:str, log:plf.LogPile, expected_idn:str="", **kwargs):
+		super().__init__(address, log, expected_idn=expected_idn, **kwargs)
 	
 	@abstractmethod
 	def set_setpoint(self, temp_K:float, channel:int=1):
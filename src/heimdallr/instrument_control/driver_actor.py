@@ -0,0 +1,168 @@
+''' Actor wrapper which gives a driver its own I/O thread, so one instrument can be
+shared safely by many threads.
+'''
+
+from heimdallr.base import *
+import queue
+from concurrent.futures import Future
+
+class DriverActor:
+	''' Owns a driver and a worker thread which executes every call to that driver,
+	in the order the calls were submitted. Any number of threads (GUI, logger,
+	sweep engine) can use the actor at once without interleaving commands, and
+	each instrument's actor runs in parallel with the others.
+	
+	Calling a driver function on the actor blocks until the worker thread has run
+	it and returns the result. submit() returns a concurrent.futures.Future
+	instead. Attributes which are not functions (ie. state, id) are read directly
+	from the driver.
+	
+	Example:
+		scope = DriverActor(RigolDS1000Z(...))
+		wav = scope.get_waveform(1) # Blocking
+		fut = scope.submit("get_waveform", 2) # Non-blocking
+	'''
+	
+	def __init__(self, driver:Driver, start:bool=True):
+		
+		self.driver = driver
+		self.cmd_queue = queue.Queue()
+		self.thread = None # Kept until the worker has exited, even after stop()
+		self.stopping = False # Stop has been queued for the current worker
+		self.mtx = threading.Lock()
+		
+		if start:
+			self.start()
+	
+	def start(self) -> bool:
+		''' Starts the worker thread. If a previous worker is still stopping, waits for
+		it to exit first so two workers never share the queue.
+		
+		Returns:
+			True if the worker is running, False if it could not be started.
+		'''
+		
+		while True:
+			
+			with self.mtx:
+				
+				if (self.thread is None) or (not self.thread.is_alive()):
+					self.stopping = False
+					self.thread = threading.Thread(target=self.run, name=f"DriverActor-{self.driver.address}", daemon=True)
+					self.thread.start()
+					return True
+				
+				if not self.stopping:
+					return True
+				
+				if threading.current_thread() is self.thread:
+					self.driver.error(f"DriverActor cannot be restarted from its own worker thread while stopping.")
+					return False
+				
+				prev_thread = self.thread
+			
+			# Wait outside the lock, as the stopping worker may still call stop()
+			prev_thread.join()
+	
+	def stop(self, wait:bool=True):
+		''' Stops the worker thread after all previously submitted calls finish.'''
+		
+		with self.mtx:
+			
+			if (self.thread is None) or (not self.thread.is_alive()):
+				return
+			
+			if not self.stopping:
+				self.stopping = True
+				self.cmd_queue.put(None)
+			
+			thread = self.thread
+		
+		if wait and (threading.current_thread() is not thread):
+			thread.join()
+	
+	def run(self):
+		''' Worker thread main loop.'''
+		
+		while True:
+			
+			item = self.cmd_queue.get()
+			if item is None:
+				break
+			
+			fut, func, args, kwargs = item
+			if not fut.set_running_or_notify_cancel():
+				continue
+			
+			try:
+				fut.set_result(func(*args, **kwargs))
+			except Exception as e:
+				self.driver.error(f"DriverActor call to {getattr(func, '__name__', func)}() raised an exception. ({e})")
+				fut.set_exception(e)
+	
+	def submit(self, func_name:str, *args, **kwargs) -> Future:
+		''' Queues a call to a driver function.
+		
+		Parameters:
+			func_name (str): Name of the driver function.
+			*args, **kwargs: Arguments for the driver function.
+		
+		Returns:
+			Future which resolves to the return value of the function.
+		'''
+		
+		return self.submit_func(getattr(self.driver, func_name), *args, **kwargs)
+	
+	def submit_func(self, func:callable, *args, **kwargs) -> Future:
+		''' Queues a call to any function (ie. one which uses the driver several times)
+		to run on the worker thread, in order with the other calls.
+		
+		Returns:
+			Future which resolves to the return value of the function.
+		'''
+		
+		fut = Future()
+		
+		# Calls made from the worker thread itself (ie. in a callback) run immediately,
+		# as queueing them would deadlock.
+		if threading.current_thread() is self.thread:
+			try:
+				fut.set_result(func(*args, **kwargs))
+			except Exception as e:
+				fut.set_exception(e)
+			return fut
+		
+		if (self.thread is None) or (not self.thread.is_alive()) or self.stopping:
+			self.driver.warning(f"DriverActor is not running. Call will not execute until start() is called.")
+		
+		self.cmd_queue.put((fut, func, args, kwargs))
+		return fut
+	
+	def call(self, func_name:str, *args, actor_timeout_s:float=None, **kwargs):
+		''' Calls a driver function on the worker thread and waits for the result.
+		Keyword arguments other than actor_timeout_s (including timeout_s) are passed
+		to the driver function.
+		
+		Returns:
+			Return value of the driver function. Raises TimeoutError if
+			actor_timeout_s passes first.
+		'''
+		
+		return self.submit(func_name, *args, **kwargs).result(timeout=actor_timeout_s)
+	
+	def __getattr__(self, name:str):
+		
+		attr = getattr(self.driver, name)
+		if not callable(attr):
+			return attr
+		
+		# All arguments go to the driver function, so none can be taken by call()
+		def actor_func(*args, **kwargs):
+			return self.submit(name, *args, **kwargs).result()
+		
+		actor_func.__name__ = name
+		actor_func.__doc__ = attr.__doc__
+		return actor_func
+	
+	def __repr__(self):
+		return f"DriverActor({self.driver.id.short_str()})"
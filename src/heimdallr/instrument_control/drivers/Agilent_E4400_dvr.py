@@ -8,8 +8,8 @@ from heimdallr.instrument_control.categories.rf_signal_generator_ctg import *
 
 class AgilentE4400(RFSignalGeneratorCtg):
 
-	def __init__(self, address:str, log:plf.LogPile):
-		super().__init__(address, log, expected_idn='Hewlett-Packard, ESG-4000B')
+	def __init__(self, address:str, log:plf.LogPile, **kwargs):
+		super().__init__(address, log, expected_idn='Hewlett-Packard, ESG-4000B', **kwargs)
 	
 	def set_power(self, p_dBm:float):
 		self.write(f":POW:LEV:IMM:AMPL {p_dBm} dBm")
@@ -16,8 +16,8 @@ class Keysight_33000X(Driver):
 	FILTER_OFF = "OFF"
 	FILTER_STEP = "STEP"
 	
-	def __init__(self, address:str, log:plf.LogPile):
-		super().__init__(address, log, expected_idn="Agilent Technologies,33")
+	def __init__(self, address:str, log:plf.LogPile, **kwargs):
+		super().__init__(address, log, expected_idn="Agilent Technologies,33", **kwargs)
 		
 		self.trace_lookup = {}
 	
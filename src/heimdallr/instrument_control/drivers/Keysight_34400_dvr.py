@@ -9,8 +9,8 @@ from heimdallr.instrument_control.categories.digital_multimeter_ctg import *
 
 class Keysight34400(DigitalMultimeterCtg):
 	
-	def __init__(self, address:str, log:plf.LogPile):
-		super().__init__(address, log, expected_idn="Keysight Technologies,344") 
+	def __init__(self, address:str, log:plf.LogPile, **kwargs):
+		super().__init__(address, log, expected_idn="Keysight Technologies,344", **kwargs) 
 		
 		# Unit to make sure is matched by returned string
 		self.check_units = ""
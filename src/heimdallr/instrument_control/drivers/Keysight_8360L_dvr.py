@@ -6,9 +6,9 @@ from heimdallr.instrument_control.categories.rf_signal_generator_ctg import *
 
 class Keysight8360L(RFSignalGeneratorCtg):
 
-	def __init__(self, address:str, log:plf.LogPile):
+	def __init__(self, address:str, log:plf.LogPile, **kwargs):
 		# Example: "HEWLETT-PACKARD,83650L,3844A00476,19 JAN 00\n"
-		super().__init__(address, log, expected_idn="HEWLETT-PACKARD,836")
+		super().__init__(address, log, expected_idn="HEWLETT-PACKARD,836", **kwargs)
 		
 	
 	def set_power(self, p_dBm:float):
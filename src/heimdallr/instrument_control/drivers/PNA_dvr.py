@@ -14,8 +14,8 @@ class KeysightPNAE8364B(VectorNetworkAnalyzerCtg):
 	SWEEP_SINGLE = "sweep-single"
 	SWEEP_OFF = "sweep-off"
 	
-	def __init__(self, address:str, log:plf.LogPile):
-		super().__init__(address, log)
+	def __init__(self, address:str, log:plf.LogPile, **kwargs):
+		super().__init__(address, log, **kwargs)
 		
 		self.trace_lookup = {}
 		
@@ -58,6 +58,7 @@ class KeysightPNAE8364B(VectorNetworkAnalyzerCtg):
 	def clear_traces(self):
 		self.write(f"CALC:PAR:DEL:ALL")
 	
+	@batchfunction
 	def add_trace(self, channel:int, trace:int, measurement:str):
 		
 		# Get measurement code
@@ -81,7 +82,15 @@ class KeysightPNAE8364B(VectorNetworkAnalyzerCtg):
 		# Create a trace and assoc. with measurement
 		self.write(f"DISP:WIND:TRAC{trace}:FEED '{trace_name}'")
 	
+	@batchfunction
 	def get_trace_data(self, channel:int, trace:int):
+		''' Returns the complex data of a trace.
+		
+		Returns:
+			np.ndarray of dtype '>c16' (big-endian complex128) viewing the data sent
+			by the instrument, or None if an error occured. Use .astype(np.complex128)
+			if native byte order is needed.
+		'''
 		
 		# Check that trace exists
 		if trace not in self.trace_lookup.keys():
@@ -96,8 +105,14 @@ class KeysightPNAE8364B(VectorNetworkAnalyzerCtg):
 		# Set data format
 		self.write(f"FORM:DATA REAL,64")
 		
-		# Query data
-		return self.query(f"CALC{channel}:DATA? SDATA")
+		# Query data - PNA sends MSB first unless FORM:BORD is changed
+		float_data = self.read_binary_block(np.float64, byteorder='>', cmd=f"CALC{channel}:DATA? SDATA")
+		if float_data is None:
+			self.log.error(f"Failed to read trace data.")
+			return None
+		
+		# Data is interleaved real and imaginary components, view as complex
+		return float_data[:2*(len(float_data)//2)].view(np.dtype('>c16'))
 		
 	def set_continuous_trigger(self, enable:bool):
 		self.write(f"INIT:CONT {bool_to_ONFOFF(enable)}")
@@ -48,10 +48,12 @@ class RigolDS1000Z(OscilloscopeCtg2):
 	
 	def get_waveform(self, channel:int):
 		
-		self.write(f"WAV:SOUR CHAN{channel}")  # Specify channel to read
-		self.write("WAV:MODE NORM")  # Specify to read data displayed on screen
-		self.write("WAV:FORM ASCII")  # Specify data format to ASCII
-		data = self.query("WAV:DATA?")  # Request data
+		# Configure and request data in a single message
+		with self.batch():
+			self.write(f"WAV:SOUR CHAN{channel}")  # Specify channel to read
+			self.write("WAV:MODE NORM")  # Specify to read data displayed on screen
+			self.write("WAV:FORM ASCII")  # Specify data format to ASCII
+			data = self.query("WAV:DATA?")  # Request data
 		
 		if data is None:
 			return {"time_s":[], "volt_V":[]}
@@ -61,9 +63,11 @@ class RigolDS1000Z(OscilloscopeCtg2):
 		
 		volts = [float(v) for v in volts]
 		
-		# Get timing data
-		xorigin = float(self.query("WAV:XOR?"))
-		xincr = float(self.query("WAV:XINC?"))
+		# Get timing data (both values returned in one response, separated by ';')
+		timing = self.query("WAV:XOR?;:WAV:XINC?")
+		if timing is None:
+			return {"time_s":[], "volt_V":[]}
+		xorigin, xincr = [float(v) for v in timing.strip().split(";")]
 		
 		# Get time values
 		t = list(xorigin + np.linspace(0, xincr * (len(volts) - 1), len(volts)))
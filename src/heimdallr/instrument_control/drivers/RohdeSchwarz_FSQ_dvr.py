@@ -5,14 +5,13 @@
 Manual: https://scdn.rohde-schwarz.com/ur/pws/dl_downloads/dl_common_library/dl_manuals/gb_1/f/fsq_1/FSQ_OperatingManual_en_02.pdf
 '''
 
-import array
 from heimdallr.base import *
 from heimdallr.instrument_control.categories.spectrum_analyzer_ctg import *
 
 class RohdeSchwarzFSQ(SpectrumAnalyzerCtg):
 	
-	def __init__(self, address:str, log:plf.LogPile):
-		super().__init__(address, log, expected_idn="Rohde&Schwarz,FSQ-") # Example 'Rohde&Schwarz,FSQ-26,200334/026,4.75\n'
+	def __init__(self, address:str, log:plf.LogPile, **kwargs):
+		super().__init__(address, log, expected_idn="Rohde&Schwarz,FSQ-", **kwargs) # Example 'Rohde&Schwarz,FSQ-26,200334/026,4.75\n'
 		
 		self.trace_lookup = {}
 	
@@ -34,8 +33,9 @@ class RohdeSchwarzFSQ(SpectrumAnalyzerCtg):
 			self.log.error(f"Did not apply command. Instrument limits values from -130 to 30 dBm and this range was violated.")
 			return
 		self.modify_state(self.get_ref_level, SpectrumAnalyzerCtg.REF_LEVEL, ref_dBm)
-		self.write(f"CALC:UNIT:POW dBm") # Set units to DBM (Next command refers to this unit)
-		self.write(f"DISP:WIND:TRAC:Y:RLEV {ref_dBm}")
+		with self.batch():
+			self.write(f"CALC:UNIT:POW dBm") # Set units to DBM (Next command refers to this unit)
+			self.write(f"DISP:WIND:TRAC:Y:RLEV {ref_dBm}")
 	def get_ref_level(self):
 		return self.modify_state(None, SpectrumAnalyzerCtg.REF_LEVEL, float(self.query("DISP:WIND:TRAC:Y:RLEV?")))
 	
@@ -71,11 +71,10 @@ class RohdeSchwarzFSQ(SpectrumAnalyzerCtg):
 		self.write(f"INIT:IMM")
 	
 	def get_trace_data(self, trace:int, use_ascii_transfer:bool=False, use_fast_binary:bool=True):
-		''' Returns the data of the trace in a standard waveform dict, which
-		
-		has keys:
-			* x: X data list (float)
-			* y: Y data list (float)
+		''' Returns the data of the trace as a TraceData object, which can be used
+		as a standard waveform dict with keys:
+			* x: X data (ndarray, float)
+			* y: Y data (ndarray, float)
 			* x_units: Units of x-axis
 			* y_units: UNits of y-axis
 		
@@ -108,48 +107,15 @@ class RohdeSchwarzFSQ(SpectrumAnalyzerCtg):
 			# Set data format - Real 32 binary data - in current Y unit
 			self.write(f"FORMAT:DATA REAL")
 			
-			if not use_fast_binary:
-			
-				# Read data - ask for data
-				self.write(f"TRACE:DATA? TRACE{trace}")
-				data_raw = bytearray()
-				while True:
-					try:
-						byte = self.inst.read_bytes(1)
-						data_raw += byte
-					except:
-						break
-				
-				# Skip first 6 bytes (number of elements) and last byte (newline)
-				float_data = list(array.array('f', data_raw[6:-1]))
-				
-			else:
-				
-				# Read data - ask for data
-				self.write(f"TRACE:DATA? TRACE{trace}")
-				data_raw = bytearray()
+			# Read data - ask for data. If fast binary is not used, the entire response
+			# is read in a single read rather than reading the block header first.
+			float_data = self.read_binary_block(np.float32, cmd=f"TRACE:DATA? TRACE{trace}", single_read=(not use_fast_binary))
+			if float_data is None:
+				self.log.error(f"Failed to read trace data.")
+				return None
 				
-				# Get size of size of packet block (ie. convert #4 -> (int)4 )
-				byte = self.inst.read_bytes(2)
-				data_raw += byte
-				digits_in_size_num = int(data_raw[1:2])
-				
-				# Read size of packet
-				byte = self.inst.read_bytes(digits_in_size_num)
-				data_raw += byte
-				packet_size = int(data_raw[2:2+digits_in_size_num])
-				
-				#Read entire packet
-				byte = self.inst.read_bytes(packet_size+1)
-				data_raw += byte
-				
-				# Skip first X bytes (number of elements) and last byte (newline)
-				float_data = list(array.array('f', data_raw[2+digits_in_size_num:-1]))
-				
-		# Generate time array
-		f_list = list(np.linspace(self.get_freq_start(), self.get_freq_end(), len(float_data)))
-		
-		out_data = {'x':f_list, 'y':float_data, 'x_units':'Hz', 'y_units':'dBm'}
+		# Frequency array is generated from the span when accessed
+		out_data = TraceData(float_data, x_units='Hz', y_units='dBm', x_start=self.get_freq_start(), x_stop=self.get_freq_end())
 		
 		self.modify_state(None, SpectrumAnalyzerCtg.TRACE_DATA, out_data, channel=trace)
 		
@@ -8,8 +8,12 @@ from heimdallr.instrument_control.categories.rf_power_sensor_ctg import *
 
 class RohdeSchwarzNRX(RFPowerSensor):
 	
-	def __init__(self, address:str, log:plf.LogPile):
-		super().__init__(address, log, expected_idn="Rohde&Schwarz,NRX") # Example string:  'Rohde&Schwarz,NRX,1424.7005k02/102854,02.40.20100501\n'
+	# NRX supports service requests, which avoids polling while measuring. Neither
+	# strategy clears the device on timeout, so a measurement is never aborted.
+	wait_strategies = [WAIT_SRQ, WAIT_POLL]
+	
+	def __init__(self, address:str, log:plf.LogPile, **kwargs):
+		super().__init__(address, log, expected_idn="Rohde&Schwarz,NRX", **kwargs) # Example string:  'Rohde&Schwarz,NRX,1424.7005k02/102854,02.40.20100501\n'
 		
 	def set_meas_frequency(self, f_Hz:float):
 		self.write(f"SENSE:FREQ:CW {f_Hz}")
@@ -6,9 +6,9 @@ from heimdallr.instrument_control.categories.rf_signal_generator_ctg import *
 
 class RohdeSchwarz_SGMA(RFSignalGeneratorCtg):
 
-	def __init__(self, address:str, log:plf.LogPile):
+	def __init__(self, address:str, log:plf.LogPile, **kwargs):
 		# Example: "HEWLETT-PACKARD,83650L,3844A00476,19 JAN 00\n"
-		super().__init__(address, log, expected_idn="Rohde&Schwarz,SGS100")	
+		super().__init__(address, log, expected_idn="Rohde&Schwarz,SGS100", **kwargs)	
 		
 	
 	def set_power(self, p_dBm:float):
@@ -5,12 +5,11 @@ Manual (Requires login and R&S approval): https://scdn.rohde-schwarz.com/ur/pws/
 
 from heimdallr.base import *
 from heimdallr.instrument_control.categories.vector_network_analyzer_ctg import *
-import array
 
 class RohdeSchwarzZVA(VectorNetworkAnalyzerCtg):
 	
-	def __init__(self, address:str, log:plf.LogPile):
-		super().__init__(address, log, expected_idn="Rohde&Schwarz,ZVA")
+	def __init__(self, address:str, log:plf.LogPile, **kwargs):
+		super().__init__(address, log, expected_idn="Rohde&Schwarz,ZVA", **kwargs)
 		
 		# This translates the string measurement codes defined the the VectorNetworkAnalyzerCtg class
 		# to strings that are understood by the specific instrument model (the ZVA).
@@ -120,11 +119,12 @@ class RohdeSchwarzZVA(VectorNetworkAnalyzerCtg):
 		self.write(f"SYSTEM:DISPLAY:UPDATE ONCE")
 	
 	def get_trace_data(self, channel:int, trace:int):
-		'''
+		''' Returns the data of the trace as a TraceData object, which can be used
+		as a standard waveform dict with keys:
 		
 		Channel Data:
-			* x: X data list, frequency (Hz) (float)
-			* y: Y data list,  (float)
+			* x: X data, frequency (Hz) (ndarray, float)
+			* y: Y data (ndarray, complex)
 			* x_units: Units of x-axis
 			* y_units: UNits of y-axis
 		'''
@@ -142,47 +142,32 @@ class RohdeSchwarzZVA(VectorNetworkAnalyzerCtg):
 		# Set data format - 64-bit real numbers
 		self.write(f"FORM:DATA REAL,64")
 		
-		# Request the trace data
-		self.write(f"CALC{channel}:DATA? SDATA")
-		
-		# Read the packet header first (size prefix)
-		header = self.inst.read_bytes(2)
-		digits_in_size_num = int(header[1:2])
-		
-		# Read the size of the data packet
-		size_bytes = self.inst.read_bytes(digits_in_size_num)
-		packet_size = int(size_bytes.decode())
-		
-		# print(f"packet size = {packet_size}")
-		
-		# Read the actual packet data
-		data_raw = self.inst.read_bytes(packet_size)
-		
-		# Convert the raw binary data to an array of floats
-		float_data = list(array.array('d', data_raw))  # 'd' ensures double precision floats
+		# Request and read the trace data
+		float_data = self.read_binary_block(np.float64, cmd=f"CALC{channel}:DATA? SDATA", expect_termination=False)
+		if float_data is None:
+			self.log.error(f"Failed to read trace data.")
+			return None
 		
 		# Get frequency range
 		f0 = self.get_freq_start()
 		fe = self.get_freq_end()
-		fnum = self.get_num_points()
-		freqs_Hz = list(np.linspace(f0, fe, fnum))
 		
-		real_vals = float_data[0::2]  # Extract real components
-		imag_vals = float_data[1::2]  # Extract imaginary components
-		complex_trace = np.array(real_vals) + 1j * np.array(imag_vals)
+		# Data is interleaved real and imaginary components, view as complex
+		complex_trace = float_data[:2*(len(float_data)//2)].view(np.complex128)
 		
 		#TODO: Determine what type of trace is being measured and correct units
 		y_data = complex_trace
 		y_unit = 'Reflection, complex, unitless'
 		
-		return {'x': freqs_Hz, 'y': y_data, 'x_units': 'Hz', 'y_units': y_unit}
+		return TraceData(y_data, x_units='Hz', y_units=y_unit, x_start=f0, x_stop=fe)
 	
 	def get_channel_data(self, channel:int):
-		'''
+		''' Returns the data of the channel as a TraceData object, which can be used
+		as a standard waveform dict with keys:
 		
 		Channel Data:
-			* x: X data list (float)
-			* y: Y data list (float)
+			* x: X data (ndarray, float)
+			* y: Y data (ndarray, complex)
 			* x_units: Units of x-axis
 			* y_units: UNits of y-axis
 		'''
@@ -208,15 +193,13 @@ class RohdeSchwarzZVA(VectorNetworkAnalyzerCtg):
 		imag_data = self.query(f"CALC{channel}:DATA? FDATA")
 		real_tokens = real_data.split(",")
 		imag_tokens = imag_data.split(",")
-		trace = [complex(float(re), float(im)) for re, im in zip(real_tokens, imag_tokens)]
+		trace = np.array(real_tokens, dtype=np.float64) + 1j*np.array(imag_tokens, dtype=np.float64)
 		
 		# Get frequency range
 		f0 = self.get_freq_start()
 		fe = self.get_freq_end()
-		fnum = self.get_num_points()
-		freqs_Hz = list(np.linspace(f0, fe, fnum))
 		
-		return {'x': freqs_Hz, 'y': trace, 'x_units': 'Hz', 'y_units': 'Reflection (complex), unitless'}
+		return TraceData(trace, x_units='Hz', y_units='Reflection (complex), unitless', x_start=f0, x_stop=fe)
 		
 		# # Query data
 		# return self.query(f"CALC{channel}:DATA? SDATA")
@@ -7,14 +7,13 @@ Manual: https://www.testworld.com/wp-content/uploads/user-guide-help-agilent-e83
 	    https://siglentna.com/wp-content/uploads/dlm_uploads/2017/10/SSA3000X_ProgrammingGuide_PG0703X_E04A.pdf
 '''
 
-import array
 from heimdallr.base import *
 from heimdallr.instrument_control.categories.spectrum_analyzer_ctg import *
 
 class SiglentSSA3000X(SpectrumAnalyzerCtg):
 	
-	def __init__(self, address:str, log:plf.LogPile):
-		super().__init__(address, log, expected_idn="Siglent Technologies,SSA30")
+	def __init__(self, address:str, log:plf.LogPile, **kwargs):
+		super().__init__(address, log, expected_idn="Siglent Technologies,SSA30", **kwargs)
 		
 		self.trace_lookup = {}
 	
@@ -68,11 +67,10 @@ class SiglentSSA3000X(SpectrumAnalyzerCtg):
 		self.write(f"INIT:IMM")
 	
 	def get_trace_data(self, trace:int, use_ascii_transfer:bool=False):
-		''' Returns the data of the trace in a standard waveform dict, which
-		
-		has keys:
-			* x: X data list (float)
-			* y: Y data list (float)
+		''' Returns the data of the trace as a TraceData object, which can be used
+		as a standard waveform dict with keys:
+			* x: X data (ndarray, float)
+			* y: Y data (ndarray, float)
 			* x_units: Units of x-axis
 			* y_units: UNits of y-axis
 		
@@ -102,23 +100,13 @@ class SiglentSSA3000X(SpectrumAnalyzerCtg):
 			self.write(f"FORMAT:TRACE:DATA REAL")
 			
 			# Read data - ask for data
-			self.write(f"TRACE:DATA? {trace}")
-			data_raw = []
-			while True:
-				try:
-					byte = self.inst.read_bytes(1)
-					data_raw.append(byte)
-				except:
-					break
-			data_raw = data_raw[0]
-			
-			# Skip first 4 bytes (number of elements) and last byte (newline)
-			float_data = list(array.array('f', data_raw[4:-1]))
-		
-		# Generate time array
-		f_list = list(np.linspace(self.get_freq_start(), self.get_freq_end(), len(float_data)))
+			float_data = self.read_binary_block(np.float32, cmd=f"TRACE:DATA? {trace}")
+			if float_data is None:
+				self.log.error(f"Failed to read trace data.")
+				return None
 		
-		out_data = {'x':f_list, 'y':float_data, 'x_units':'Hz', 'y_units':'dBm'}
+		# Frequency array is generated from the span when accessed
+		out_data = TraceData(float_data, x_units='Hz', y_units='dBm', x_start=self.get_freq_start(), x_stop=self.get_freq_end())
 		
 		self.modify_state(None, SpectrumAnalyzerCtg.TRACE_DATA, out_data, channel=trace)
 		
@@ -3,19 +3,14 @@
 
 '''
 
-import array
 from heimdallr.base import *
 from heimdallr.instrument_control.categories.spectrum_analyzer_ctg import *
-import struct
-
-# Max size of data packet to read
-TK_CSA_DRIVER_MAX_READ_LEN = 1073741824
 
 # TODO: Create CSA category
 class TektronixCSA8000(Driver):
 	
-	def __init__(self, address:str, log:plf.LogPile):
-		super().__init__(address, log, expected_idn="TEKTRONIX,CSA8")
+	def __init__(self, address:str, log:plf.LogPile, **kwargs):
+		super().__init__(address, log, expected_idn="TEKTRONIX,CSA8", **kwargs)
 	
 	def get_waveform(self,channel:int=1): 
 		'''  '''
@@ -40,37 +35,17 @@ class TektronixCSA8000(Driver):
 		#
 		
 		# Read data - ask for data
-		self.write(f"CURVE?")
-		data_raw = bytearray()
-		
+		#
 		# For this instrument, if I try to read in multiple commands it becomes
-		# unstable. If I read the entire packet in one go, it works. This tries
-		# to read 1 GB and aborts when a termination character is sent.
-		byte = self.inst.read_bytes(TK_CSA_DRIVER_MAX_READ_LEN, break_on_termchar=True)
-		data_raw += byte
-		
-		# Get size of size of packet block (ie. convert #4 -> (int)4 )
-		digits_in_size_num = int(data_raw[8:9])
-		print(f"digits in size num: {digits_in_size_num}")
-		
-		data_raw = byte
-		packet_size = int(data_raw[9:9+digits_in_size_num])
-		print(f"packet size: {packet_size}")
+		# unstable. If I read the entire packet in one go, it works. The CSA sends
+		# data in MSB order.
+		float_data = self.read_binary_block(np.float32, byteorder='>', cmd=f"CURVE?", single_read=True)
+		if float_data is None:
+			self.log.error(f"Failed to get waveform data: binary read failed.")
+			return None
+		num_points = len(float_data)
 		
-		self.log.debug(f"Binary fast waveform read: Expecting {packet_size} bytes for floats in packet.")
-		
-		# Instead of using array.array we have to use struct.unpack because the CSA sends
-		# data in MSB order, which is not what array.array expects.
-		#
-		# Skip first X bytes (number of elements)
-		num_points_f = packet_size/4
-		num_points = round(num_points_f)
-		if np.abs(num_points_f - num_points) > 0.01:
-			self.log.error(f"Binary read is broken!")
-		float_data = []
-		for nidx in range(num_points):
-			
-			float_data.append(struct.unpack('>f', data_raw[9+digits_in_size_num+4*nidx:13+digits_in_size_num+4*nidx]))
+		self.log.debug(f"Binary fast waveform read: Received {num_points} floats in packet.")
 		
 		# Try to get bounds
 		try:
@@ -81,10 +56,8 @@ class TektronixCSA8000(Driver):
 			self.log.error(f"Failed to get waveform data: interpreting waveform metadata failed.", detail=f"{e}")
 			return None
 		
-		# Make time array
-		time_s = np.linspace(x_zero, x_zero+(num_points-1)*x_step, num_points)
-		
-		out_data = {'x':time_s, 'y':float_data, 'x_units':'S', 'y_units':'Ohms'}
+		# Time array is generated from the origin and increment when accessed
+		out_data = TraceData(float_data, x_units='S', y_units='Ohms', x_origin=x_zero, x_increment=x_step)
 		
 		return out_data
 	
@@ -15,8 +15,8 @@ def bool_to_int(x:bool):
 
 class ZurichInstrumentsMFLI(LockInAmplifierCtg):
 	
-	def __init__(self, dev_sn:str, address:str, log:plf.LogPile):
-		super().__init__(address, log, is_scpi=False, expected_idn="MFLI")
+	def __init__(self, dev_sn:str, address:str, log:plf.LogPile, **kwargs):
+		super().__init__(address, log, is_scpi=False, expected_idn="MFLI", **kwargs)
 		
 		self.zhinst_params = None
 		self.dev_sn = dev_sn
@@ -33,6 +33,7 @@ class ZurichInstrumentsMFLI(LockInAmplifierCtg):
 				self.id.idn_model = self.zhinst_params['devicetype']
 			except:
 				self.id.idn_model = None
+			self.update_id_str()
 				
 			if check_id:
 				self.query_id()
@@ -0,0 +1,244 @@
+''' Tools for operating on many drivers at once, such as bringing up all the
+instruments on a station in parallel.
+'''
+
+from heimdallr.base import *
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import math
+
+# Result status codes
+FLEET_OK = "ok"
+FLEET_FAILED = "failed"
+FLEET_TIMEOUT = "timeout"
+
+class FleetResult:
+	''' Result of running one operation on one driver in a DriverFleet.'''
+	
+	def __init__(self, driver:Driver, operation:str):
+		self.driver = driver
+		self.operation = operation
+		
+		self.status = FLEET_TIMEOUT # One of FLEET_OK, FLEET_FAILED, FLEET_TIMEOUT
+		self.elapsed_s = None # Time taken by operation. None if timed out.
+		self.message = "" # Error or status details
+		self.rval = None # Value returned by the operation
+	
+	@property
+	def success(self):
+		return self.status == FLEET_OK
+	
+	def __str__(self):
+		t_str = "--" if self.elapsed_s is None else f"{self.elapsed_s*1e3:.1f} ms"
+		return f"{self.driver.address}: {self.operation} {self.status} ({t_str}) {self.message}"
+
+class DriverFleet:
+	''' Runs connect, *IDN? verification and refresh_state() across many drivers on a
+	thread pool, so the time taken is set by the slowest instrument rather than the
+	sum of all instruments. Drivers should be created with defer_connect=True so
+	they are not connected one at a time as they are constructed.
+	
+	Each operation has a deadline per instrument, measured from when the operation
+	starts on that instrument, so drivers queued behind max_workers get the full
+	deadline. Drivers which have not finished by their deadline are reported with
+	FLEET_TIMEOUT and marked offline. Their threads cannot be interrupted, so they
+	finish in the background (bounded by the VISA timeout), but their late results
+	are discarded. Operations still queued when the fleet deadline (the per-instrument
+	deadline times the number of rounds of workers) expires are cancelled.
+	'''
+	
+	def __init__(self, log:plf.LogPile, drivers:list=None, max_workers:int=16):
+		
+		self.log = log
+		self.drivers = []
+		self.max_workers = max_workers
+		
+		if drivers is not None:
+			for dvr in drivers:
+				self.add_driver(dvr)
+	
+	def add_driver(self, driver:Driver):
+		''' Adds a driver to the fleet.'''
+		
+		if driver in self.drivers:
+			self.log.warning(f"DriverFleet already contains driver {driver.id.short_str()}.")
+			return
+		
+		self.drivers.append(driver)
+	
+	def run_all(self, func:callable, operation:str, timeout_s:float=None) -> list:
+		''' Calls func(driver) for every driver in parallel.
+		
+		Parameters:
+			func (callable): Function accepting a driver. Should return a tuple
+				(success, message), optionally followed by a return value.
+			operation (str): Name of the operation, used in logs and results.
+			timeout_s (float): Deadline in seconds. None for no deadline.
+		
+		Returns:
+			List of FleetResult objects in the same order as self.drivers.
+		'''
+		
+		results = [FleetResult(dvr, operation) for dvr in self.drivers]
+		if len(self.drivers) == 0:
+			return results
+		
+		num_workers = min(self.max_workers, len(self.drivers))
+		mtx = threading.Lock()
+		t_start = [None]*len(results) # Time each operation started
+		expired = [False]*len(results) # Operation timed out, and its result is discarded
+		
+		def run_one(idx:int):
+			
+			with mtx:
+				if expired[idx]:
+					return
+				t_start[idx] = time.perf_counter()
+			
+			# Build result separately, so a late result can not change the one returned
+			res = FleetResult(results[idx].driver, operation)
+			try:
+				rv = func(res.driver)
+				res.status = FLEET_OK if rv[0] else FLEET_FAILED
+				res.message = rv[1]
+				if len(rv) > 2:
+					res.rval = rv[2]
+			except Exception as e:
+				res.status = FLEET_FAILED
+				res.message = f"{e}"
+			res.elapsed_s = time.perf_counter() - t_start[idx]
+			
+			with mtx:
+				if (timeout_s is not None) and (res.elapsed_s >= timeout_s):
+					expired[idx] = True
+				if expired[idx]:
+					res.driver.online = False
+					return
+				results[idx] = res
+		
+		# Start all operations. Executor is not used as a context manager, so the call
+		# returns at the deadline instead of waiting for threads which timed out.
+		t0 = time.perf_counter()
+		pool = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="DriverFleet")
+		futures = [pool.submit(run_one, idx) for idx in range(len(results))]
+		
+		# Wait until each operation finishes or passes its own deadline
+		pending = set(range(len(results)))
+		t_limit = None if timeout_s is None else t0 + timeout_s*math.ceil(len(results)/num_workers)
+		while len(pending) > 0:
+			
+			with mtx:
+				t_now = time.perf_counter()
+				for idx in list(pending):
+					if futures[idx].done():
+						pending.discard(idx)
+					elif (timeout_s is not None) and (t_start[idx] is not None) and (t_now - t_start[idx] >= timeout_s):
+						expired[idx] = True
+						pending.discard(idx)
+				
+				# Give up on operations which have not started by the fleet deadline
+				not_started = [idx for idx in pending if t_start[idx] is None]
+				if (t_limit is not None) and (t_now >= t_limit):
+					for idx in not_started:
+						expired[idx] = True
+						pending.discard(idx)
+					not_started = []
+				
+				# Next time an operation could expire
+				wait_s = None
+				if timeout_s is not None:
+					deadlines = [t_start[idx] + timeout_s for idx in pending if t_start[idx] is not None]
+					if len(not_started) > 0:
+						deadlines.append(t_limit)
+					if len(deadlines) > 0:
+						wait_s = max(0, min(deadlines) - t_now)
+			
+			if len(pending) == 0:
+				break
+			
+			wait([futures[idx] for idx in pending], timeout=wait_s, return_when=FIRST_COMPLETED)
+		
+		# Cancel operations which never started (shutdown(cancel_futures=True) needs Python 3.9)
+		for fut in futures:
+			fut.cancel()
+		pool.shutdown(wait=False)
+		
+		# Report results
+		for idx, res in enumerate(results):
+			if expired[idx]:
+				res.status = FLEET_TIMEOUT
+				res.message = f"No response within {timeout_s} s."
+				res.driver.online = False
+			
+			if res.success:
+				self.log.debug(f"DriverFleet: {res}")
+			else:
+				self.log.error(f"DriverFleet: {res}")
+		
+		num_ok = len([r for r in results if r.success])
+		self.log.info(f"DriverFleet: {operation} succeeded for >{num_ok}/{len(results)}< instruments in {(time.perf_counter()-t0)*1e3:.1f} ms.")
+		
+		return results
+	
+	def connect_all(self, check_id:bool=True, refresh:bool=False, timeout_s:float=10) -> list:
+		''' Connects all drivers in parallel.
+		
+		Parameters:
+			check_id (bool): Query *IDN? and verify it against each driver's expected
+				identifier.
+			refresh (bool): Call refresh_state() on each driver after connecting.
+			timeout_s (float): Deadline in seconds for each instrument.
+		
+		Returns:
+			List of FleetResult objects in the same order as self.drivers.
+		'''
+		
+		def connect_one(dvr:Driver):
+			
+			dvr.connect(check_id=check_id)
+			if not dvr.online:
+				return (False, "Failed to connect.")
+			
+			# Check hardware verification result
+			if check_id and (dvr.expected_idn is not None) and (dvr.expected_idn != "") and (not dvr.verified_hardware):
+				return (False, f"Hardware verification failed. Received: {dvr.id.idn_model}")
+			
+			if refresh:
+				dvr.refresh_state()
+				if not dvr.online:
+					return (False, "Connected, but refresh_state() failed.")
+			
+			return (True, f"{dvr.id.idn_model}")
+		
+		return self.run_all(connect_one, "connect", timeout_s=timeout_s)
+	
+	def refresh_all(self, timeout_s:float=10) -> list:
+		''' Calls refresh_state() on all drivers in parallel.
+		
+		Parameters:
+			timeout_s (float): Deadline in seconds for each instrument.
+		
+		Returns:
+			List of FleetResult objects in the same order as self.drivers.
+		'''
+		
+		def refresh_one(dvr:Driver):
+			
+			if not dvr.online:
+				return (False, "Instrument is offline.")
+			
+			dvr.refresh_state()
+			if not dvr.online:
+				return (False, "refresh_state() failed.")
+			
+			return (True, "", dvr.state)
+		
+		return self.run_all(refresh_one, "refresh", timeout_s=timeout_s)
+	
+	def close_all(self):
+		''' Closes all drivers.'''
+		
+		for dvr in self.drivers:
+			try:
+				dvr.close()
+			except Exception as e:
+				self.log.error(f"DriverFleet failed to close driver {dvr.id.short_str()}. ({e})")
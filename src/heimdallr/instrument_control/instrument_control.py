@@ -1,2 +1,5 @@
 from heimdallr.instrument_control.drivers.all_drivers import *
-from heimdallr.instrument_control.categories.all_ctgs import *
\ No newline at end of file
+from heimdallr.instrument_control.categories.all_ctgs import *
+from heimdallr.instrument_control.fleet import *
+from heimdallr.instrument_control.async_driver import *
+from heimdallr.instrument_control.driver_actor import *
\ No newline at end of file
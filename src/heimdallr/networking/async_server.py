@@ -0,0 +1,264 @@
+''' asyncio engine for the Heimdallr server. An alternative to pyfrost's server_main
+which serves every client from one event loop instead of one thread per client,
+so thousands of idle clients waiting in DL-LISTEN or TC-LISTEN cost no threads.
+
+Clients connect with the encrypted, length-prefixed JSON frames described in
+framing.py, for example with FramedClientAgent, and must log in with an account in
+the same user database as the pyfrost engine (DATABASE_LOCATION). This protocol is
+not pyfrost's, so existing HeimdallrClientAgent clients can not connect to this
+engine. Commands are executed by the same server_callback_send and
+server_callback_query functions as the pyfrost engine, except DL-LISTEN and
+TC-LISTEN, which wait on the client's queue with a coroutine.
+
+Example:
+	run_async_server("localhost", 5555)
+'''
+
+from heimdallr.networking.net_server import *
+from heimdallr.networking.framing import *
+import asyncio
+import sqlite3
+import hmac
+
+# Number of failed logins after which the connection is closed
+LOGIN_MAX_ATTEMPTS = 3
+
+# Query commands which wait with a coroutine instead of the blocking callback
+ASYNC_LISTEN_COMMANDS = ("DL-LISTEN", "TC-LISTEN")
+
+def check_login(db_path:str, username:str, password:str) -> str:
+	''' Checks a username and password against the user database.
+	
+	Parameters:
+		db_path (str): Path to the user database.
+		username (str): Username.
+		password (str): Password.
+	
+	Returns:
+		Account type of the user, or None if the login is not valid.
+	'''
+	
+	password_hash = hashlib.sha256(password.encode()).hexdigest()
+	
+	try:
+		with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
+			row = conn.execute("SELECT password, acct_type FROM userdata WHERE username = ?", (username,)).fetchone()
+	except sqlite3.Error as e:
+		serv_master.log.error(f"Failed to read user database {db_path}.", detail=f"{e}")
+		return None
+	
+	if (row is None) or (not hmac.compare_digest(row[0], password_hash)):
+		return None
+	return row[1]
+
+class AsyncServerAgent:
+	''' Stands in for pyfrost's ServerAgent for a client of the asyncio engine, so the
+	server callbacks can read sa.app_data and sa.log.'''
+	
+	def __init__(self, log:plf.LogPile, address:tuple):
+		self.log = log
+		self.address = address
+		self.app_data = {}
+		
+		self.username = None # Set once the client has logged in
+		self.acct_type = None
+
+class AsyncHeimdallrServer:
+	''' Heimdallr server running on an asyncio event loop.'''
+	
+	def __init__(self, host:str="localhost", port:int=5555, query_func:callable=server_callback_query, send_func:callable=server_callback_send, sa_init_func:callable=server_init_function, db_path:str=DATABASE_LOCATION, key:RSA.RsaKey=None):
+		
+		self.host = host
+		self.port = port
+		self.db_path = db_path
+		
+		# Server key. Generated on each start unless provided, in which case clients
+		# can pin its fingerprint.
+		self.key = key if key is not None else RSA.generate(FRAME_RSA_BITS)
+		self.key_decrypter = PKCS1_OAEP.new(self.key, hashAlgo=SHA256)
+		self.hello_frame = pack_frame({"protocol":FRAME_PROTOCOL, "public_key":self.key.public_key().export_key().decode()})
+		
+		self.query_func = query_func
+		self.send_func = send_func
+		self.sa_init_func = sa_init_func
+		
+		self.log = serv_master.log
+		self.server = None
+		
+		self.num_clients = 0 # Number of connected clients
+		self.max_frame_len = FRAME_MAX_LEN
+	
+	async def start(self) -> bool:
+		''' Starts listening for clients. Returns True if successful.'''
+		
+		try:
+			self.server = await asyncio.start_server(self.handle_client, self.host, self.port, backlog=4096)
+		except OSError as e:
+			self.log.critical(f"Failed to start asyncio server on {self.host}:{self.port}.", detail=f"{e}")
+			return False
+		
+		self.port = self.server.sockets[0].getsockname()[1]
+		self.log.info(f"asyncio server listening on {self.host}:{self.port}.", detail=f"Key fingerprint: {key_fingerprint(self.key)}")
+		return True
+	
+	async def serve_forever(self):
+		''' Starts the server (if not started) and serves clients until cancelled.'''
+		
+		if self.server is None:
+			if not await self.start():
+				return
+		
+		async with self.server:
+			await self.server.serve_forever()
+	
+	async def stop(self):
+		''' Stops accepting clients.'''
+		
+		if self.server is not None:
+			self.server.close()
+			await self.server.wait_closed()
+			self.server = None
+	
+	async def handle_client(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+		''' Serves one client until it disconnects.'''
+		
+		addr = writer.get_extra_info('peername')
+		sa = self.sa_init_func(AsyncServerAgent(self.log, addr))
+		self.num_clients += 1
+		self.log.debug(f"Accepted client from {addr}.")
+		
+		try:
+			cipher = await self.handshake(reader, writer)
+			if cipher is None:
+				return
+			
+			if not await self.login(sa, cipher, reader, writer):
+				return
+			
+			while True:
+				
+				# Read frame
+				msg = cipher.open(await read_frame_async(reader, self.max_frame_len))
+				
+				# Execute and reply
+				reply = await self.execute(sa, msg)
+				writer.write(cipher.seal(reply))
+				await writer.drain()
+		
+		except (asyncio.IncompleteReadError, ConnectionError):
+			pass
+		except Exception as e:
+			self.log.error(f"asyncio server closed connection to {addr} after an error.", detail=f"{e}")
+		finally:
+			self.num_clients -= 1
+			self.log.debug(f"Client {addr} disconnected.")
+			writer.close()
+	
+	async def handshake(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> FrameCipher:
+		''' Sends the server key and receives the client's session key.
+		
+		Returns:
+			FrameCipher for the session, or None if the handshake failed.
+		'''
+		
+		addr = writer.get_extra_info('peername')
+		
+		writer.write(self.hello_frame)
+		await writer.drain()
+		
+		try:
+			msg = unpack_frame(await asyncio.wait_for(read_frame_async(reader, FRAME_HANDSHAKE_MAX_LEN), FRAME_HANDSHAKE_TIMEOUT_S))
+			
+			# RSA takes milliseconds, so runs in a thread to not stall other clients
+			session_key = await asyncio.get_running_loop().run_in_executor(None, self.key_decrypter.decrypt, base64.b64decode(msg['session_key']))
+		except (asyncio.TimeoutError, ValueError, KeyError, TypeError) as e:
+			self.log.warning(f"Client {addr} failed the handshake.", detail=f"{e}")
+			return None
+		
+		if len(session_key) != FRAME_KEY_LEN:
+			self.log.warning(f"Client {addr} sent a session key of the wrong length.")
+			return None
+		
+		return FrameCipher(session_key, server=True)
+	
+	async def login(self, sa:AsyncServerAgent, cipher:FrameCipher, reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> bool:
+		''' Waits for the client to log in. Any other command before login is refused
+		and closes the connection.
+		
+		Returns:
+			True if the client logged in.
+		'''
+		
+		for attempt in range(LOGIN_MAX_ATTEMPTS):
+			
+			try:
+				msg = cipher.open(await asyncio.wait_for(read_frame_async(reader, FRAME_HANDSHAKE_MAX_LEN), FRAME_HANDSHAKE_TIMEOUT_S))
+			except (asyncio.TimeoutError, ValueError) as e:
+				self.log.warning(f"Client {sa.address} did not log in.", detail=f"{e}")
+				return False
+			
+			if msg.get('type', None) != FRAME_LOGIN:
+				self.log.warning(f"Client {sa.address} sent command {msg.get('command', None)} before logging in. Closing connection.")
+				writer.write(cipher.seal({"status":False, "data":None, "metadata":{}, "error":"Not logged in."}))
+				await writer.drain()
+				return False
+			
+			username = f"{msg.get('username', '')}"
+			acct_type = await asyncio.get_running_loop().run_in_executor(None, check_login, self.db_path, username, f"{msg.get('password', '')}")
+			
+			if acct_type is not None:
+				sa.username = username
+				sa.acct_type = acct_type
+				self.log.info(f"Client {sa.address} logged in as user >{username}<.")
+			else:
+				self.log.warning(f"Client {sa.address} failed to log in as user >{username}<.")
+			
+			writer.write(cipher.seal({"status":acct_type is not None, "acct_type":acct_type}))
+			await writer.drain()
+			
+			if acct_type is not None:
+				return True
+		
+		self.log.warning(f"Client {sa.address} exceeded {LOGIN_MAX_ATTEMPTS} login attempts. Closing connection.")
+		return False
+	
+	async def execute(self, sa:AsyncServerAgent, msg:dict) -> dict:
+		''' Executes a GenCommand received from a client and returns the reply frame.'''
+		
+		gc = GenCommand(msg.get('command', ""), msg.get('data', {}))
+		
+		if msg.get('type', None) == FRAME_QUERY:
+			
+			if gc.command in ASYNC_LISTEN_COMMANDS:
+				gd = await self.listen(sa, gc)
+			else:
+				gd = self.query_func(sa, gc)
+			
+			if gd is None:
+				return {"data":None, "metadata":{}}
+			return {"data":gd.data, "metadata":gd.metadata}
+		
+		return {"status":self.send_func(sa, gc)}
+	
+	async def listen(self, sa:AsyncServerAgent, gc:GenCommand) -> GenData:
+		''' Executes DL-LISTEN or TC-LISTEN, waiting for the client's queue without
+		blocking the event loop.'''
+		
+		client_id = sa.app_data[CLIENT_ID]
+		serv_master.touch_client(client_id)
+		serv_master.stats.count(gc.command)
+		
+		timeout_s, t_check_s, max_bytes = serv_master.listen_options(gc)
+		items = await serv_master.listen_queue(gc, client_id).async_take_all(timeout_s, max_bytes)
+		
+		return serv_master.listen_reply(gc, items)
+
+def run_async_server(host:str="localhost", port:int=5555, **kwargs):
+	''' Runs the asyncio server until interrupted. Keyword arguments are passed to
+	AsyncHeimdallrServer.'''
+	
+	server = AsyncHeimdallrServer(host, port, **kwargs)
+	try:
+		asyncio.run(server.serve_forever())
+	except KeyboardInterrupt:
+		pass
@@ -0,0 +1,253 @@
+''' Direct peer-to-peer transfer of large return values. A driver/listener client
+runs a BulkServer and registers its address with the Heimdallr server (REG-BULK).
+Large return values are then replied to with a small ticket instead of the data,
+and the calling client fetches the data straight from the BulkServer, so bulk
+data does not pass through the Heimdallr server.
+'''
+
+from heimdallr.networking.codec import *
+import socket
+import secrets
+import struct
+
+# Marker key for a return value held by a BulkServer. Value is the ticket dict.
+BULK_KEY = "__bulk__"
+
+# Return values (ndarray bytes) larger than this are sent directly if possible
+BULK_DEFAULT_THRESHOLD = 1048576
+
+# Time (seconds) a ticket may wait to be fetched before its data is discarded
+BULK_TICKET_TTL_S = 60
+
+# Timeout (seconds) for connecting to a BulkServer and for each socket operation
+BULK_SOCKET_TIMEOUT_S = 10
+
+# Max length of the ticket line sent by the fetching client
+BULK_MAX_TICKET_LEN = 128
+
+# Length prefix of each block sent by a BulkServer
+BULK_LEN = struct.Struct("!Q")
+
+def recv_exact(sock:socket.socket, buf) -> bool:
+	''' Receives exactly len(buf) bytes into buf (a writable buffer). Returns False
+	if the connection closed first.'''
+	
+	view = memoryview(buf).cast('B')
+	offset = 0
+	while offset < len(view):
+		n = sock.recv_into(view[offset:])
+		if n == 0:
+			return False
+		offset += n
+	return True
+
+def encode_bulk(val) -> tuple:
+	''' Splits an ndarray (or TraceData) into a JSON header and its raw bytes, so it
+	can be sent without base64 encoding.
+	
+	Returns:
+		Tuple (header bytes, raw data memoryview), or None if the value is not a
+		numeric ndarray or TraceData.
+	'''
+	
+	arr = stream_array(val)
+	if arr is None:
+		return None
+	
+	arr = np.ascontiguousarray(arr)
+	template = encode_tracedata(val, include_y=False) if isinstance(val, TraceData) else None
+	header = {"dtype":arr.dtype.str, "shape":list(arr.shape), "template":template}
+	
+	return (json.dumps(header).encode(), memoryview(arr).cast('B'))
+
+class BulkServer:
+	''' TCP server run by a driver/listener client which holds large return values
+	until the calling client fetches them. Each value is stored under a random,
+	single-use ticket which expires after BULK_TICKET_TTL_S.
+	
+	Protocol: the client sends the ticket followed by a newline. The server replies
+	with a length-prefixed JSON header and length-prefixed raw data, and closes the
+	connection. Unknown tickets receive a zero-length header.
+	'''
+	
+	def __init__(self, log:plf.LogPile, host:str="0.0.0.0", port:int=0, advertise_host:str=None):
+		
+		self.log = log
+		self.host = host
+		self.port = port # Set to the bound port by start() if 0
+		
+		# Address other clients should connect to
+		if advertise_host is None:
+			advertise_host = host if host not in ("", "0.0.0.0") else (HostID().ip_address or "127.0.0.1")
+		self.advertise_host = advertise_host
+		
+		self.ticket_ttl_s = BULK_TICKET_TTL_S
+		
+		self.mtx = threading.Lock()
+		self.tickets = {} # key = ticket, value = (header bytes, data memoryview, expiry time.monotonic())
+		
+		self.sock = None
+		self.thread = None
+		self.running = False
+		
+		self.num_served = 0
+		self.bytes_served = 0
+	
+	def start(self) -> bool:
+		''' Opens the listening socket and starts the accept thread. Returns True if
+		successful.'''
+		
+		if self.running:
+			return True
+		
+		try:
+			self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			self.sock.bind((self.host, self.port))
+			self.sock.listen()
+			self.port = self.sock.getsockname()[1]
+		except Exception as e:
+			self.log.error(f"Failed to start BulkServer on {self.host}:{self.port}.", detail=f"{e}")
+			self.sock = None
+			return False
+		
+		self.running = True
+		self.thread = threading.Thread(target=self.run, name="BulkServer", daemon=True)
+		self.thread.start()
+		
+		self.log.info(f"BulkServer listening on {self.host}:{self.port} (advertised as {self.advertise_host}:{self.port}).")
+		return True
+	
+	def stop(self):
+		''' Closes the listening socket and discards all tickets.'''
+		
+		self.running = False
+		if self.sock is not None:
+			try:
+				self.sock.close()
+			except Exception:
+				pass
+			self.sock = None
+		
+		with self.mtx:
+			self.tickets = {}
+	
+	def offer(self, val) -> dict:
+		''' Stores a value until it is fetched.
+		
+		Returns:
+			Ticket dictionary with keys 'ticket' and 'nbytes', or None if the value
+			can not be sent directly.
+		'''
+		
+		enc = encode_bulk(val)
+		if enc is None:
+			return None
+		
+		ticket = secrets.token_hex(16)
+		t_now = time.monotonic()
+		with self.mtx:
+			
+			# Discard expired tickets
+			for tk in [tk for tk, it in self.tickets.items() if it[2] < t_now]:
+				del self.tickets[tk]
+				self.log.warning(f"BulkServer discarded expired ticket.")
+			
+			self.tickets[ticket] = (enc[0], enc[1], t_now + self.ticket_ttl_s)
+		
+		return {"ticket":ticket, "nbytes":len(enc[1])}
+	
+	def run(self):
+		''' Accept thread main loop. Each connection is served on its own thread, so
+		several clients can fetch at once.'''
+		
+		while self.running:
+			try:
+				conn, addr = self.sock.accept()
+			except Exception:
+				if self.running:
+					self.log.error(f"BulkServer failed to accept connection.")
+				break
+			
+			threading.Thread(target=self.serve, args=(conn,), name="BulkServerConn", daemon=True).start()
+	
+	def serve(self, conn:socket.socket):
+		''' Sends the value for the ticket received on a connection.'''
+		
+		try:
+			conn.settimeout(BULK_SOCKET_TIMEOUT_S)
+			
+			# Read ticket line
+			line = b""
+			while not line.endswith(b"\n"):
+				part = conn.recv(BULK_MAX_TICKET_LEN)
+				if len(part) == 0 or len(line) + len(part) > BULK_MAX_TICKET_LEN:
+					return
+				line += part
+			
+			with self.mtx:
+				item = self.tickets.pop(line.strip().decode(), None)
+			
+			# Tickets are only purged by offer(), so check expiry here as well
+			if (item is not None) and (item[2] < time.monotonic()):
+				item = None
+			
+			if item is None:
+				self.log.warning(f"BulkServer received unknown or expired ticket.")
+				conn.sendall(BULK_LEN.pack(0))
+				return
+			
+			header, data = item[0], item[1]
+			conn.sendall(BULK_LEN.pack(len(header)) + header + BULK_LEN.pack(len(data)))
+			conn.sendall(data)
+			
+			with self.mtx:
+				self.num_served += 1
+				self.bytes_served += len(data)
+		
+		except Exception as e:
+			self.log.error(f"BulkServer failed to send value.", detail=f"{e}")
+		finally:
+			conn.close()
+
+def fetch_bulk(host:str, port:int, ticket:dict):
+	''' Fetches a value from a BulkServer. The data is received straight into the
+	result array.
+	
+	Returns:
+		The value (ndarray or TraceData). Raises ConnectionError if the value could
+		not be fetched.
+	'''
+	
+	try:
+		with socket.create_connection((host, port), timeout=BULK_SOCKET_TIMEOUT_S) as sock:
+			
+			sock.sendall(ticket['ticket'].encode() + b"\n")
+			
+			# Read header
+			nbuf = bytearray(BULK_LEN.size)
+			if not recv_exact(sock, nbuf):
+				raise ConnectionError("Connection closed before header was received.")
+			hlen = BULK_LEN.unpack(nbuf)[0]
+			if hlen == 0:
+				raise ConnectionError("BulkServer did not recognize ticket.")
+			hbuf = bytearray(hlen)
+			if not recv_exact(sock, hbuf):
+				raise ConnectionError("Connection closed before header was received.")
+			header = json.loads(hbuf.decode())
+			
+			# Read data into array
+			if not recv_exact(sock, nbuf):
+				raise ConnectionError("Connection closed before data was received.")
+			arr = np.empty(header['shape'], dtype=np.dtype(header['dtype']))
+			if BULK_LEN.unpack(nbuf)[0] != arr.nbytes:
+				raise ConnectionError("Size of data does not match header.")
+			if not recv_exact(sock, arr):
+				raise ConnectionError("Connection closed before all data was received.")
+	
+	except (OSError, ValueError, KeyError) as e:
+		raise ConnectionError(f"Failed to fetch bulk data from {host}:{port}. ({e})")
+	
+	if header['template'] is not None:
+		return decode_tracedata(header['template'], y=arr)
+	return arr
@@ -0,0 +1,365 @@
+''' Typed encoding of values passed over the Heimdallr network (remote call
+arguments and return values). NumPy arrays are sent as dtype, shape and raw bytes
+so they round-trip exactly (including complex data), rather than being stringified
+by the generic Packable serialization.
+'''
+
+from heimdallr.base import *
+import base64
+import zlib
+import json
+
+try:
+	import lz4.frame as lz4_frame
+except ImportError:
+	lz4_frame = None
+
+# Marker keys for encoded values. Dictionaries containing these keys are decoded
+# back into the original type.
+NDARRAY_KEY = "__ndarray__"
+TRACEDATA_KEY = "__tracedata__"
+COMPLEX_KEY = "__complex__"
+COMPRESSED_KEY = "__compressed__"
+
+# Compression codecs. lz4 requires the optional lz4 package.
+COMPRESS_NONE = "none"
+COMPRESS_ZLIB = "zlib"
+COMPRESS_LZ4 = "lz4"
+
+COMPRESS_ZLIB_LEVEL = 1 # Favors speed, numeric traces compress nearly as well as at higher levels
+COMPRESS_DEFAULT_THRESHOLD = 65536 # Payloads smaller than this (bytes) are not compressed
+
+# Chunked streaming of large values
+STREAM_CHUNK_SIZE = 1048576 # Size of each chunk in bytes (before compression and base64)
+STREAM_NDARRAY = "ndarray" # Chunks are slices of an ndarray's raw bytes
+STREAM_JSON = "json" # Chunks are slices of the value packed as JSON
+
+def available_codecs() -> list:
+	''' Returns the compression codecs supported on this host, in order of preference.'''
+	
+	if lz4_frame is not None:
+		return [COMPRESS_LZ4, COMPRESS_ZLIB, COMPRESS_NONE]
+	return [COMPRESS_ZLIB, COMPRESS_NONE]
+
+class CompressionStats:
+	''' Thread-safe counters for payload compression.'''
+	
+	def __init__(self):
+		self.mtx = threading.Lock()
+		self.num_compressed = 0
+		self.num_decompressed = 0
+		self.bytes_raw = 0 # Size of compressed payloads before compression
+		self.bytes_compressed = 0 # Size of compressed payloads after compression
+		self.compress_time_s = 0
+		self.decompress_time_s = 0
+	
+	def record_compress(self, num_raw:int, num_compressed:int, t_s:float):
+		with self.mtx:
+			self.num_compressed += 1
+			self.bytes_raw += num_raw
+			self.bytes_compressed += num_compressed
+			self.compress_time_s += t_s
+	
+	def record_decompress(self, t_s:float):
+		with self.mtx:
+			self.num_decompressed += 1
+			self.decompress_time_s += t_s
+	
+	def summary(self) -> dict:
+		''' Returns a dictionary of the counters, and the overall compression ratio
+		(raw size/compressed size).'''
+		
+		with self.mtx:
+			ratio = self.bytes_raw/self.bytes_compressed if self.bytes_compressed > 0 else None
+			return {"num_compressed":self.num_compressed, "num_decompressed":self.num_decompressed, "bytes_raw":self.bytes_raw, "bytes_compressed":self.bytes_compressed, "ratio":ratio, "compress_time_s":self.compress_time_s, "decompress_time_s":self.decompress_time_s}
+
+def compress_bytes(data:bytes, codec:str, stats:CompressionStats=None) -> bytes:
+	''' Compresses data with the specified codec.'''
+	
+	t0 = time.perf_counter()
+	if codec == COMPRESS_ZLIB:
+		out = zlib.compress(data, COMPRESS_ZLIB_LEVEL)
+	elif codec == COMPRESS_LZ4:
+		if lz4_frame is None:
+			raise ValueError("lz4 compression requested but the lz4 package is not installed.")
+		out = lz4_frame.compress(data)
+	else:
+		raise ValueError(f"Unrecognized compression codec '{codec}'.")
+	
+	if stats is not None:
+		stats.record_compress(len(data), len(out), time.perf_counter()-t0)
+	return out
+
+def decompress_bytes(data:bytes, codec:str, stats:CompressionStats=None) -> bytes:
+	''' Decompresses data compressed with compress_bytes().'''
+	
+	t0 = time.perf_counter()
+	if codec == COMPRESS_ZLIB:
+		out = zlib.decompress(data)
+	elif codec == COMPRESS_LZ4:
+		if lz4_frame is None:
+			raise ValueError("lz4 compressed payload received but the lz4 package is not installed.")
+		out = lz4_frame.decompress(data)
+	else:
+		raise ValueError(f"Unrecognized compression codec '{codec}'.")
+	
+	if stats is not None:
+		stats.record_decompress(time.perf_counter()-t0)
+	return out
+
+def encode_ndarray(arr:np.ndarray, codec:str=COMPRESS_NONE, threshold:int=COMPRESS_DEFAULT_THRESHOLD, stats:CompressionStats=None) -> dict:
+	''' Encodes an ndarray as a dictionary of dtype, shape and base64 data. The
+	dtype string includes byte order, so data is decoded correctly on any host.
+	Arrays of python objects are encoded element by element instead.
+	
+	If a codec is given, the raw bytes of arrays of at least threshold bytes are
+	compressed before base64 encoding (unless compression does not reduce the size).
+	'''
+	
+	if arr.dtype.hasobject:
+		return {NDARRAY_KEY:True, "dtype":"object", "shape":list(arr.shape), "data":[encode_value(v, codec, threshold, stats) for v in arr.ravel().tolist()]}
+	
+	arr = np.ascontiguousarray(arr)
+	enc = {NDARRAY_KEY:True, "dtype":arr.dtype.str, "shape":list(arr.shape)}
+	
+	data = arr.data
+	if codec != COMPRESS_NONE and arr.nbytes >= threshold:
+		cdata = compress_bytes(arr.tobytes(), codec, stats)
+		if len(cdata) < arr.nbytes:
+			enc[COMPRESSED_KEY] = codec
+			data = cdata
+	
+	enc["data"] = base64.b64encode(data).decode('ascii')
+	return enc
+
+def decode_ndarray(enc:dict, stats:CompressionStats=None) -> np.ndarray:
+	''' Decodes a dictionary from encode_ndarray(). The returned array is writeable.'''
+	
+	if enc['dtype'] == "object":
+		arr = np.empty(len(enc['data']), dtype=object)
+		arr[:] = [decode_value(v, stats) for v in enc['data']]
+		return arr.reshape(enc['shape'])
+	
+	buf = base64.b64decode(enc['data'])
+	if COMPRESSED_KEY in enc:
+		buf = decompress_bytes(buf, enc[COMPRESSED_KEY], stats)
+	buf = bytearray(buf)
+	return np.frombuffer(buf, dtype=np.dtype(enc['dtype'])).reshape(enc['shape'])
+
+def encode_tracedata(td:TraceData, codec:str=COMPRESS_NONE, threshold:int=COMPRESS_DEFAULT_THRESHOLD, stats:CompressionStats=None, include_y:bool=True) -> dict:
+	''' Encodes a TraceData object, keeping its lazy x-axis description. If
+	include_y is False, y is left as None (ie. when y is streamed separately).'''
+	
+	y = encode_ndarray(td.y, codec, threshold, stats) if include_y else None
+	x = None if td._x is None else encode_ndarray(td._x, codec, threshold, stats)
+	return {TRACEDATA_KEY:True, "y":y, "x":x, "x_units":td.x_units, "y_units":td.y_units, "x_start":td.x_start, "x_stop":td.x_stop, "x_origin":td.x_origin, "x_increment":td.x_increment, "timestamp":td.timestamp}
+
+def decode_tracedata(enc:dict, stats:CompressionStats=None, y:np.ndarray=None) -> TraceData:
+	''' Decodes a dictionary from encode_tracedata(). If y is provided it is used
+	in place of the encoded y data.'''
+	
+	if y is None:
+		y = decode_ndarray(enc['y'], stats)
+	x = None if enc['x'] is None else decode_ndarray(enc['x'], stats)
+	return TraceData(y, x_units=enc['x_units'], y_units=enc['y_units'], x_start=enc['x_start'], x_stop=enc['x_stop'], x_origin=enc['x_origin'], x_increment=enc['x_increment'], x=x, timestamp=enc['timestamp'])
+
+def encode_value(val, codec:str=COMPRESS_NONE, threshold:int=COMPRESS_DEFAULT_THRESHOLD, stats:CompressionStats=None):
+	''' Recursively encodes a value so it can be packed into a NetworkCommand or
+	NetworkReply. ndarrays, TraceData and complex numbers are replaced by tagged
+	dictionaries, NumPy scalars are converted to python scalars, and dicts, lists
+	and tuples are encoded element-wise. Other values are returned unchanged.
+	
+	ndarrays of at least threshold bytes are compressed with codec (see encode_ndarray()).
+	'''
+	
+	if isinstance(val, np.ndarray):
+		return encode_ndarray(val, codec, threshold, stats)
+	elif isinstance(val, TraceData):
+		return encode_tracedata(val, codec, threshold, stats)
+	elif isinstance(val, np.generic):
+		return encode_value(val.item())
+	elif isinstance(val, complex):
+		return {COMPLEX_KEY:[val.real, val.imag]}
+	elif isinstance(val, dict):
+		return {k:encode_value(v, codec, threshold, stats) for k, v in val.items()}
+	elif isinstance(val, (list, tuple)):
+		return [encode_value(v, codec, threshold, stats) for v in val]
+	
+	return val
+
+def decode_value(val, stats:CompressionStats=None):
+	''' Reverses encode_value() and pack_payload(). Tuples are returned as lists.'''
+	
+	if isinstance(val, dict):
+		if NDARRAY_KEY in val:
+			return decode_ndarray(val, stats)
+		elif TRACEDATA_KEY in val:
+			return decode_tracedata(val, stats)
+		elif COMPLEX_KEY in val:
+			return complex(val[COMPLEX_KEY][0], val[COMPLEX_KEY][1])
+		elif COMPRESSED_KEY in val:
+			raw = decompress_bytes(base64.b64decode(val['data']), val[COMPRESSED_KEY], stats)
+			return decode_value(json.loads(raw), stats)
+		return {k:decode_value(v, stats) for k, v in val.items()}
+	elif isinstance(val, list):
+		return [decode_value(v, stats) for v in val]
+	
+	return val
+
+def pack_payload(val, codec:str=COMPRESS_NONE, threshold:int=COMPRESS_DEFAULT_THRESHOLD, stats:CompressionStats=None):
+	''' Encodes a remote call argument or return value, compressing it if it is
+	large. ndarrays are compressed individually (see encode_value()). Other large
+	lists and dictionaries (ie. waveforms returned as lists) are compressed as a
+	whole, as JSON.
+	
+	Parameters:
+		val: Value to encode.
+		codec (str): Compression codec, one of COMPRESS_NONE, COMPRESS_ZLIB or
+			COMPRESS_LZ4. Must be supported by the receiver.
+		threshold (int): Minimum payload size in bytes to compress.
+		stats (CompressionStats): Optional statistics to update.
+	
+	Returns:
+		Encoded value, to be decoded with decode_value().
+	'''
+	
+	enc = encode_value(val, codec, threshold, stats)
+	
+	if codec == COMPRESS_NONE or (not isinstance(val, (list, tuple, dict))):
+		return enc
+	
+	# Check size of JSON. Skip if value contains non-JSON types, or arrays (which
+	# were already compressed individually).
+	try:
+		raw = json.dumps(enc)
+	except (TypeError, ValueError):
+		return enc
+	if len(raw) < threshold or f'"{NDARRAY_KEY}"' in raw:
+		return enc
+	raw = raw.encode()
+	
+	cdata = compress_bytes(raw, codec, stats)
+	if len(cdata) >= len(raw):
+		return enc
+	
+	return {COMPRESSED_KEY:codec, "data":base64.b64encode(cdata).decode('ascii')}
+
+def stream_array(val):
+	''' Returns the ndarray to stream as raw bytes if val is an ndarray or
+	TraceData with a numeric dtype, else None.'''
+	
+	arr = val.y if isinstance(val, TraceData) else val
+	if isinstance(arr, np.ndarray) and (not arr.dtype.hasobject):
+		return arr
+	return None
+
+def make_chunks(val, chunk_size:int=STREAM_CHUNK_SIZE, codec:str=COMPRESS_NONE, stats:CompressionStats=None):
+	''' Splits a value into chunks for streaming. Returns None if the value is
+	smaller than chunk_size, so it should be sent whole.
+	
+	ndarrays (and the y data of TraceData) are split into slices of raw bytes, so
+	the receiver can write each chunk straight into a preallocated array. Other
+	values are packed as JSON and the text is split.
+	
+	Parameters:
+		val: Value to split.
+		chunk_size (int): Size of each chunk in bytes, before compression.
+		codec (str): Compression codec for each chunk (ndarray chunks only).
+		stats (CompressionStats): Optional statistics to update.
+	
+	Returns:
+		List of (info, data) tuples, where info is a dictionary describing the
+		chunk and data is a string. None if the value should not be chunked.
+	'''
+	
+	arr = stream_array(val)
+	
+	# Stream ndarray bytes
+	if arr is not None:
+		
+		if arr.nbytes <= chunk_size:
+			return None
+		
+		arr = np.ascontiguousarray(arr)
+		raw = memoryview(arr).cast('B')
+		
+		template = encode_tracedata(val, codec, chunk_size, stats, include_y=False) if isinstance(val, TraceData) else None
+		
+		chunks = []
+		for offset in range(0, arr.nbytes, chunk_size):
+			data = raw[offset:offset+chunk_size]
+			info = {"mode":STREAM_NDARRAY, "dtype":arr.dtype.str, "shape":list(arr.shape), "offset":offset, "codec":COMPRESS_NONE, "template":template}
+			if codec != COMPRESS_NONE:
+				cdata = compress_bytes(data, codec, stats)
+				if len(cdata) < len(data):
+					data = cdata
+					info["codec"] = codec
+			chunks.append((info, base64.b64encode(data).decode('ascii')))
+		
+		return chunks
+	
+	# Stream packed JSON
+	try:
+		text = json.dumps(pack_payload(val, codec, chunk_size, stats))
+	except (TypeError, ValueError):
+		return None
+	if len(text) <= chunk_size:
+		return None
+	
+	return [({"mode":STREAM_JSON}, text[i:i+chunk_size]) for i in range(0, len(text), chunk_size)]
+
+class ChunkAssembler:
+	''' Reassembles a value from chunks created by make_chunks(). Chunks may arrive
+	in any order. ndarray chunks are decoded directly into a preallocated array.'''
+	
+	def __init__(self, num_chunks:int, stats:CompressionStats=None):
+		
+		self.num_chunks = num_chunks
+		self.stats = stats
+		
+		self.received = set() # Indices of received chunks
+		self.arr = None # Preallocated array (ndarray mode)
+		self.template = None # TraceData encoding without y (ndarray mode)
+		self.parts = {} # Chunk index -> text (JSON mode)
+		self.mode = None
+	
+	def add(self, chunk_idx:int, info:dict, data:str) -> bool:
+		''' Adds a chunk. Returns True when all chunks have been received.'''
+		
+		if chunk_idx in self.received:
+			return self.complete()
+		
+		self.mode = info['mode']
+		if self.mode == STREAM_NDARRAY:
+			
+			# Allocate on first chunk. Every chunk carries dtype and shape.
+			if self.arr is None:
+				self.arr = np.empty(info['shape'], dtype=np.dtype(info['dtype']))
+				self.template = info.get('template', None)
+			
+			buf = base64.b64decode(data)
+			if info['codec'] != COMPRESS_NONE:
+				buf = decompress_bytes(buf, info['codec'], self.stats)
+			
+			raw = self.arr.reshape(-1).view(np.uint8)
+			offset = info['offset']
+			raw[offset:offset+len(buf)] = np.frombuffer(buf, dtype=np.uint8)
+		else:
+			self.parts[chunk_idx] = data
+		
+		self.received.add(chunk_idx)
+		return self.complete()
+	
+	def complete(self) -> bool:
+		return len(self.received) >= self.num_chunks
+	
+	def value(self):
+		''' Returns the reassembled value. Only valid once complete.'''
+		
+		if self.mode == STREAM_NDARRAY:
+			if self.template is not None:
+				return decode_tracedata(self.template, self.stats, y=self.arr)
+			return self.arr
+		
+		text = "".join([self.parts[i] for i in range(self.num_chunks)])
+		return decode_value(json.loads(text), self.stats)
\ No newline at end of file
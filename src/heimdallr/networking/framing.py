@@ -0,0 +1,252 @@
+''' Length-prefixed, encrypted JSON framing of GenCommands and GenData, used by the
+asyncio server engine (async_server.py) and the clients which connect to it.
+
+Each frame is a 4-byte big-endian length followed by its payload. This is the
+asyncio engine's own protocol: clients written for pyfrost's server (ie.
+HeimdallrClientAgent) can not connect to it, and FramedClientAgent can not connect
+to a pyfrost server.
+
+Session:
+	1. Server sends a plaintext JSON frame {"protocol": FRAME_PROTOCOL, "public_key":
+		PEM of its RSA key}. Clients may pin the key by its fingerprint.
+	2. Client sends a plaintext JSON frame {"session_key": base64 256-bit key
+		encrypted with the server's key (RSA-OAEP, SHA-256)}.
+	3. Every later frame is a JSON object encrypted with ChaCha20-Poly1305 under the
+		session key. Nonces are a direction byte and a frame counter, so replayed,
+		reordered or modified frames are rejected.
+	4. Client logs in with {"type": "login", "username": str, "password": str}, to
+		which the server replies {"status": bool, "acct_type": str or None}. The
+		server closes the connection if any other command is sent before login.
+
+After login, clients send {"type": "send" or "query", "command": str, "data": dict}.
+The server replies to sends with {"status": bool or None} and to queries with
+{"data": dict or None, "metadata": dict}.
+'''
+
+from pyfrost.base import *
+from heimdallr.base import *
+from Crypto.PublicKey import RSA
+from Crypto.Cipher import ChaCha20_Poly1305, PKCS1_OAEP
+from Crypto.Hash import SHA256
+from Crypto.Random import get_random_bytes
+import asyncio
+import hashlib
+import base64
+import socket
+import struct
+import json
+
+# Length prefix of each frame
+FRAME_LEN = struct.Struct("!I")
+
+# Max size of one frame (bytes). Larger frames close the connection.
+FRAME_MAX_LEN = 268435456
+
+# Max size of a frame before the client has logged in (bytes)
+FRAME_HANDSHAKE_MAX_LEN = 16384
+
+# Time allowed for each handshake or login frame (seconds)
+FRAME_HANDSHAKE_TIMEOUT_S = 10
+
+# Protocol identifier sent by the server in its first frame
+FRAME_PROTOCOL = "heimdallr-framed-1"
+
+FRAME_RSA_BITS = 2048
+FRAME_KEY_LEN = 32
+FRAME_TAG_LEN = 16
+
+# ChaCha20-Poly1305 nonce: direction (0 = client to server, 1 = server to client), frame counter
+FRAME_NONCE = struct.Struct("!BxxxQ")
+
+FRAME_SEND = "send"
+FRAME_QUERY = "query"
+FRAME_LOGIN = "login"
+
+def pack_frame(obj:dict) -> bytes:
+	''' Returns a dictionary encoded as a plaintext frame. Only used for the handshake.'''
+	
+	payload = json.dumps(obj).encode()
+	return FRAME_LEN.pack(len(payload)) + payload
+
+def unpack_frame(payload:bytes) -> dict:
+	''' Returns the dictionary in a plaintext frame's payload (without the length prefix).'''
+	return json.loads(payload.decode())
+
+def key_fingerprint(key:RSA.RsaKey) -> str:
+	''' Returns the SHA-256 fingerprint (hex) of an RSA key's public half.'''
+	return hashlib.sha256(key.public_key().export_key(format='DER')).hexdigest()
+
+class FrameCipher:
+	''' Encrypts and decrypts the frames of one session with ChaCha20-Poly1305, which
+	costs less than half as much per frame as pycryptodome's AES-GCM. Each direction
+	keeps its own frame counter, so calls must be serialized per direction.'''
+	
+	def __init__(self, key:bytes, server:bool):
+		
+		self.key = key
+		self.tx_dir = 1 if server else 0
+		self.rx_dir = 0 if server else 1
+		self.tx_count = 0
+		self.rx_count = 0
+	
+	def seal(self, obj:dict) -> bytes:
+		''' Returns a dictionary encoded as an encrypted frame, including the length prefix.'''
+		
+		cipher = ChaCha20_Poly1305.new(key=self.key, nonce=FRAME_NONCE.pack(self.tx_dir, self.tx_count))
+		self.tx_count += 1
+		
+		ciphertext, tag = cipher.encrypt_and_digest(json.dumps(obj).encode())
+		return FRAME_LEN.pack(len(ciphertext) + FRAME_TAG_LEN) + ciphertext + tag
+	
+	def open(self, payload:bytes) -> dict:
+		''' Returns the dictionary in an encrypted frame's payload. Raises ValueError if
+		the frame was modified, replayed or is out of order.'''
+		
+		if len(payload) < FRAME_TAG_LEN:
+			raise ValueError("Frame is shorter than its authentication tag.")
+		
+		cipher = ChaCha20_Poly1305.new(key=self.key, nonce=FRAME_NONCE.pack(self.rx_dir, self.rx_count))
+		self.rx_count += 1
+		
+		plaintext = cipher.decrypt_and_verify(payload[:-FRAME_TAG_LEN], payload[-FRAME_TAG_LEN:])
+		return json.loads(plaintext.decode())
+
+def client_key_exchange(hello:dict, fingerprint:str=None) -> tuple:
+	''' Checks the server's first frame and creates a session key.
+	
+	Parameters:
+		hello (dict): Server's first (plaintext) frame.
+		fingerprint (str): Expected fingerprint of the server's key. None to accept any key.
+	
+	Returns:
+		Tuple (plaintext frame to send to the server, FrameCipher for the session).
+		Raises ValueError if the server is not compatible or its key does not match.
+	'''
+	
+	if hello.get('protocol', None) != FRAME_PROTOCOL:
+		raise ValueError(f"Server does not use protocol {FRAME_PROTOCOL}.")
+	
+	server_key = RSA.import_key(hello['public_key'])
+	if (fingerprint is not None) and (key_fingerprint(server_key) != fingerprint.lower()):
+		raise ValueError(f"Server key fingerprint {key_fingerprint(server_key)} does not match the expected fingerprint.")
+	
+	session_key = get_random_bytes(FRAME_KEY_LEN)
+	wrapped_key = PKCS1_OAEP.new(server_key, hashAlgo=SHA256).encrypt(session_key)
+	
+	return (pack_frame({"session_key":base64.b64encode(wrapped_key).decode()}), FrameCipher(session_key, server=False))
+
+async def read_frame_async(reader:asyncio.StreamReader, max_len:int=FRAME_MAX_LEN) -> bytes:
+	''' Reads one frame's payload from a stream. Raises ValueError if the frame is
+	longer than max_len.'''
+	
+	nbytes = FRAME_LEN.unpack(await reader.readexactly(FRAME_LEN.size))[0]
+	if nbytes > max_len:
+		raise ValueError(f"Frame of {nbytes} bytes exceeds the limit of {max_len}.")
+	return await reader.readexactly(nbytes)
+
+class FramedConnection:
+	''' Blocking connection to an asyncio Heimdallr server. Not thread safe: callers
+	sharing a connection must serialize login(), send_command() and query_command().'''
+	
+	def __init__(self, log:plf.LogPile, address:str=None, port:int=None, timeout_s:float=30, fingerprint:str=None):
+		
+		self.log = log
+		self.address = address
+		self.port = port
+		self.timeout_s = timeout_s
+		self.fingerprint = fingerprint # Expected server key fingerprint. None to accept any key.
+		self.sock = None
+		self.cipher = None
+	
+	def connect(self) -> bool:
+		''' Connects to the server and sets up an encrypted session. Returns True if
+		successful.'''
+		
+		try:
+			self.sock = socket.create_connection((self.address, self.port), timeout=self.timeout_s)
+			self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			
+			hello = unpack_frame(self._recv_frame(FRAME_HANDSHAKE_MAX_LEN))
+			key_frame, self.cipher = client_key_exchange(hello, self.fingerprint)
+			self.sock.sendall(key_frame)
+		except (OSError, ConnectionError, ValueError, KeyError) as e:
+			self.log.error(f"Failed to connect to server at {self.address}:{self.port}.", detail=f"{e}")
+			self.close()
+			return False
+		
+		return True
+	
+	def close(self):
+		''' Closes the connection.'''
+		
+		if self.sock is not None:
+			try:
+				self.sock.close()
+			except OSError:
+				pass
+			self.sock = None
+		self.cipher = None
+	
+	def _recv_exact(self, num:int) -> bytes:
+		
+		buf = bytearray(num)
+		view = memoryview(buf)
+		offset = 0
+		while offset < num:
+			n = self.sock.recv_into(view[offset:])
+			if n == 0:
+				raise ConnectionError("Connection closed by server.")
+			offset += n
+		return bytes(buf)
+	
+	def _recv_frame(self, max_len:int=FRAME_MAX_LEN) -> bytes:
+		
+		nbytes = FRAME_LEN.unpack(self._recv_exact(FRAME_LEN.size))[0]
+		if nbytes > max_len:
+			raise ValueError(f"Frame of {nbytes} bytes exceeds the limit of {max_len}.")
+		return self._recv_exact(nbytes)
+	
+	def transact(self, obj:dict) -> dict:
+		''' Sends a frame and returns the reply, or None if the connection failed.'''
+		
+		if (self.sock is None) or (self.cipher is None):
+			self.log.error(f"Cannot send to server because the connection is closed.")
+			return None
+		
+		try:
+			self.sock.sendall(self.cipher.seal(obj))
+			return self.cipher.open(self._recv_frame())
+		except (OSError, ConnectionError, ValueError) as e:
+			self.log.error(f"Lost connection to server.", detail=f"{e}")
+			self.close()
+			return None
+	
+	def login(self, username:str, password:str) -> bool:
+		''' Logs in to the server. Returns True if successful.'''
+		
+		reply = self.transact({"type":FRAME_LOGIN, "username":username, "password":password})
+		if (reply is None) or (not reply.get('status', False)):
+			self.log.error(f"Failed to log in to server as user {username}.")
+			return False
+		
+		self.log.debug(f"Logged in to server as user {username} ({reply.get('acct_type', None)}).")
+		return True
+	
+	def send_command(self, gc:GenCommand) -> bool:
+		''' Sends a GenCommand without a return value. Returns the server's status.'''
+		
+		reply = self.transact({"type":FRAME_SEND, "command":gc.command, "data":gc.data})
+		if reply is None:
+			return False
+		return reply.get('status', None)
+	
+	def query_command(self, gc:GenCommand) -> GenData:
+		''' Sends a GenCommand and returns the server's GenData, or None.'''
+		
+		reply = self.transact({"type":FRAME_QUERY, "command":gc.command, "data":gc.data})
+		if (reply is None) or (reply.get('data', None) is None):
+			return None
+		
+		gd = GenData(reply['data'])
+		gd.metadata = reply.get('metadata', {})
+		return gd
@@ -1,6 +1,66 @@
 from pylogfile.base import *
 from heimdallr.networking.network import *
 from heimdallr.base import *
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from collections import deque
+
+# Max number of replies not matching a pending remote call which are kept
+MAX_UNCLAIMED_REPLIES = 1000
+
+class Subscription:
+	''' Values of a publish/subscribe channel received by this client. The latest
+	value is kept, and each callback is called with every new value on the reply
+	dispatcher thread (so callbacks should return quickly).'''
+	
+	def __init__(self, channel:str, label:str):
+		
+		self.channel = channel
+		self.label = label # Description of channel (ie. remote-id.function)
+		self.period_s = 0 # Sampling period chosen by the server
+		
+		self.cond = threading.Condition()
+		self.callbacks = [] # Functions accepting (Subscription, value)
+		self.value = None # Latest value
+		self.status = False # Success status of latest sample
+		self.t_received = None # time.monotonic() when latest value was received
+		self.num_received = 0
+		self.active = True # False after unsubscribe
+	
+	def add_callback(self, callback:callable):
+		''' Adds a function called with (Subscription, value) for each new value.'''
+		with self.cond:
+			self.callbacks.append(callback)
+	
+	def deliver(self, status:bool, value):
+		''' Records a new value and calls the callbacks.'''
+		
+		with self.cond:
+			self.status = status
+			self.value = value
+			self.t_received = time.monotonic()
+			self.num_received += 1
+			callbacks = list(self.callbacks)
+			self.cond.notify_all()
+		
+		if not status:
+			return
+		for cb in callbacks:
+			cb(self, value)
+	
+	def latest(self):
+		''' Returns the latest value, or None if no value has been received.'''
+		with self.cond:
+			return self.value
+	
+	def wait_next(self, timeout_s:float=None):
+		''' Waits for the next value to be received and returns it. Returns None if
+		the timeout passes first.'''
+		
+		with self.cond:
+			num = self.num_received
+			if not self.cond.wait_for(lambda: self.num_received != num or not self.active, timeout=timeout_s):
+				return None
+			return self.value
 
 class HeimdallrClientAgent(ClientAgent):
 	
@@ -8,6 +68,304 @@ class HeimdallrClientAgent(ClientAgent):
 		super().__init__(log=log, address=address, port=port, **kwargs)
 		
 		self.client_id = ""
+		
+		# Serializes use of the socket, so the reply dispatcher and other threads
+		# can send commands through the same ClientAgent. comm_waiting counts threads
+		# waiting for the socket, so the dispatcher can let them go first.
+		self.comm_mtx = threading.RLock()
+		self.comm_cond = threading.Condition()
+		self.comm_waiting = 0
+		self.comm_last_t = 0 # time.monotonic() when socket was last released
+		
+		# Pending remote calls. Remote call IDs are issued by the ClientAgent (not
+		# each RemoteInstrument) so replies to this client can be matched unambiguously.
+		self.rcall_mtx = threading.Condition()
+		self.last_rcall_id = 0
+		self.pending_rcalls = {} # key = local_rcall_id, value = Future resolving to NetworkReply
+		self.unclaimed_replies = deque(maxlen=MAX_UNCLAIMED_REPLIES) # Replies not matching a pending call
+		self.chunk_assemblers = {} # key = local_rcall_id, value = ChunkAssembler for streamed replies. Only used by dispatcher thread.
+		self.subscriptions = {} # key = channel, value = Subscription. Protected by rcall_mtx.
+		
+		# BulkServer address of the D/L client hosting each located instrument
+		self.bulk_endpoints = {} # key = remote-addr, value = [host, port]
+		self.bulk_enabled = True # Fetch large return values directly when possible
+		
+		self.dispatcher_thread = None
+		self.dispatcher_running = False
+		self.dispatcher_error_period_s = 0.1 # Time waited before retrying after TC-LISTEN fails
+		self.dispatcher_settle_s = 0.002 # Time the socket must be idle before the dispatcher listens, so bursts of calls are sent first
+		self.dispatcher_listen_timeout_s = None # TC-LISTEN timeout requested by the dispatcher. None for the server's. Longer timeouts poll less, but delay commands from other threads until TC-LISTEN returns.
+		
+		# Payload compression. Set by negotiate_compression().
+		self.compress_codec = COMPRESS_NONE # Codec this client accepts and uses, agreed with server
+		self.compress_threshold = COMPRESS_DEFAULT_THRESHOLD # Minimum payload size (bytes) to compress
+		self.compress_stats = CompressionStats()
+		
+		# Remote call tracing. Set tracer.enabled to True to trace calls sent by this
+		# client, then export with tracer.export_jsonl() or tracer.export_chrome().
+		self.tracer = CallTracer(self.log)
+	
+	@contextmanager
+	def comm_locked(self):
+		''' Context manager holding the socket mutex.'''
+		
+		with self.comm_cond:
+			self.comm_waiting += 1
+		with self.comm_mtx:
+			with self.comm_cond:
+				self.comm_waiting -= 1
+			try:
+				yield
+			finally:
+				with self.comm_cond:
+					self.comm_last_t = time.monotonic()
+					self.comm_cond.notify_all()
+	
+	def wait_comm_idle(self, settle_s:float=0):
+		''' Waits until no thread is waiting to use the socket and it has been idle
+		for settle_s. Called before listen commands, which hold the socket until
+		something arrives or the server's listen timeout passes.'''
+		
+		with self.comm_cond:
+			while True:
+				t_idle = time.monotonic() - self.comm_last_t
+				if self.comm_waiting == 0 and t_idle >= settle_s:
+					break
+				self.comm_cond.wait(max(settle_s - t_idle, 0.0001))
+	
+	def send_command(self, gc:GenCommand):
+		with self.comm_locked():
+			return super().send_command(gc)
+	
+	def query_command(self, gc:GenCommand):
+		with self.comm_locked():
+			return super().query_command(gc)
+	
+	def next_rcall_id(self) -> int:
+		''' Returns a new remote call ID, unique for this client.'''
+		
+		with self.rcall_mtx:
+			self.last_rcall_id += 1
+			return self.last_rcall_id
+	
+	def expect_reply(self, rcall_id:int) -> Future:
+		''' Creates a Future which will be resolved by the reply dispatcher when the
+		NetworkReply for rcall_id is received. Starts the dispatcher if needed. The
+		Future's rcall_id attribute is set, so callers which give up waiting can
+		pass it to cancel_reply().'''
+		
+		fut = Future()
+		fut.rcall_id = rcall_id
+		with self.rcall_mtx:
+			self.pending_rcalls[rcall_id] = fut
+			self.rcall_mtx.notify_all()
+		
+		self.start_dispatcher()
+		return fut
+	
+	def cancel_reply(self, rcall_id:int, exc:Exception=None):
+		''' Stops waiting for the reply to rcall_id. If exc is provided, it is set on
+		the Future, otherwise the Future is cancelled.'''
+		
+		with self.rcall_mtx:
+			fut = self.pending_rcalls.pop(rcall_id, None)
+		self.tracer.discard(rcall_id)
+		
+		if fut is None:
+			return
+		if exc is not None:
+			fut.set_exception(exc)
+		else:
+			fut.cancel()
+	
+	def start_dispatcher(self):
+		''' Starts the background thread which receives NetworkReplies via TC-LISTEN
+		and resolves the Future of the matching remote call.'''
+		
+		with self.rcall_mtx:
+			if (self.dispatcher_thread is not None) and self.dispatcher_thread.is_alive():
+				return
+			self.dispatcher_running = True
+			self.dispatcher_thread = threading.Thread(target=self.run_dispatcher, name=f"ReplyDispatcher-{self.client_id}", daemon=True)
+			self.dispatcher_thread.start()
+	
+	def stop_dispatcher(self, wait:bool=True):
+		''' Stops the reply dispatcher. Pending remote calls are cancelled.'''
+		
+		with self.rcall_mtx:
+			self.dispatcher_running = False
+			thread = self.dispatcher_thread
+			self.dispatcher_thread = None
+			pending = list(self.pending_rcalls.values())
+			self.pending_rcalls = {}
+			self.chunk_assemblers = {}
+			self.rcall_mtx.notify_all()
+		
+		for fut in pending:
+			fut.cancel()
+		
+		if wait and (thread is not None) and (thread is not threading.current_thread()):
+			thread.join()
+	
+	def run_dispatcher(self):
+		''' Reply dispatcher main loop. Only listens while remote calls are pending or
+		the client has subscriptions.'''
+		
+		while True:
+			
+			# Wait for a remote call to be pending
+			with self.rcall_mtx:
+				self.rcall_mtx.wait_for(lambda: (not self.dispatcher_running) or len(self.pending_rcalls) > 0 or len(self.subscriptions) > 0)
+				if not self.dispatcher_running:
+					return
+			
+			# Let threads sending commands go first, as TC-LISTEN holds the socket until
+			# a reply arrives or the server's TC-LISTEN timeout.
+			self.wait_comm_idle(self.dispatcher_settle_s)
+			
+			# Wait for replies
+			reps = self.tc_listen(self.dispatcher_listen_timeout_s)
+			if reps is None:
+				time.sleep(self.dispatcher_error_period_s)
+				continue
+			
+			for nr in reps:
+				self.dispatch_reply(nr)
+	
+	def dispatch_reply(self, nr):
+		''' Resolves the Future waiting for a NetworkReply. Replies which do not
+		match a pending call are saved in unclaimed_replies.'''
+		
+		# Values published on subscribed channels
+		if len(nr.channel) > 0:
+			self.dispatch_publication(nr)
+			return
+		
+		# Add chunks of streamed replies to their assembler, until the last arrives
+		if nr.num_chunks > 0:
+			with self.rcall_mtx:
+				known = nr.local_rcall_id in self.pending_rcalls
+			if not known:
+				self.chunk_assemblers.pop(nr.local_rcall_id, None)
+				self.log.warning(f"Received reply chunk for unknown remote call (local_rcall_id={nr.local_rcall_id}).")
+				return
+			
+			asm = self.chunk_assemblers.get(nr.local_rcall_id, None)
+			if asm is None:
+				asm = ChunkAssembler(nr.num_chunks, self.compress_stats)
+				self.chunk_assemblers[nr.local_rcall_id] = asm
+			
+			try:
+				if not asm.add(nr.chunk_idx, nr.chunk_info, nr.chunk_data):
+					return
+			except Exception as e:
+				self.log.error(f"Failed to decode reply chunk of remote call (local_rcall_id={nr.local_rcall_id}).", detail=f"{e}")
+				self.chunk_assemblers.pop(nr.local_rcall_id, None)
+				self.cancel_reply(nr.local_rcall_id, e)
+				return
+			
+			self.chunk_assemblers.pop(nr.local_rcall_id, None)
+			nr.chunk_data = ""
+		
+		with self.rcall_mtx:
+			fut = self.pending_rcalls.pop(nr.local_rcall_id, None)
+		
+		if fut is None:
+			self.log.warning(f"Received NetworkReply for unknown remote call (local_rcall_id={nr.local_rcall_id}).")
+			self.unclaimed_replies.append(nr)
+			return
+		
+		self.tracer.finish(nr.local_rcall_id, nr.trace)
+		
+		if not fut.set_running_or_notify_cancel():
+			return
+		
+		# Fetch values held by a BulkServer on a separate thread, so other replies are
+		# not held up
+		if isinstance(nr.rval, dict) and BULK_KEY in nr.rval:
+			threading.Thread(target=self.fetch_reply, args=(nr, fut), name="BulkFetch", daemon=True).start()
+			return
+		
+		# Decode typed values (ie. ndarrays) and decompress return value
+		try:
+			if nr.num_chunks > 0:
+				nr.rval = asm.value()
+			else:
+				nr.rval = decode_value(nr.rval, self.compress_stats)
+		except Exception as e:
+			self.log.error(f"Failed to decode return value of remote call (local_rcall_id={nr.local_rcall_id}).", detail=f"{e}")
+			fut.set_exception(e)
+			return
+		
+		fut.set_result(nr)
+	
+	def negotiate_compression(self, codecs:list=None) -> bool:
+		''' Agrees a payload compression codec with the server. The server picks the
+		first codec in its allowed list which this client supports, and sets the size
+		threshold above which payloads are compressed. Replies to this client's remote
+		calls are then compressed with that codec. Must be called after
+		register_client_id().
+		
+		Parameters:
+			codecs (list): Codecs this client accepts. Defaults to available_codecs().
+		
+		Returns:
+			True if successful, else False.
+		'''
+		
+		if codecs is None:
+			codecs = available_codecs()
+		
+		gc = GenCommand("NEG-COMPRESS", {"CODECS":codecs})
+		data_packet = self.query_command(gc)
+		
+		# Check for missing packet
+		if data_packet is None:
+			self.log.error(f"NEG-COMPRESS received no datapacket.")
+			return False
+		
+		# Check for error in packet
+		if not data_packet.validate_reply(['STATUS', 'CODEC', 'THRESHOLD'], self.log):
+			self.log.error(f"NEG-COMPRESS received invalid GenData reply.")
+			return False
+		
+		self.compress_codec = data_packet.data['CODEC']
+		self.compress_threshold = data_packet.data['THRESHOLD']
+		self.log.debug(f"Negotiated compression codec {self.compress_codec} for payloads of at least {self.compress_threshold} bytes.")
+		
+		return True
+	
+	def get_statistics(self) -> dict:
+		''' Returns a dictionary of client statistics.'''
+		
+		with self.rcall_mtx:
+			num_pending = len(self.pending_rcalls)
+		
+		return {"client_id":self.client_id, "pending_rcalls":num_pending, "unclaimed_replies":len(self.unclaimed_replies), "compress_codec":self.compress_codec, "compress_threshold":self.compress_threshold, "compression":self.compress_stats.summary()}
+	
+	def get_server_stats(self) -> dict:
+		''' Queries the server for its statistics: queue depths of each client,
+		command counts and rates, REMCALL to REMREPLY latency, listen wake latency,
+		and totals removed by the reaper.
+		
+		Returns:
+			Dictionary of server statistics, or None if the query failed.
+		'''
+		
+		gc = GenCommand("SERVER-STATS", {})
+		data_packet = self.query_command(gc)
+		
+		# Check for missing packet
+		if data_packet is None:
+			self.log.error(f"SERVER-STATS received no datapacket.")
+			return None
+		
+		# Check for error in packet
+		if not data_packet.validate_reply(['STATUS', 'STATS'], self.log):
+			self.log.error(f"SERVER-STATS received invalid GenData reply.")
+			return None
+		
+		return data_packet.data['STATS']
 	
 	def register_instrument(self,id:Identifier, override:bool=False):
 		''' Registers an instrument with the server so it can be found by other clients
@@ -113,17 +471,152 @@ class HeimdallrClientAgent(ClientAgent):
 		
 		return True
 	
-	def dl_listen(self):
+	def fetch_reply(self, nr, fut:Future):
+		''' Fetches a return value from the BulkServer of the D/L client which sent
+		the reply, and resolves the Future.'''
+		
+		endpoint = self.bulk_endpoints.get(nr.remote_addr, None)
+		try:
+			if endpoint is None:
+				raise ConnectionError(f"No BulkServer address known for {nr.remote_addr}.")
+			nr.rval = fetch_bulk(endpoint[0], endpoint[1], nr.rval[BULK_KEY])
+		except Exception as e:
+			self.log.error(f"Failed to fetch return value of remote call directly (local_rcall_id={nr.local_rcall_id}).", detail=f"{e}")
+			fut.set_exception(e)
+			return
+		
+		fut.set_result(nr)
+	
+	def register_bulk(self, host:str, port:int) -> bool:
+		''' Registers the address of this client's BulkServer with the server
+		(REG-BULK), so other clients can fetch large return values directly.'''
+		
+		if len(self.client_id) == 0:
+			self.log.warning("Cannot register BulkServer until the client has registered under a valid Client-ID.")
+			return False
+		
+		gc = GenCommand("REG-BULK", {"HOST":host, "PORT":port})
+		if not self.send_command(gc):
+			self.log.error("Failed to register BulkServer. Received fail from server.")
+			return False
+		
+		return True
+	
+	def dispatch_publication(self, nr):
+		''' Delivers a value published on a channel to its Subscription.'''
+		
+		with self.rcall_mtx:
+			sub = self.subscriptions.get(nr.channel, None)
+		if sub is None:
+			return
+		
+		try:
+			val = decode_value(nr.rval, self.compress_stats) if nr.rcall_status else None
+		except Exception as e:
+			self.log.error(f"Failed to decode value published on channel {nr.channel}.", detail=f"{e}")
+			return
+		
+		try:
+			sub.deliver(nr.rcall_status, val)
+		except Exception as e:
+			self.log.error(f"Subscription callback for channel {nr.channel} raised an exception.", detail=f"{e}")
+	
+	def subscribe(self, remote_id:str, remote_addr:str, func_name:str, rate_hz:float, callback:callable=None, args:list=None, kwargs:dict=None) -> Subscription:
+		''' Subscribes to the return value of a function of a remote instrument,
+		sampled at rate_hz. The driver/listener client samples the instrument once per
+		period and the server sends each value to every subscribed client, so the load
+		on the instrument does not grow with the number of subscribers. The sampling
+		rate is the fastest rate requested by any subscriber.
+		
+		Parameters:
+			remote_id (str): Remote-id of instrument. May be None if remote_addr is given.
+			remote_addr (str): Remote-address of instrument. May be None if remote_id is given.
+			func_name (str): Name of driver function to sample (ie. get_temperature).
+			rate_hz (float): Requested sampling rate.
+			callback (callable): Optional function called with (Subscription, value)
+				for each value.
+			args (list): Arguments passed to the function.
+			kwargs (dict): Keyword arguments passed to the function.
+		
+		Returns:
+			Subscription, or None if the subscription failed.
+		'''
+		
+		if len(self.client_id) == 0:
+			self.log.warning("Cannot subscribe until the client has registered under a valid Client-ID.")
+			return None
+		
+		arg_dict = {}
+		for idx, a in enumerate(args if args is not None else []):
+			arg_dict[idx] = encode_value(a)
+		kwargs_dict = {k:encode_value(v) for k, v in (kwargs if kwargs is not None else {}).items()}
+		
+		gc = GenCommand("SUBSCRIBE", {"REMOTE-ID":remote_id, "REMOTE-ADDR":remote_addr, "FUNCTION":func_name, "ARGS":arg_dict, "KWARGS":kwargs_dict, "RATE":rate_hz})
+		data_packet = self.query_command(gc)
+		
+		# Check for missing packet
+		if data_packet is None:
+			self.log.error(f"SUBSCRIBE received no datapacket.")
+			return None
+		
+		# Check for error in packet
+		if not data_packet.validate_reply(['STATUS', 'CHANNEL', 'REMOTE-ID', 'PERIOD'], self.log):
+			self.log.error(f"SUBSCRIBE received invalid GenData reply.", detail=f"{data_packet.metadata}")
+			return None
+		
+		channel = data_packet.data['CHANNEL']
+		
+		with self.rcall_mtx:
+			sub = self.subscriptions.get(channel, None)
+			if sub is None:
+				sub = Subscription(channel, f"{data_packet.data['REMOTE-ID']}.{func_name}")
+				self.subscriptions[channel] = sub
+			sub.period_s = data_packet.data['PERIOD']
+			self.rcall_mtx.notify_all()
+		
+		if callback is not None:
+			sub.add_callback(callback)
+		
+		self.log.debug(f"Subscribed to channel {channel} ({sub.label}, period={sub.period_s} s).")
+		self.start_dispatcher()
+		return sub
+	
+	def unsubscribe(self, sub:Subscription) -> bool:
+		''' Cancels a subscription. Returns True if successful.'''
+		
+		with self.rcall_mtx:
+			self.subscriptions.pop(sub.channel, None)
+		
+		with sub.cond:
+			sub.active = False
+			sub.cond.notify_all()
+		
+		gc = GenCommand("UNSUBSCRIBE", {"CHANNEL":sub.channel})
+		if not self.send_command(gc):
+			self.log.error(f"Failed to unsubscribe from channel {sub.channel}. Received fail from server.")
+			return False
+		
+		return True
+	
+	def dl_listen(self, timeout_s:float=None):
 		'''(For Driver/Listener clients) Asks the server for any latent NetworkCommand 
 		objects from Terminal/Command clients. The server will check repeatedly until a
 		timeout occurs (set DL_LISTEN_TIMEOUT_OPTION and DL_LISTEN_CHECK_OPTION in
 		server_master, both index zero). Will execute any latent commands.
 		
+		Parameters:
+			timeout_s (float): Optional timeout, used if shorter than the server's. Use
+				a short timeout while worker threads have replies to send, as the
+				socket is held until DL-LISTEN returns.
+		
 		Returns None if error, else list of NetworkCommand objects to execute.
 		'''
 		
 		# Prepare general command
-		gc = GenCommand("DL-LISTEN", {})
+		gc = GenCommand("DL-LISTEN", {} if timeout_s is None else {"TIMEOUT":timeout_s})
+		
+		# Let threads sending replies go first
+		self.wait_comm_idle()
 		
 		# Send command and get reply
 		data_packet = self.query_command(gc)
@@ -147,23 +640,29 @@ class HeimdallrClientAgent(ClientAgent):
 			# Create NC from unpacking string
 			nc = NetworkCommand()
 			nc.unpack(ncp)
+			trace_stamp(nc.trace, HOP_DL_DEQUEUE)
 			
 			# Add to list
 			netcoms.append(nc)
 		
 		return netcoms
 	
-	def tc_listen(self):
+	def tc_listen(self, timeout_s:float=None):
 		'''(For Terminal/Command clients) Asks the server for any latent NetworkReply 
 		objects from Driver/Listener clients. The server will check repeatedly until a
 		timeout occurs (set TC_LISTEN_TIMEOUT_OPTION and TC_LISTEN_CHECK_OPTION in
 		server_master, both index zero). Will execute any latent commands.
 		
+		Parameters:
+			timeout_s (float): Optional timeout, used instead of the server's up to its
+				TC_LISTEN_MAX_TIMEOUT_OPTION. Long timeouts suit clients which only wait
+				for publications, as the socket is held until TC-LISTEN returns.
+		
 		Returns None if error, else list of NetworkReply objects to execute.
 		'''
 		
 		# Prepare general command
-		gc = GenCommand("TC-LISTEN", {})
+		gc = GenCommand("TC-LISTEN", {} if timeout_s is None else {"TIMEOUT":timeout_s})
 		
 		# Send command and get reply
 		data_packet = self.query_command(gc)
@@ -193,6 +692,60 @@ class HeimdallrClientAgent(ClientAgent):
 		
 		return netrepls
 
+class FramedClientAgent(HeimdallrClientAgent):
+	''' HeimdallrClientAgent which connects to the asyncio server engine
+	(async_server.py) with encrypted, length-prefixed JSON frames instead of
+	pyfrost's protocol. It can only connect to the asyncio engine, and
+	HeimdallrClientAgent can only connect to the pyfrost engine.
+	
+	Example:
+		ca = FramedClientAgent(log)
+		ca.set_addr("localhost", 5555)
+		ca.connect_socket()
+		ca.login("admin", "password")
+		ca.register_client_id("driver_main")
+	'''
+	
+	def __init__(self, log:plf.LogPile, address:str=None, port:int=None, fingerprint:str=None, **kwargs):
+		super().__init__(log, address=address, port=port, **kwargs)
+		
+		# fingerprint pins the server's key (logged by the server on start)
+		self.framed = FramedConnection(log, address, port, fingerprint=fingerprint)
+	
+	def set_addr(self, address:str, port:int):
+		''' Sets the address of the server.'''
+		self.framed.address = address
+		self.framed.port = port
+	
+	def connect_socket(self) -> bool:
+		''' Connects to the server. Returns True if successful.'''
+		
+		with self.comm_locked():
+			self.connected = self.framed.connect()
+		return self.connected
+	
+	def close_socket(self):
+		''' Closes the connection to the server.'''
+		
+		with self.comm_locked():
+			self.framed.close()
+			self.connected = False
+	
+	def login(self, username:str, password:str) -> bool:
+		''' Logs in to the server. Must be called before any other command. Returns
+		True if successful.'''
+		
+		with self.comm_locked():
+			return self.framed.login(username, password)
+	
+	def send_command(self, gc:GenCommand):
+		with self.comm_locked():
+			return self.framed.send_command(gc)
+	
+	def query_command(self, gc:GenCommand):
+		with self.comm_locked():
+			return self.framed.query_command(gc)
+
 class RemoteInstrument:
 	''' Class to represent an instrument driven by another host on this network. This
 	class allows remote clients to control the instrument, despite not having a 
@@ -212,8 +765,13 @@ class RemoteInstrument:
 		self.state = {}
 		
 		self.last_remote_call_id = 0
+		self.last_future = None # Future of the most recent remote_call()
+		self.target_codec = COMPRESS_NONE # Compression codec accepted by the client hosting the instrument
+		
+		# Batched remote calls (see batch())
+		self.batch_depth = 0
+		self.batch_calls = [] # List of (call dict, Future) tuples
 		self.synchronous_reply_timeout_s = 15 # Time waited for a reply on synchronous calls. Set to -1 for infinite.
-		self.synchronous_reply_period_s = 0.1 # Interval to wait between reply checks
 		
 		self.connected = False # True if sucessfully connected to a remote instrument via server.
 		
@@ -246,14 +804,29 @@ class RemoteInstrument:
 		self.id.ctg = data_packet.data['CTG']
 		self.id.dvr = data_packet.data['DVR']
 		self.id.idn_model = data_packet.data['IDN-MODEL']
+		self.target_codec = data_packet.data.get('CODEC', COMPRESS_NONE)
+		
+		# Address for fetching large return values directly, if the D/L client has one
+		bulk = data_packet.data.get('BULK', None)
+		if bulk is not None:
+			self.client_agent.bulk_endpoints[self.id.remote_addr] = bulk
+		
 		self.connected = True
 	
-	def remote_call(self, func_name:str, *args, **kwargs):
-		''' Calls the function 'func_name' of a remote instrument. Asynchronous, does
-		 not wait for reply from server. However, this function is compatible with 
-		 synchronous operation if you use sync_reply to force receive a reply before initializing another remote_call. Otherwise, multiple remote_call()s can be
-		 sent, and asyncronously have their replies handled using the ClientAgent's
-		 tc_listen() function. '''
+	def remote_call_async(self, func_name:str, *args, **kwargs) -> Future:
+		''' Calls the function 'func_name' of a remote instrument without waiting
+		for the reply. Any number of calls may be outstanding at once, on this and
+		other RemoteInstruments sharing the ClientAgent.
+		
+		Returns:
+			concurrent.futures.Future which resolves to the NetworkReply. The Future
+			raises ConnectionError if the call could not be sent.
+		'''
+		
+		# Compress large arguments if this client and the instrument's client agreed
+		# on a codec with the server, and both support the instrument's codec
+		ca = self.client_agent
+		codec = self.target_codec if (ca.compress_codec != COMPRESS_NONE and self.target_codec in available_codecs()) else COMPRESS_NONE
 		
 		arg_str = ""
 		arg_dict = {}
@@ -261,70 +834,213 @@ class RemoteInstrument:
 		arg_idx = 0
 		for a in args:
 			arg_str = arg_str + f"{a} " # Make debug string
-			arg_dict[arg_idx] = a # Make dictionary
+			arg_dict[arg_idx] = pack_payload(a, codec, ca.compress_threshold, ca.compress_stats) # Make dictionary
 			arg_idx += 1
 		for key, value in kwargs.items():
 			arg_str = arg_str + f"{key}:{value} " # Make debug string
-			kwargs_dict[key] = value # Make dictionary
+			kwargs_dict[key] = pack_payload(value, codec, ca.compress_threshold, ca.compress_stats) # Make dictionary
+		
+		# Queue call if batching
+		if self.batch_depth > 0:
+			self.log.debug(f"Queueing remote call in batch: function = {func_name}, arguments = {arg_str} ")
+			fut = Future()
+			self.batch_calls.append(({"FUNCTION":func_name, "ARGS":arg_dict, "KWARGS":kwargs_dict}, fut))
+			self.last_future = fut
+			return fut
 		
 		# Enter debug log
 		self.log.debug(f"Initializing remote call: function = {func_name}, arguments = {arg_str} ")
 		
+		# Register Future before sending, so the reply cannot arrive first
+		rcall_id = self.next_rcall_id()
+		fut = self.client_agent.expect_reply(rcall_id)
+		self.last_future = fut
+		
 		# Create GC
-		gc = GenCommand("REMCALL", {"LOCAL_RCALL_ID":self.next_rcall_id(), "REMOTE-ID":self.id.remote_id, "REMOTE-ADDR":self.id.remote_addr, "FUNCTION":func_name, "ARGS": arg_dict, "KWARGS": kwargs_dict})
+		gc = GenCommand("REMCALL", {"LOCAL_RCALL_ID":rcall_id, "REMOTE-ID":self.id.remote_id, "REMOTE-ADDR":self.id.remote_addr, "FUNCTION":func_name, "ARGS": arg_dict, "KWARGS": kwargs_dict, "REPLY-CODEC":ca.compress_codec, "BULK-OK":ca.bulk_enabled and (self.id.remote_addr in ca.bulk_endpoints)})
+		
+		# Start trace (stamps client send time)
+		trace = ca.tracer.start(rcall_id, f"{self.id.remote_id}.{func_name}")
+		if trace is not None:
+			gc.data[TRACE_KEY] = trace
 		
 		# Send command to server
 		if not self.client_agent.send_command(gc):
 			self.log.error("Remote call command failed. Received fail from server.")
-			return False
+			self.client_agent.cancel_reply(rcall_id, ConnectionError(f"Failed to send remote call to {func_name}()."))
 		else:
 			self.log.debug(f"Successfully sent remote call command to server.")
-			
+		
+		return fut
+	
+	@contextmanager
+	def batch(self):
+		''' Context manager which collects remote calls and sends them to the instrument
+		in one REMCALL-BATCH message when the block exits. The calls are executed in
+		order and all results are returned in one REMREPLY-BATCH. Within the block,
+		remote_call_async() and @remotefunction functions return a Future for each
+		call's NetworkReply instead of blocking. Batches may be nested; calls are sent
+		when the outermost block exits.
+		
+		Example:
+			with vna.batch():
+				vna.set_freq_start(1e9)
+				vna.set_freq_end(2e9)
+				f_npts = vna.get_num_points()
+			npts = f_npts.result().rval
+		'''
+		
+		self.batch_depth += 1
+		try:
+			yield self
+		finally:
+			self.batch_depth -= 1
+			if self.batch_depth == 0:
+				self.flush_batch()
+	
+	def flush_batch(self) -> bool:
+		''' Sends all remote calls queued by batch(). Returns True if successful.'''
+		
+		if len(self.batch_calls) == 0:
+			return True
+		
+		calls = self.batch_calls
+		self.batch_calls = []
+		
+		self.log.debug(f"Sending batch of {len(calls)} remote calls.")
+		
+		# Register Future before sending, so the reply cannot arrive first
+		rcall_id = self.next_rcall_id()
+		batch_fut = self.client_agent.expect_reply(rcall_id)
+		
+		gc = GenCommand("REMCALL-BATCH", {"LOCAL_RCALL_ID":rcall_id, "REMOTE-ID":self.id.remote_id, "REMOTE-ADDR":self.id.remote_addr, "CALLS":[c[0] for c in calls], "REPLY-CODEC":self.client_agent.compress_codec})
+		
+		# Start trace (stamps client send time)
+		trace = self.client_agent.tracer.start(rcall_id, f"{self.id.remote_id}.batch[{len(calls)}]")
+		if trace is not None:
+			gc.data[TRACE_KEY] = trace
+		
+		# Resolve each call's Future when the batch reply arrives. Each has the batch's
+		# rcall_id, so a caller which times out can cancel the batch reply.
+		for c in calls:
+			c[1].rcall_id = rcall_id
+		batch_fut.add_done_callback(functools.partial(self.resolve_batch, [c[1] for c in calls]))
+		
+		# Send command to server
+		if not self.client_agent.send_command(gc):
+			self.log.error("Remote call batch failed. Received fail from server.")
+			self.client_agent.cancel_reply(rcall_id, ConnectionError(f"Failed to send batch of {len(calls)} remote calls."))
+			return False
+		
+		self.log.debug(f"Successfully sent remote call batch to server.")
 		return True
 	
+	def resolve_batch(self, futures:list, batch_fut:Future):
+		''' Resolves the Future of each call in a batch from the batch's
+		REMREPLY-BATCH. Each Future gets a NetworkReply with the call's status and
+		return value.'''
+		
+		# Pass on failure to send or decode
+		exc = None
+		if batch_fut.cancelled():
+			exc = ConnectionError("Remote call batch was cancelled.")
+		elif batch_fut.exception() is not None:
+			exc = batch_fut.exception()
+		
+		results = []
+		if exc is None:
+			nr = batch_fut.result()
+			if nr.rcall_status:
+				results = nr.rval
+			if len(results) != len(futures) and nr.rcall_status:
+				self.log.error(f"Remote call batch returned {len(results)} results for {len(futures)} calls.")
+		
+		for idx, fut in enumerate(futures):
+			
+			if not fut.set_running_or_notify_cancel():
+				continue
+			
+			if exc is not None:
+				fut.set_exception(exc)
+				continue
+			
+			# Create NetworkReply for individual call
+			cnr = NetworkReply()
+			cnr.replyto_client = nr.replyto_client
+			cnr.local_rcall_id = nr.local_rcall_id
+			cnr.remote_id = nr.remote_id
+			cnr.remote_addr = nr.remote_addr
+			cnr.error = nr.error
+			if idx < len(results):
+				cnr.rcall_status = results[idx]['STATUS']
+				cnr.rval = results[idx]['RVAL']
+			fut.set_result(cnr)
+	
+	def subscribe(self, func_name:str, rate_hz:float, callback:callable=None, *args, **kwargs) -> Subscription:
+		''' Subscribes to the return value of a function of the remote instrument,
+		sampled at rate_hz. See HeimdallrClientAgent.subscribe().
+		
+		Example:
+			sub = tempctrl.subscribe("get_temperature", 2, None, 1)
+			print(sub.wait_next(timeout_s=5))
+		'''
+		
+		return self.client_agent.subscribe(self.id.remote_id, self.id.remote_addr, func_name, rate_hz, callback=callback, args=args, kwargs=kwargs)
+	
+	def remote_call(self, func_name:str, *args, **kwargs):
+		''' Calls the function 'func_name' of a remote instrument. Asynchronous, does
+		not wait for reply from server. Use get_sync_reply() to receive the reply to
+		the most recent call, or remote_call_async() to get a Future for the reply.
+		
+		Returns True if the call was sent successfully.
+		'''
+		
+		fut = self.remote_call_async(func_name, *args, **kwargs)
+		return not (fut.done() and (fut.exception() is not None))
+	
 	def get_sync_reply(self, timeout_s:float=None):
-		''' Waits for a reply to be received. Can override instance's  
-		timeout `synchronous_reply_timeout_s` by setting timeout_s. If
-		timeout_s is none, uses isntance's setting. 
+		''' Waits for the reply to the most recent remote_call(). Can override
+		instance's timeout `synchronous_reply_timeout_s` by setting timeout_s. If
+		timeout_s is none, uses isntance's setting.
 		
-		Returns a tuple with index 0: True=success, False=timed-out, 
-		index 1: Return value.
+		Returns a tuple with index 0: True=success, False=timed-out,
+		index 1: NetworkReply.
 		'''
-		#TODO: Allow rcall_id and replyto_client to be checked for validity
 		
 		# Check for overridden timeout
 		if timeout_s is None:
 			timeout_s = self.synchronous_reply_timeout_s
+		if timeout_s < 0:
+			timeout_s = None
 		
-		t0 = time.time()
-		
-		while True:
-			
-			# Check for replies on server
-			reps = self.client_agent.tc_listen()
-			
-			# Check if any replies were received
-			if len(reps) != 0:
-				break
-			
-			# Check for timeout condition
-			if time.time() - t0 > timeout_s:
-				self.log.error(f"Timed out during get_sync_reply(). This could cause synchronous mode to break!")
-				break
-			
-			# Wait and check again
-			time.sleep(self.synchronous_reply_period_s)
+		if self.last_future is None:
+			self.log.error(f"get_sync_reply() called without a remote call.")
+			return (False, None)
 		
-		if len(reps) == 0: # Nothing was found - timed-out
+		try:
+			rval = self.last_future.result(timeout=timeout_s)
+		except FutureTimeoutError:
+			self.log.error(f"Timed out during get_sync_reply().")
+			self.abandon_reply(self.last_future, timeout_s)
 			return (False, None)
-		elif len(reps) == 1: # Found exactly 1 response, synchronous mode working
-			rval = reps[0]
-			self.log.debug(f"Received synchronous response from server.", detail=f"{rval}")
-			return (True, rval)
-		else: # REceived too many responses, synchronous mode failed!
-			self.log.error(f"Received more than one response to get_sync_reply()! Synchonous mode has failed.")
-			return (True, reps[0])
-			
+		except Exception as e:
+			self.log.error(f"Remote call failed during get_sync_reply().", detail=f"{e}")
+			return (False, None)
+		
+		self.log.debug(f"Received synchronous response from server.", detail=f"{truncate_str(rval, limit=80)}")
+		return (True, rval)
+	
+	def abandon_reply(self, fut:Future, timeout_s:float=None):
+		''' Stops waiting for the reply to a remote call which timed out, so its
+		Future is not left in the ClientAgent's pending calls. A call in a batch
+		abandons the whole batch's reply.'''
+		
+		rcall_id = getattr(fut, 'rcall_id', None)
+		if rcall_id is None:
+			return
+		
+		self.client_agent.cancel_reply(rcall_id, FutureTimeoutError(f"No reply received within {timeout_s} s."))
+	
 	def sync_state(self, timeout_s:float=None):
 		'''
 		Synchonous call to update the state dictionary. Does not force the driver
@@ -384,33 +1100,47 @@ class RemoteInstrument:
 		
 	
 	def next_rcall_id(self):
-		self.last_remote_call_id += 1
+		self.last_remote_call_id = self.client_agent.next_rcall_id()
 		return self.last_remote_call_id
 
 def remotefunction(func):
 	'''Decorator to allow empty functions to call
-	their remote counterparts'''
+	their remote counterparts. Blocks until the reply is received and returns the
+	return value of the remote function (None if the call failed or timed-out).
+	Within RemoteInstrument.batch(), returns a Future for the NetworkReply instead.'''
 	
+	@functools.wraps(func)
 	def wrapper(self, *args, **kwargs):
 		
 		# Send remote call to instrument
-		self.remote_call(func.__name__, *args, **kwargs)
+		fut = self.remote_call_async(func.__name__, *args, **kwargs)
 		
-		# Get reply from instrumnet
-		gsr = self.get_sync_reply()
+		# Calls in a batch are not sent until the batch ends
+		if self.batch_depth > 0:
+			return fut
+		
+		# Get reply from instrument
+		timeout_s = self.synchronous_reply_timeout_s if self.synchronous_reply_timeout_s >= 0 else None
 		try:
-			if not gsr[0]:
-				self.log.error(f"remotefunction failed: No synchronous reply received!")
-				rval = None
-			else:
-				rval = gsr[1]
+			nr = fut.result(timeout=timeout_s)
+		except FutureTimeoutError:
+			self.log.error(f"remotefunction {func.__name__}() failed: No reply received within {timeout_s} s.")
+			self.abandon_reply(fut, timeout_s)
+			return None
 		except Exception as e:
-			self.log.error(f"Failed to interpret response from synchronous reply.", detail=f"{e}")
-			rval = None
-			
+			self.log.error(f"remotefunction {func.__name__}() failed.", detail=f"{e}")
+			return None
+		
+		if not nr.rcall_status:
+			if len(nr.error) > 0:
+				self.log.error(f"remotefunction {func.__name__}() failed.", detail=f"{nr.error}")
+			else:
+				self.log.error(f"remotefunction {func.__name__}() failed on remote instrument.")
+			return None
+		
 		# Call the source function (this should just be 'pass')
 		func(self, *args, **kwargs)
 		
-		# Retunr the value received via the network
-		return rval
-	return wrapper
+		# Return the value received via the network
+		return nr.rval
+	return wrapper
\ No newline at end of file
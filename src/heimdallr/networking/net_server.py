@@ -10,6 +10,11 @@ from Crypto.Random import get_random_bytes
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
 from dataclasses import dataclass
+import threading
+from collections import deque
+import asyncio
+import bisect
+import json
 
 # TODO: Make this configurable and not present in most client copies
 DATABASE_LOCATION = "userdata.db"
@@ -17,14 +22,550 @@ DL_LISTEN_TIMEOUT_OPTION = "DL_LISTEN_TIMEOUT"
 DL_LISTEN_CHECK_OPTION = "DL_LISTEN_CHECK_TIME"
 TC_LISTEN_TIMEOUT_OPTION = "TC_LISTEN_TIMEOUT"
 TC_LISTEN_CHECK_OPTION = "TC_LISTEN_CHECK_TIME"
+COMPRESS_CODECS_OPTION = "COMPRESS_CODECS"
+COMPRESS_THRESHOLD_OPTION = "COMPRESS_THRESHOLD"
+TC_LISTEN_MAX_BYTES_OPTION = "TC_LISTEN_MAX_BYTES"
+TC_LISTEN_MAX_TIMEOUT_OPTION = "TC_LISTEN_MAX_TIMEOUT"
+NET_CMD_TTL_OPTION = "NET_CMD_TTL"
+NET_REPLY_TTL_OPTION = "NET_REPLY_TTL"
+CLIENT_TTL_OPTION = "CLIENT_TTL"
+REAPER_PERIOD_OPTION = "REAPER_PERIOD"
+MAX_SUBSCRIBE_RATE_OPTION = "MAX_SUBSCRIBE_RATE"
+
+# Upper edges (seconds) of latency histogram buckets. Last bucket is unbounded.
+LATENCY_BUCKETS_S = [1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30, 60]
+
+# Max number of remote calls tracked for REMCALL to REMREPLY latency
+STATS_MAX_PENDING_CALLS = 10000
+
+class LatencyHistogram:
+	''' Histogram of latencies with fixed buckets, so recording is O(log(buckets))
+	and percentiles can be read at any time without storing every sample.'''
+	
+	def __init__(self, edges:list=None):
+		self.edges = edges if edges is not None else LATENCY_BUCKETS_S
+		self.counts = [0]*(len(self.edges)+1)
+		self.num = 0
+		self.total_s = 0
+		self.max_s = 0
+		self.mtx = threading.Lock()
+	
+	def record(self, dt_s:float):
+		''' Adds a sample to the histogram.'''
+		
+		idx = bisect.bisect_left(self.edges, dt_s)
+		with self.mtx:
+			self.counts[idx] += 1
+			self.num += 1
+			self.total_s += dt_s
+			if dt_s > self.max_s:
+				self.max_s = dt_s
+	
+	def percentile(self, pct:float, counts:list=None, max_s:float=None) -> float:
+		''' Returns the upper edge of the bucket containing the pct-th percentile
+		sample (limited to the max sample), or None if there are no samples.'''
+		
+		if counts is None:
+			with self.mtx:
+				counts = list(self.counts)
+				max_s = self.max_s
+		
+		num = sum(counts)
+		if num == 0:
+			return None
+		
+		target = pct/100*num
+		total = 0
+		for idx, c in enumerate(counts):
+			total += c
+			if total >= target and c > 0:
+				return min(self.edges[idx], max_s) if idx < len(self.edges) else max_s
+		return max_s
+	
+	def summary(self) -> dict:
+		''' Returns a dictionary of the sample count, mean, p50, p99 and max latency
+		(seconds) and the bucket counts.'''
+		
+		with self.mtx:
+			counts = list(self.counts)
+			num = self.num
+			total_s = self.total_s
+			max_s = self.max_s
+		
+		return {"count":num, "mean_s":total_s/num if num > 0 else None, "p50_s":self.percentile(50, counts, max_s), "p99_s":self.percentile(99, counts, max_s), "max_s":max_s, "bucket_edges_s":self.edges, "buckets":counts}
+
+class ServerStats:
+	''' Counters and latency histograms describing server traffic. Each update
+	holds a lock only for a few integer operations, so collecting statistics does
+	not slow the routing of commands.'''
+	
+	def __init__(self):
+		
+		self.t_start = time.monotonic()
+		
+		# Number of each command received, keyed by command name
+		self.mtx = threading.Lock()
+		self.counts = {}
+		
+		# Counts at the previous call to rates(), used for rates over the last interval
+		self.last_counts = {}
+		self.t_last = self.t_start
+		
+		# Time each remote call was received, keyed by (source client, local rcall id)
+		self.pending_calls = {}
+		
+		self.call_latency = LatencyHistogram() # Time from REMCALL to REMREPLY
+		self.dl_wake_latency = LatencyHistogram() # Time from REMCALL to a waiting DL-LISTEN waking
+		self.tc_wake_latency = LatencyHistogram() # Time from REMREPLY to a waiting TC-LISTEN waking
+	
+	def count(self, name:str, num:int=1):
+		''' Increments the counter for a command.'''
+		
+		with self.mtx:
+			self.counts[name] = self.counts.get(name, 0) + num
+	
+	def call_started(self, client_id:str, rcall_id:int):
+		''' Records when a remote call was received.'''
+		
+		with self.mtx:
+			if len(self.pending_calls) < STATS_MAX_PENDING_CALLS:
+				self.pending_calls[(client_id, rcall_id)] = time.monotonic()
+	
+	def call_finished(self, client_id:str, rcall_id:int):
+		''' Records the REMCALL to REMREPLY latency when a remote call's reply is
+		received.'''
+		
+		with self.mtx:
+			t0 = self.pending_calls.pop((client_id, rcall_id), None)
+		if t0 is not None:
+			self.call_latency.record(time.monotonic() - t0)
+	
+	def rates(self) -> dict:
+		''' Returns the total count of each command, and the rate (Hz) of each
+		command since the server started and since the previous call to rates().'''
+		
+		t_now = time.monotonic()
+		with self.mtx:
+			counts = dict(self.counts)
+			last_counts = self.last_counts
+			t_last = self.t_last
+			self.last_counts = counts
+			self.t_last = t_now
+		
+		dt_start = max(t_now - self.t_start, 1e-9)
+		dt_last = max(t_now - t_last, 1e-9)
+		
+		return {"uptime_s":t_now - self.t_start, "interval_s":dt_last, "counts":counts, "rate_hz":{k:v/dt_start for k, v in counts.items()}, "interval_rate_hz":{k:(v - last_counts.get(k, 0))/dt_last for k, v in counts.items()}}
+
+class ClientQueue:
+	''' Queue of items (NetworkCommand or NetworkReply objects) waiting to be
+	delivered to one client. Each client has its own deque and condition, so
+	clients do not contend for a shared lock, and a listen call delivers all
+	pending items in O(k) and wakes as soon as an item is queued.'''
+	
+	def __init__(self, wake_latency:LatencyHistogram=None):
+		self.items = deque() # (item, size in bytes, time.monotonic() when queued) tuples
+		self.cond = threading.Condition()
+		self.wake_latency = wake_latency # Optional histogram of time from put() to a waiting listener waking
+		self.async_waiters = [] # (event loop, asyncio.Future) of coroutines waiting in async_take_all()
+	
+	def put(self, item, nbytes:int=0):
+		''' Adds an item to the queue and wakes any waiting listener. nbytes is the
+		size of any bulk data in the item (ie. reply chunks), used to limit how much
+		is delivered by one listen call.'''
+		with self.cond:
+			self.items.append((item, nbytes, time.monotonic()))
+			self.cond.notify_all()
+			waiters = self.async_waiters
+			self.async_waiters = []
+		
+		for loop, fut in waiters:
+			loop.call_soon_threadsafe(wake_async_waiter, fut)
+	
+	def expire(self, ttl_s:float) -> list:
+		''' Removes items which have been queued for longer than ttl_s. Items are
+		queued in time order, so only the expired items are visited.
+		
+		Returns:
+			List of (item, size in bytes) tuples which were removed.
+		'''
+		
+		t_min = time.monotonic() - ttl_s
+		expired = []
+		with self.cond:
+			while len(self.items) > 0 and self.items[0][2] < t_min:
+				it = self.items.popleft()
+				expired.append((it[0], it[1]))
+		return expired
+	
+	def clear(self) -> list:
+		''' Removes all items. Returns list of (item, size in bytes) tuples.'''
+		
+		with self.cond:
+			removed = [(it[0], it[1]) for it in self.items]
+			self.items.clear()
+		return removed
+	
+	def _take(self, max_bytes:int=None) -> list:
+		''' Removes and returns items, oldest first. If max_bytes is given, stops
+		before exceeding it (but always returns at least one item). Mutex must be held.'''
+		
+		if max_bytes is None:
+			items = [it[0] for it in self.items]
+			self.items.clear()
+			return items
+		
+		items = []
+		total = 0
+		while len(self.items) > 0:
+			nbytes = self.items[0][1]
+			if len(items) > 0 and total + nbytes > max_bytes:
+				break
+			items.append(self.items.popleft()[0])
+			total += nbytes
+		return items
+	
+	def take_all(self, max_bytes:int=None) -> list:
+		''' Removes and returns all queued items (up to max_bytes, see _take()).'''
+		with self.cond:
+			return self._take(max_bytes)
+	
+	def wait_take_all(self, timeout_s:float, t_check_s:float=None, max_bytes:int=None) -> list:
+		''' Waits until at least one item is queued, then removes and returns all
+		queued items. Returns an empty list if the timeout passes first.
+		
+		Parameters:
+			timeout_s (float): Maximum time to wait in seconds.
+			t_check_s (float): Optional fallback interval for rechecking the queue.
+				Listeners are woken immediately when an item is queued.
+			max_bytes (int): Optional limit on the total size of bulk data returned.
+				Remaining items are left for the next call.
+		
+		Returns:
+			List of items, oldest first.
+		'''
+		
+		t_end = time.time() + timeout_s
+		waited = False
+		with self.cond:
+			while len(self.items) == 0:
+				t_left = t_end - time.time()
+				if t_left <= 0:
+					return []
+				if t_check_s is not None:
+					t_left = min(t_left, t_check_s)
+				self.cond.wait(t_left)
+				waited = True
+			
+			if waited and self.wake_latency is not None:
+				self.wake_latency.record(time.monotonic() - self.items[0][2])
+			
+			return self._take(max_bytes)
+	
+	async def async_take_all(self, timeout_s:float, max_bytes:int=None) -> list:
+		''' Coroutine version of wait_take_all(), for the asyncio server engine. Waits
+		without occupying a thread, so any number of clients can listen at once.'''
+		
+		loop = asyncio.get_running_loop()
+		with self.cond:
+			if len(self.items) > 0:
+				return self._take(max_bytes)
+			fut = loop.create_future()
+			self.async_waiters.append((loop, fut))
+		
+		try:
+			await asyncio.wait_for(fut, timeout_s)
+		except asyncio.TimeoutError:
+			pass
+		
+		with self.cond:
+			if (loop, fut) in self.async_waiters:
+				self.async_waiters.remove((loop, fut))
+			if len(self.items) == 0:
+				return []
+			if self.wake_latency is not None:
+				self.wake_latency.record(time.monotonic() - self.items[0][2])
+			return self._take(max_bytes)
+	
+	def oldest_age(self) -> float:
+		''' Returns the time (seconds) the oldest item has been queued, or 0 if empty.'''
+		with self.cond:
+			if len(self.items) == 0:
+				return 0
+			return time.monotonic() - self.items[0][2]
+	
+	def __len__(self):
+		with self.cond:
+			return len(self.items)
+
+def wake_async_waiter(fut):
+	''' Wakes a coroutine waiting in ClientQueue.async_take_all(). Runs in the
+	waiter's event loop.'''
+	if not fut.done():
+		fut.set_result(True)
+
+class InstrumentDirectory:
+	''' Directory of instruments registered on the server. Instruments are indexed
+	by remote-id, remote-addr, category and owning client, so lookups are O(1).
+	
+	Register and unregister hold a lock and update all indexes together. After
+	each change an immutable snapshot (tuple of Identifiers) is rebuilt, so
+	snapshot() and the lookup functions can be read without taking the lock.
+	Identifiers stored in the directory must not be modified.
+	'''
+	
+	def __init__(self):
+		
+		self.mtx = threading.Lock()
+		
+		self.by_id = {} # key = remote-id, value = Identifier
+		self.by_addr = {} # key = remote-addr, value = Identifier
+		self.by_ctg = {} # key = category, value = dict of remote-addr -> Identifier
+		self.by_client = {} # key = owning client-id, value = dict of remote-addr -> Identifier
+		
+		self.owners = {} # key = remote-addr, value = owning client-id
+		
+		self._snapshot = ()
+	
+	def register(self, inst_id:Identifier, client_id:str=None) -> bool:
+		''' Adds an instrument to the directory.
+		
+		Parameters:
+			inst_id (Identifier): Identifier of the instrument.
+			client_id (str): Client-id of the driver/listener client owning the
+				instrument. If None, taken from the remote-addr (text before '|').
+		
+		Returns:
+			True if added, False if the remote-id or remote-addr was already claimed.
+		'''
+		
+		if client_id is None:
+			client_id = inst_id.remote_addr.split("|")[0]
+		
+		with self.mtx:
+			
+			# Check if remote_id or remote_addr are already used
+			if inst_id.remote_id in self.by_id or inst_id.remote_addr in self.by_addr:
+				return False
+			
+			self.by_id[inst_id.remote_id] = inst_id
+			self.by_addr[inst_id.remote_addr] = inst_id
+			self.by_ctg.setdefault(inst_id.ctg, {})[inst_id.remote_addr] = inst_id
+			self.by_client.setdefault(client_id, {})[inst_id.remote_addr] = inst_id
+			self.owners[inst_id.remote_addr] = client_id
+			
+			self._snapshot = tuple(self.by_addr.values())
+		
+		return True
+	
+	def _remove(self, remote_addr:str):
+		''' Removes an instrument from all indexes. Mutex must be held.'''
+		
+		inst_id = self.by_addr.pop(remote_addr)
+		self.by_id.pop(inst_id.remote_id, None)
+		
+		ctg_dict = self.by_ctg.get(inst_id.ctg, {})
+		ctg_dict.pop(remote_addr, None)
+		if len(ctg_dict) == 0:
+			self.by_ctg.pop(inst_id.ctg, None)
+		
+		client_id = self.owners.pop(remote_addr, None)
+		client_dict = self.by_client.get(client_id, {})
+		client_dict.pop(remote_addr, None)
+		if len(client_dict) == 0:
+			self.by_client.pop(client_id, None)
+		
+		return inst_id
+	
+	def unregister(self, remote_id:str=None, remote_addr:str=None) -> Identifier:
+		''' Removes an instrument, found by remote-id if provided, else by
+		remote-addr. Returns the removed Identifier, or None if not found.'''
+		
+		with self.mtx:
+			
+			if (remote_id is not None) and (len(remote_id) > 0):
+				inst_id = self.by_id.get(remote_id, None)
+				if inst_id is None:
+					return None
+				remote_addr = inst_id.remote_addr
+			elif remote_addr not in self.by_addr:
+				return None
+			
+			inst_id = self._remove(remote_addr)
+			self._snapshot = tuple(self.by_addr.values())
+		
+		return inst_id
+	
+	def unregister_client(self, client_id:str) -> list:
+		''' Removes all instruments owned by a client. Returns the list of removed
+		Identifiers.'''
+		
+		with self.mtx:
+			
+			addrs = list(self.by_client.get(client_id, {}).keys())
+			removed = [self._remove(adr) for adr in addrs]
+			
+			if len(removed) > 0:
+				self._snapshot = tuple(self.by_addr.values())
+		
+		return removed
+	
+	def locate(self, remote_id:str=None, remote_addr:str=None) -> Identifier:
+		''' Finds an instrument by remote-id if provided, else by remote-addr.
+		Returns None if not found.'''
+		
+		if (remote_id is not None) and (len(remote_id) > 0):
+			return self.by_id.get(remote_id, None)
+		return self.by_addr.get(remote_addr, None)
+	
+	def by_category(self, ctg:str) -> list:
+		''' Returns a list of all instruments in a category.'''
+		return list(self.by_ctg.get(ctg, {}).values())
+	
+	def owned_by(self, client_id:str) -> list:
+		''' Returns a list of all instruments owned by a client.'''
+		return list(self.by_client.get(client_id, {}).values())
+	
+	def owner(self, remote_addr:str) -> str:
+		''' Returns the client-id owning an instrument, or None if not registered.'''
+		return self.owners.get(remote_addr, None)
+	
+	def snapshot(self) -> tuple:
+		''' Returns an immutable tuple of all registered Identifiers.'''
+		return self._snapshot
+	
+	def __len__(self):
+		return len(self._snapshot)
+
+class Channel:
+	''' A value published by one instrument (the return value of a driver function
+	with fixed arguments) and the clients subscribed to it.'''
+	
+	def __init__(self, channel_id:str, key:tuple, remote_id:str, remote_addr:str, function:str, args:dict, kwargs:dict):
+		
+		self.channel_id = channel_id
+		self.key = key
+		
+		self.remote_id = remote_id
+		self.remote_addr = remote_addr
+		self.function = function
+		self.args = args
+		self.kwargs = kwargs
+		
+		self.subscribers = {} # key = client-id, value = requested rate (Hz)
+		self.period_s = 0 # Sampling period requested from driver client. 0 if not sampling.
+		
+		self.num_published = 0 # Number of values published
+		self.num_delivered = 0 # Number of values queued for subscribers
+	
+	def sample_period(self, max_rate_hz:float) -> float:
+		''' Returns the sampling period (seconds) needed by the fastest subscriber, or
+		0 if there are no subscribers.'''
+		
+		if len(self.subscribers) == 0:
+			return 0
+		
+		rate = max(self.subscribers.values())
+		if max_rate_hz is not None:
+			rate = min(rate, max_rate_hz)
+		return 1/rate
+
+class SubscriptionDirectory:
+	''' Directory of publish/subscribe channels. Subscriptions from any number of
+	clients to the same function and arguments of one instrument share a channel,
+	so the instrument is sampled once and each value is delivered to every
+	subscriber.'''
+	
+	def __init__(self):
+		
+		self.mtx = threading.Lock()
+		self.channels = {} # key = channel-id, value = Channel
+		self.by_key = {} # key = (remote-addr, function, args, kwargs), value = Channel
+		self.by_client = {} # key = client-id, value = set of channel-ids
+		self.last_channel_id = 0
+	
+	def subscribe(self, client_id:str, remote_id:str, remote_addr:str, function:str, args:dict, kwargs:dict, rate_hz:float) -> Channel:
+		''' Subscribes a client to a channel, creating the channel if needed. A client
+		subscribing again to the same channel updates its rate.
+		
+		Returns:
+			Channel the client was subscribed to.
+		'''
+		
+		key = (remote_addr, function, json.dumps(args, sort_keys=True), json.dumps(kwargs, sort_keys=True))
+		
+		with self.mtx:
+			
+			ch = self.by_key.get(key, None)
+			if ch is None:
+				self.last_channel_id += 1
+				ch = Channel(f"CH{self.last_channel_id}", key, remote_id, remote_addr, function, args, kwargs)
+				self.channels[ch.channel_id] = ch
+				self.by_key[key] = ch
+			
+			ch.subscribers[client_id] = rate_hz
+			self.by_client.setdefault(client_id, set()).add(ch.channel_id)
+		
+		return ch
+	
+	def unsubscribe(self, client_id:str, channel_id:str) -> Channel:
+		''' Removes a client's subscription to a channel. Channels without subscribers
+		are removed.
+		
+		Returns:
+			Channel, or None if the client was not subscribed.
+		'''
+		
+		with self.mtx:
+			
+			ch = self.channels.get(channel_id, None)
+			if (ch is None) or (client_id not in ch.subscribers):
+				return None
+			
+			del ch.subscribers[client_id]
+			self.by_client.get(client_id, set()).discard(channel_id)
+			if len(self.by_client.get(client_id, [None])) == 0:
+				del self.by_client[client_id]
+			
+			if len(ch.subscribers) == 0:
+				del self.channels[channel_id]
+				del self.by_key[ch.key]
+		
+		return ch
+	
+	def unsubscribe_client(self, client_id:str) -> list:
+		''' Removes all subscriptions of a client. Returns list of affected Channels.'''
+		
+		with self.mtx:
+			channel_ids = list(self.by_client.get(client_id, []))
+		
+		channels = []
+		for cid in channel_ids:
+			ch = self.unsubscribe(client_id, cid)
+			if ch is not None:
+				channels.append(ch)
+		return channels
+	
+	def get(self, channel_id:str) -> Channel:
+		''' Returns a channel, or None if it does not exist.'''
+		with self.mtx:
+			return self.channels.get(channel_id, None)
+	
+	def subscribers(self, channel_id:str) -> list:
+		''' Returns a list of client-ids subscribed to a channel.'''
+		with self.mtx:
+			ch = self.channels.get(channel_id, None)
+			return [] if ch is None else list(ch.subscribers.keys())
+	
+	def __len__(self):
+		with self.mtx:
+			return len(self.channels)
 
 class ServerMaster:
 	''' This class contains data shared between multiple clients. '''
 	
 	def __init__(self, master_log:plf.LogPile):
 		
-		#TODO: Add way of printing status of each of these (ie. lengths of the lists)
-		
 		# Create user configurable options
 		self.options = ThreadSafeDict()
 		
@@ -44,30 +585,431 @@ class ServerMaster:
 		self.options.add_param(TC_LISTEN_CHECK_OPTION)
 		self.options.set(TC_LISTEN_CHECK_OPTION, idx=0, val=0.05) # Set timeout (seconds) to 0.1
 		
-		# Initailize ThreadSafeDict object to track instruments
-		self.master_instruments = ThreadSafeList() # (type = Identifier)
-		self.master_net_cmd = ThreadSafeList() # Contains objects describing commands to route to driver/listener clients (Type = NetworkCommand)
-		self.master_net_reply = ThreadSafeList() # Contains objects describing replies to network commands(Type = NetworkReply)
+		# Add option: Max size of reply chunks delivered by one TC-LISTEN, so other
+		# replies are not held behind a large streamed reply
+		self.options.add_param(TC_LISTEN_MAX_BYTES_OPTION)
+		self.options.set(TC_LISTEN_MAX_BYTES_OPTION, idx=0, val=4*STREAM_CHUNK_SIZE)
+		
+		# Add option: Longest TIMEOUT (seconds) a client may request for TC-LISTEN.
+		# Clients which only wait for publications can long-poll for longer than
+		# TC_LISTEN_TIMEOUT, which costs no threads on the asyncio engine.
+		self.options.add_param(TC_LISTEN_MAX_TIMEOUT_OPTION)
+		self.options.set(TC_LISTEN_MAX_TIMEOUT_OPTION, idx=0, val=10)
+		
+		# Add option: Time (seconds) a NetworkCommand may wait for its target client
+		# before the reaper removes it and replies to the caller with a timeout
+		self.options.add_param(NET_CMD_TTL_OPTION)
+		self.options.set(NET_CMD_TTL_OPTION, idx=0, val=60)
+		
+		# Add option: Time (seconds) a NetworkReply may wait for its reply-to client
+		self.options.add_param(NET_REPLY_TTL_OPTION)
+		self.options.set(NET_REPLY_TTL_OPTION, idx=0, val=60)
+		
+		# Add option: Time (seconds) since a client was last heard from before it is
+		# removed, along with its instruments and queues. Set to None to disable.
+		self.options.add_param(CLIENT_TTL_OPTION)
+		self.options.set(CLIENT_TTL_OPTION, idx=0, val=3600)
+		
+		# Add option: Period (seconds) between reaper runs
+		self.options.add_param(REAPER_PERIOD_OPTION)
+		self.options.set(REAPER_PERIOD_OPTION, idx=0, val=5)
+		
+		# Add option: Maximum rate (Hz) at which subscribed channels are sampled
+		self.options.add_param(MAX_SUBSCRIBE_RATE_OPTION)
+		self.options.set(MAX_SUBSCRIBE_RATE_OPTION, idx=0, val=100)
+		
+		# Add option: Compression codecs clients may use, in order of preference
+		self.options.add_param(COMPRESS_CODECS_OPTION)
+		self.options.set(COMPRESS_CODECS_OPTION, idx=0, val=[COMPRESS_LZ4, COMPRESS_ZLIB])
+		
+		# Add option: Minimum payload size (bytes) to compress
+		self.options.add_param(COMPRESS_THRESHOLD_OPTION)
+		self.options.set(COMPRESS_THRESHOLD_OPTION, idx=0, val=COMPRESS_DEFAULT_THRESHOLD)
+		
+		# Directory of registered instruments
+		self.master_instruments = InstrumentDirectory()
 		self.master_client_ids = ThreadSafeList() # Contains a list of all client-ids currently present on the server (type = string)
 		
+		# Publish/subscribe channels
+		self.subscriptions = SubscriptionDirectory()
+		
+		# Per-client queues of commands to route to driver/listener clients, keyed by
+		# target client-id, and replies to network commands, keyed by reply-to
+		# client-id.
+		self.queues_mtx = threading.Lock()
+		self.net_cmd_queues = {} # key = client-id, value = ClientQueue of NetworkCommand
+		self.net_reply_queues = {} # key = client-id, value = ClientQueue of NetworkReply
+		
+		# Compression codec negotiated by each client (NEG-COMPRESS)
+		self.client_codecs = {} # key = client-id, value = codec
+		
+		# BulkServer address of each D/L client which registered one (REG-BULK)
+		self.bulk_endpoints = {} # key = client-id, value = [host, port]
+		
+		# Time each client was last heard from (time.monotonic())
+		self.client_last_seen = {} # key = client-id, value = time
+		
+		# Reaper thread and totals of everything it has removed
+		self.reaper_thread = None
+		self.reaper_stop = threading.Event()
+		self.reaped = {"commands":0, "replies":0, "clients":0, "instruments":0, "bytes":0}
+		
+		# Traffic statistics (SERVER-STATS)
+		self.stats = ServerStats()
+		
 		self.log = master_log
 	
-	def add_instrument(self, inst_id:Identifier) -> bool:
-		''' Adds an instrument to the network. Returns boolean for success status.'''
+	def cmd_queue(self, client_id:str) -> ClientQueue:
+		''' Returns the queue of NetworkCommands waiting for a client, creating it if needed.'''
 		
-		# Acquire mutex
-		with self.master_instruments.mtx:
+		with self.queues_mtx:
+			if client_id not in self.net_cmd_queues:
+				self.net_cmd_queues[client_id] = ClientQueue(self.stats.dl_wake_latency)
+			return self.net_cmd_queues[client_id]
+	
+	def reply_queue(self, client_id:str) -> ClientQueue:
+		''' Returns the queue of NetworkReplies waiting for a client, creating it if needed.'''
 		
-			# Check if remote_id or remote_addr are already used in master_instruments
-			if len(self.master_instruments.find_attr("remote_id", inst_id.remote_id)) > 0:
-				self.log.debug(f"Failed to add instrument because remote_id was already claimed on server.")
-				return False
-			if len(self.master_instruments.find_attr("remote_addr", inst_id.remote_addr)) > 0:
-				self.log.debug(f"Failed to add instrument because remote_addr was already claimed on server.")
-				return False
+		with self.queues_mtx:
+			if client_id not in self.net_reply_queues:
+				self.net_reply_queues[client_id] = ClientQueue(self.stats.tc_wake_latency)
+			return self.net_reply_queues[client_id]
+	
+	def queue_command(self, nc:NetworkCommand):
+		''' Queues a NetworkCommand for its target client.'''
+		self.stats.call_started(nc.source_client, nc.local_rcall_id)
+		trace_stamp(nc.trace, HOP_SERVER_ENQUEUE)
+		self.cmd_queue(nc.target_client).put(nc)
+	
+	def queue_reply(self, nr:NetworkReply):
+		''' Queues a NetworkReply for its reply-to client.'''
+		if nr.chunk_idx >= nr.num_chunks - 1:
+			self.stats.call_finished(nr.replyto_client, nr.local_rcall_id)
+		trace_stamp(nr.trace, HOP_REPLY_ENQUEUE)
+		self.reply_queue(nr.replyto_client).put(nr, len(nr.chunk_data))
+	
+	def update_sampling(self, ch:Channel):
+		''' Tells the driver/listener client owning a channel's instrument to start,
+		change or stop sampling it, if the period needed by the subscribers changed.'''
 		
-			# Add to list
-			self.master_instruments.append(inst_id)
+		period_s = ch.sample_period(self.read_option(MAX_SUBSCRIBE_RATE_OPTION, None))
+		if period_s == ch.period_s:
+			return
+		ch.period_s = period_s
+		
+		# Create NetworkCommand describing sampling
+		nc = NetworkCommand()
+		nc.remote_id = ch.remote_id
+		nc.remote_addr = ch.remote_addr
+		nc.function = ch.function
+		nc.args = ch.args
+		nc.kwargs = ch.kwargs
+		nc.channel = ch.channel_id
+		nc.period_s = period_s
+		nc.target_client = self.master_instruments.owner(ch.remote_addr)
+		
+		# Queue for driver/listener client. Not counted as a remote call.
+		self.cmd_queue(nc.target_client).put(nc)
+	
+	def subscribe(self, client_id:str, inst_id:Identifier, function:str, args:dict, kwargs:dict, rate_hz:float) -> Channel:
+		''' Subscribes a client to the values returned by a function of an instrument,
+		sampled at rate_hz. Returns the Channel.'''
+		
+		ch = self.subscriptions.subscribe(client_id, inst_id.remote_id, inst_id.remote_addr, function, args, kwargs, rate_hz)
+		self.update_sampling(ch)
+		return ch
+	
+	def unsubscribe(self, client_id:str, channel_id:str) -> bool:
+		''' Removes a client's subscription. Returns False if it was not subscribed.'''
+		
+		ch = self.subscriptions.unsubscribe(client_id, channel_id)
+		if ch is None:
+			return False
+		self.update_sampling(ch)
+		return True
+	
+	def publish(self, nr:NetworkReply) -> int:
+		''' Queues a value published on a channel for every subscriber.
+		
+		Returns:
+			Number of subscribers the value was queued for.
+		'''
+		
+		ch = self.subscriptions.get(nr.channel)
+		if ch is None:
+			return 0
+		
+		subscribers = self.subscriptions.subscribers(nr.channel)
+		for cid in subscribers:
+			self.reply_queue(cid).put(nr)
+		
+		ch.num_published += 1
+		ch.num_delivered += len(subscribers)
+		return len(subscribers)
+	
+	def listen_options(self, gc:GenCommand) -> tuple:
+		''' Returns the (timeout, check period, max bytes) for a DL-LISTEN or TC-LISTEN
+		command. The client's TIMEOUT is used for DL-LISTEN if it is shorter than the
+		server's, and for TC-LISTEN if it is no longer than TC_LISTEN_MAX_TIMEOUT.'''
+		
+		if gc.command == "DL-LISTEN":
+			
+			# Get timeout time from server master
+			with self.options.mtx:
+				timeout_s = self.options.read(DL_LISTEN_TIMEOUT_OPTION, 0)
+				t_check_s = self.options.read(DL_LISTEN_CHECK_OPTION, 0)
+			
+			# Check for option read error
+			if timeout_s is None:
+				timeout_s = 0.5
+			if t_check_s is None:
+				t_check_s = 0.2
+			
+			# Use client's timeout if shorter
+			if gc.data.get('TIMEOUT', None) is not None:
+				timeout_s = min(timeout_s, gc.data['TIMEOUT'])
+			
+			return (timeout_s, t_check_s, None)
+		
+		# Get timeout time from server master
+		with self.options.mtx:
+			timeout_s = self.options.read(TC_LISTEN_TIMEOUT_OPTION, 0)
+			t_check_s = self.options.read(TC_LISTEN_CHECK_OPTION, 0)
+			max_bytes = self.options.read(TC_LISTEN_MAX_BYTES_OPTION, 0)
+			max_timeout_s = self.options.read(TC_LISTEN_MAX_TIMEOUT_OPTION, 0)
+		
+		# Check for option read error
+		if timeout_s is None:
+			timeout_s = 0.1
+		if t_check_s is None:
+			t_check_s = 0.05
+		if max_timeout_s is None:
+			max_timeout_s = timeout_s
+		
+		# Use client's timeout, up to the server's limit
+		if gc.data.get('TIMEOUT', None) is not None:
+			timeout_s = min(max(gc.data['TIMEOUT'], 0), max_timeout_s)
+		
+		return (timeout_s, t_check_s, max_bytes)
+	
+	def listen_reply(self, gc:GenCommand, items:list) -> GenData:
+		''' Returns the GenData reply to a DL-LISTEN or TC-LISTEN command which
+		received items (NetworkCommands or NetworkReplies).'''
+		
+		packed = [it.pack() for it in items]
+		
+		if gc.command == "DL-LISTEN":
+			if len(packed) > 0:
+				self.log.debug(f"Sending {len(packed)} NetComs to D/L client.", detail=f"local_rcall_ids: {truncate_str([it.local_rcall_id for it in items], limit=40)}")
+			return GenData({"STATUS":True, "NETCOMS":packed})
+		
+		if len(packed) > 0:
+			self.log.debug(f"Sending {len(packed)} NetReplys to T/C client.", detail=f"local_rcall_ids: {truncate_str([it.local_rcall_id for it in items], limit=40)}")
+		return GenData({"STATUS":True, "NETREPLS":packed})
+	
+	def listen_queue(self, gc:GenCommand, client_id:str) -> ClientQueue:
+		''' Returns the queue read by a DL-LISTEN or TC-LISTEN command.'''
+		
+		if gc.command == "DL-LISTEN":
+			return self.cmd_queue(client_id)
+		return self.reply_queue(client_id)
+	
+	def get_stats(self) -> dict:
+		''' Returns a dictionary describing the server: queue depths of each client,
+		command counts and rates, latency histograms, and totals removed by the
+		reaper.'''
+		
+		with self.queues_mtx:
+			cmd_queues = dict(self.net_cmd_queues)
+			reply_queues = dict(self.net_reply_queues)
+			reaped = dict(self.reaped)
+		
+		queues = {}
+		for cid in set(cmd_queues.keys()) | set(reply_queues.keys()):
+			cq = cmd_queues.get(cid, None)
+			rq = reply_queues.get(cid, None)
+			queues[cid] = {"commands":0 if cq is None else len(cq), "replies":0 if rq is None else len(rq), "oldest_command_s":0 if cq is None else cq.oldest_age(), "oldest_reply_s":0 if rq is None else rq.oldest_age()}
+		
+		with self.stats.mtx:
+			pending = len(self.stats.pending_calls)
+		
+		return {"num_clients":len(self.master_client_ids), "num_instruments":len(self.master_instruments), "num_channels":len(self.subscriptions), "queues":queues, "traffic":self.stats.rates(), "pending_calls":pending, "call_latency":self.stats.call_latency.summary(), "dl_wake_latency":self.stats.dl_wake_latency.summary(), "tc_wake_latency":self.stats.tc_wake_latency.summary(), "reaped":reaped}
+	
+	def touch_client(self, client_id:str):
+		''' Records that a client was heard from.'''
+		
+		if len(client_id) == 0:
+			return
+		with self.queues_mtx:
+			self.client_last_seen[client_id] = time.monotonic()
+	
+	def read_option(self, name:str, default):
+		''' Reads an option, returning default if it can not be read.'''
+		
+		with self.options.mtx:
+			val = self.options.read(name, 0)
+		return default if val is None else val
+	
+	def start_reaper(self):
+		''' Starts the reaper thread, which periodically calls reap(). Does nothing if
+		it is already running.'''
+		
+		with self.queues_mtx:
+			if (self.reaper_thread is not None) and self.reaper_thread.is_alive():
+				return
+			self.reaper_stop.clear()
+			self.reaper_thread = threading.Thread(target=self.run_reaper, name="ServerReaper", daemon=True)
+			self.reaper_thread.start()
+	
+	def stop_reaper(self):
+		''' Stops the reaper thread.'''
+		
+		self.reaper_stop.set()
+		if self.reaper_thread is not None:
+			self.reaper_thread.join()
+			self.reaper_thread = None
+	
+	def run_reaper(self):
+		''' Reaper thread main loop.'''
+		
+		while not self.reaper_stop.wait(self.read_option(REAPER_PERIOD_OPTION, 5)):
+			try:
+				self.reap()
+			except Exception as e:
+				self.log.error(f"Server reaper failed. ({e})")
+	
+	def expire_command(self, nc:NetworkCommand, reason:str):
+		''' Replies to the caller of a NetworkCommand which will never be executed,
+		with a failed REMREPLY.'''
+		
+		nr = NetworkReply()
+		nr.replyto_client = nc.source_client
+		nr.local_rcall_id = nc.local_rcall_id
+		nr.remote_id = nc.remote_id
+		nr.remote_addr = nc.remote_addr
+		nr.rcall_status = False
+		nr.error = reason
+		nr.trace = nc.trace
+		self.queue_reply(nr)
+	
+	def reap(self) -> dict:
+		''' Removes NetworkCommands and NetworkReplies which have been queued longer
+		than their TTL, and clients which have not been heard from within the client
+		TTL (with their instruments and queues). The caller of each removed command is
+		sent a failed REMREPLY.
+		
+		Returns:
+			Dictionary of the number of commands, replies, clients and instruments
+			removed, and bytes of queued bulk data reclaimed.
+		'''
+		
+		cmd_ttl = self.read_option(NET_CMD_TTL_OPTION, 60)
+		reply_ttl = self.read_option(NET_REPLY_TTL_OPTION, 60)
+		client_ttl = self.read_option(CLIENT_TTL_OPTION, None)
+		
+		counts = {"commands":0, "replies":0, "clients":0, "instruments":0, "bytes":0}
+		
+		# Find clients which have not been heard from
+		t_now = time.monotonic()
+		with self.queues_mtx:
+			if client_ttl is None:
+				stale_clients = []
+			else:
+				stale_clients = [cid for cid, t in self.client_last_seen.items() if t_now - t > client_ttl]
+			for cid in stale_clients:
+				self.client_last_seen.pop(cid, None)
+				self.client_codecs.pop(cid, None)
+				self.bulk_endpoints.pop(cid, None)
+			cmd_queues = list(self.net_cmd_queues.items())
+			reply_queues = list(self.net_reply_queues.items())
+		
+		# Remove stale clients, their instruments, and everything queued for them
+		for cid in stale_clients:
+			
+			with self.master_client_ids.mtx:
+				for idx in reversed(self.master_client_ids.find(cid)):
+					self.master_client_ids.remove(idx)
+			
+			counts["instruments"] += len(self.master_instruments.unregister_client(cid))
+			for ch in self.subscriptions.unsubscribe_client(cid):
+				self.update_sampling(ch)
+			counts["clients"] += 1
+			
+			for nc, nbytes in self.cmd_queue(cid).clear():
+				self.expire_command(nc, f"Target client {cid} was removed after not being heard from in {client_ttl} s.")
+				counts["commands"] += 1
+			for nr, nbytes in self.reply_queue(cid).clear():
+				counts["replies"] += 1
+				counts["bytes"] += nbytes
+			
+			with self.queues_mtx:
+				self.net_cmd_queues.pop(cid, None)
+				self.net_reply_queues.pop(cid, None)
+		
+		# Expire old commands and replies
+		for cid, cq in cmd_queues:
+			for nc, nbytes in cq.expire(cmd_ttl):
+				self.expire_command(nc, f"Timed out after {cmd_ttl} s waiting for target client {cid}.")
+				counts["commands"] += 1
+		for cid, rq in reply_queues:
+			for nr, nbytes in rq.expire(reply_ttl):
+				counts["replies"] += 1
+				counts["bytes"] += nbytes
+		
+		# Update totals and report
+		with self.queues_mtx:
+			for k in counts:
+				self.reaped[k] += counts[k]
+		
+		if counts["commands"] + counts["replies"] + counts["clients"] > 0:
+			self.log.info(f"Server reaper removed >{counts['commands']}< commands, >{counts['replies']}< replies ({counts['bytes']} bytes) and >{counts['clients']}< clients ({counts['instruments']} instruments).")
+		
+		return counts
+	
+	def negotiate_codec(self, client_id:str, client_codecs:list) -> str:
+		''' Picks the first allowed compression codec which the client supports, and
+		records it for the client. Returns the codec.'''
+		
+		with self.options.mtx:
+			allowed = self.options.read(COMPRESS_CODECS_OPTION, 0)
+		if allowed is None:
+			allowed = []
+		
+		codec = COMPRESS_NONE
+		for c in allowed:
+			if c in client_codecs:
+				codec = c
+				break
+		
+		with self.queues_mtx:
+			self.client_codecs[client_id] = codec
+		
+		return codec
+	
+	def register_bulk(self, client_id:str, host:str, port:int):
+		''' Records the BulkServer address of a client.'''
+		
+		with self.queues_mtx:
+			self.bulk_endpoints[client_id] = [host, port]
+	
+	def bulk_endpoint(self, client_id:str) -> list:
+		''' Returns the BulkServer address [host, port] of a client, or None.'''
+		
+		with self.queues_mtx:
+			return self.bulk_endpoints.get(client_id, None)
+	
+	def client_codec(self, client_id:str) -> str:
+		''' Returns the compression codec negotiated by a client.'''
+		
+		with self.queues_mtx:
+			return self.client_codecs.get(client_id, COMPRESS_NONE)
+	
+	def add_instrument(self, inst_id:Identifier, client_id:str=None) -> bool:
+		''' Adds an instrument to the network. Returns boolean for success status.'''
+		
+		if not self.master_instruments.register(inst_id, client_id):
+			self.log.debug(f"Failed to add instrument because remote_id or remote_addr was already claimed on server.")
+			return False
 		
 		return True
 
@@ -83,6 +1025,10 @@ def server_init_function(sa:ServerAgent):
 	sa. '''
 	
 	sa.app_data[CLIENT_ID] = ""
+	
+	# Start expiring stale commands, replies and clients
+	serv_master.start_reaper()
+	
 	return sa
 
 def server_callback_send(sa:ServerAgent, gc:GenCommand):
@@ -90,6 +1036,9 @@ def server_callback_send(sa:ServerAgent, gc:GenCommand):
 	 networks (ie. those without a return value). '''
 	global serv_master
 	
+	serv_master.touch_client(sa.app_data[CLIENT_ID])
+	serv_master.stats.count(gc.command)
+	
 	if gc.command == "REG-INST": # Register instrument
 		
 		# Check fields present
@@ -104,7 +1053,7 @@ def server_callback_send(sa:ServerAgent, gc:GenCommand):
 		nid.idn_model = gc.data['IDN-MODEL']
 		
 		# Add instrument to database
-		serv_master.add_instrument(nid)
+		serv_master.add_instrument(nid, sa.app_data[CLIENT_ID] or None)
 		
 		return True
 	
@@ -128,6 +1077,7 @@ def server_callback_send(sa:ServerAgent, gc:GenCommand):
 		sa.app_data[CLIENT_ID] = gc.data['ID']
 		
 		ncid = gc.data['ID']
+		serv_master.touch_client(ncid)
 		sa.log.debug(f"Registered client-id {ncid}")
 		
 		return True
@@ -145,13 +1095,8 @@ def server_callback_send(sa:ServerAgent, gc:GenCommand):
 		nc.source_client = sa.app_data[CLIENT_ID]
 		nc.timestamp = (datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'))
 		
-		# Add to master net command
-		with serv_master.master_net_cmd.mtx:
-			serv_master.master_net_cmd.append(nc)
-		
-		#TODO: Have the server periodically check that all NetworkCommand objects
-		#      correspond to target_clients that exist. Purge those that are more 
-		#      than X amount old.
+		# Queue for target client (wakes the client if it is listening)
+		serv_master.queue_command(nc)
 		
 		#TODO: This command should only be callable when the client is logged in.
 		#      you should first check that a client has been authorized.
@@ -171,19 +1116,88 @@ def server_callback_send(sa:ServerAgent, gc:GenCommand):
 		nc.source_client = sa.app_data[CLIENT_ID]
 		nc.timestamp = (datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'))
 		
-		# Add to master net command
-		with serv_master.master_net_cmd.mtx:
-			serv_master.master_net_cmd.append(nc)
-		
-		#TODO: Have the server periodically check that all NetworkCommand objects
-		#      correspond to target_clients that exist. Purge those that are more 
-		#      than X amount old.
+		# Queue for target client (wakes the client if it is listening)
+		serv_master.queue_command(nc)
 		
 		#TODO: This command should only be callable when the client is logged in.
 		#      you should first check that a client has been authorized.
 		
 		return True
 	
+	elif gc.command == "REMCALL-BATCH":
+		
+		# Check fields present
+		if not gc.validate_command(["LOCAL_RCALL_ID", "REMOTE-ID", "REMOTE-ADDR", "CALLS"], log):
+			return False
+		
+		# Create a NetworkCommand object (carrying all calls of the batch)
+		nc = NetworkCommand(gc=gc)
+		
+		# Populate source-client ID
+		nc.source_client = sa.app_data[CLIENT_ID]
+		nc.timestamp = (datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'))
+		
+		# Queue for target client (wakes the client if it is listening)
+		serv_master.queue_command(nc)
+		
+		return True
+	
+	elif gc.command == "REMREPLY-BATCH":
+		
+		# Check fields present
+		if not gc.validate_command(["RCALL_STATUS", "LOCAL_RCALL_ID", "REMOTE-ID", "REMOTE-ADDR", "RESULTS", "REPLYTO_CLIENT"], log):
+			return False
+		
+		# Queue for reply-to client (wakes the client if it is listening)
+		serv_master.queue_reply(NetworkReply(gc=gc))
+		
+		return True
+	
+	elif gc.command == "REMREPLY-CHUNK":
+		
+		# Check fields present
+		if not gc.validate_command(["RCALL_STATUS", "LOCAL_RCALL_ID", "REMOTE-ID", "REMOTE-ADDR", "REPLYTO_CLIENT", "CHUNK_IDX", "NUM_CHUNKS", "CHUNK_INFO", "DATA"], log):
+			return False
+		
+		# Forward chunk immediately. Chunks are queued individually so other replies
+		# can be delivered between them.
+		serv_master.queue_reply(NetworkReply(gc=gc))
+		
+		return True
+	
+	elif gc.command == "PUBLISH": # Driver/listener client publishes a sampled value
+		
+		# Check fields present
+		if not gc.validate_command(["CHANNEL", "RCALL_STATUS", "LOCAL_RCALL_ID", "REMOTE-ID", "REMOTE-ADDR", "RVAL", "REPLYTO_CLIENT"], log):
+			return False
+		
+		# Queue for all subscribers
+		serv_master.publish(NetworkReply(gc=gc))
+		
+		return True
+	
+	elif gc.command == "REG-BULK": # Register D/L client's BulkServer address
+		
+		# Check fields present
+		if not gc.validate_command(["HOST", "PORT"], log):
+			return False
+		
+		if len(sa.app_data[CLIENT_ID]) == 0:
+			return False
+		
+		serv_master.register_bulk(sa.app_data[CLIENT_ID], gc.data['HOST'], gc.data['PORT'])
+		sa.log.debug(f"Client {sa.app_data[CLIENT_ID]} registered BulkServer at {gc.data['HOST']}:{gc.data['PORT']}.")
+		
+		return True
+	
+	elif gc.command == "UNSUBSCRIBE":
+		
+		# Check fields present
+		if not gc.validate_command(["CHANNEL"], log):
+			return False
+		
+		return serv_master.unsubscribe(sa.app_data[CLIENT_ID], gc.data['CHANNEL'])
+	
 	elif gc.command == "REMREPLY":
 		
 		# Check fields present
@@ -193,13 +1207,8 @@ def server_callback_send(sa:ServerAgent, gc:GenCommand):
 		# Create a NetworkCommand object
 		nr = NetworkReply(gc=gc)
 		
-		# Add to master net command
-		with serv_master.master_net_reply.mtx:
-			serv_master.master_net_reply.append(nr)
-		
-		#TODO: Have the server periodically check that all NetworkReply objects
-		#      correspond to target_clients that exist. Purge those that are more 
-		#      than X amount old.
+		# Queue for reply-to client (wakes the client if it is listening)
+		serv_master.queue_reply(nr)
 		
 		#TODO: This command should only be callable when the client is logged in.
 		#      you should first check that a client has been authorized.
@@ -214,6 +1223,9 @@ def server_callback_query(sa:ServerAgent, gc:GenCommand):
 	 networks (ie. those with a return value). '''
 	global serv_master
 	
+	serv_master.touch_client(sa.app_data[CLIENT_ID])
+	serv_master.stats.count(gc.command)
+	
 	gd_err = GenData({"STATUS": False})
 	
 	if gc.command == "LOC-INST": # Locate instrument
@@ -223,196 +1235,110 @@ def server_callback_query(sa:ServerAgent, gc:GenCommand):
 			gd_err.metadata['error_str'] = "Failed to validate command."
 			return gd_err
 		
-		# Acquire mutex
-		with serv_master.master_instruments.mtx:
+		# Find remote-id or remote-addr, whichever are populated.
+		nid = serv_master.master_instruments.locate(gc.data['REMOTE-ID'], gc.data['REMOTE-ADDR'])
 		
-			# Find remote-id or remote-addr, whichever are populated.
-			if (gc.data['REMOTE-ID'] is not None) and (len(gc.data['REMOTE-ID']) > 0):
-				fidx = serv_master.master_instruments.find_attr("remote_id", gc.data['REMOTE-ID'])
-			else:
-				fidx = serv_master.master_instruments.find_attr("remote_address", gc.data['REMOTE-ADDR'])
-			
-			# Make sure an entry was found
-			if len(fidx) < 1:
-				gd_err.metadata['error_str'] = "Failed to find specified instrument registered on server."
-				return gd_err
-			
-			# Convert from list to first hit (int)
-			fidx = fidx[0]
-			
-			# Access database
-			rid = serv_master.master_instruments.read_attr(fidx, "remote_id")
-			radr = serv_master.master_instruments.read_attr(fidx, "remote_addr")
-			rdvr = serv_master.master_instruments.read_attr(fidx, "dvr")
-			rctg = serv_master.master_instruments.read_attr(fidx, "ctg")
-			ridn = serv_master.master_instruments.read_attr(fidx, "idn_model")
+		# Make sure an entry was found
+		if nid is None:
+			gd_err.metadata['error_str'] = "Failed to find specified instrument registered on server."
+			return gd_err
+		
+		rid = nid.remote_id
+		radr = nid.remote_addr
+		rdvr = nid.dvr
+		rctg = nid.ctg
+		ridn = nid.idn_model
+		
+		# Compression codec accepted by client hosting the instrument, and its
+		# BulkServer address (if any)
+		rowner = serv_master.master_instruments.owner(radr)
+		rcodec = serv_master.client_codec(rowner)
+		rbulk = serv_master.bulk_endpoint(rowner)
 		
 		# Populate GenData response
-		gdata = GenData({"STATUS":True, "REMOTE-ID":rid, "REMOTE-ADDR": radr, "CTG":rctg, "DVR":rdvr, "IDN-MODEL":ridn})
+		gdata = GenData({"STATUS":True, "REMOTE-ID":rid, "REMOTE-ADDR": radr, "CTG":rctg, "DVR":rdvr, "IDN-MODEL":ridn, "CODEC":rcodec, "BULK":rbulk})
 		return gdata
 	
-	elif gc.command == "LIST-INST": # Return a list of all network-registered instruments
+	elif gc.command == "NEG-COMPRESS": # Agree payload compression codec with client
 		
-		#NOTE: Validation not performed because no additional parameters are expected
-		
-		# Initialize arrays
-		rid = []
-		radr = []
-		rdvr = []
-		rctg = []
-		ridn = []
+		# Check fields present
+		if not gc.validate_command(["CODECS"], log):
+			gd_err.metadata['error_str'] = "Failed to validate command."
+			return gd_err
 		
-		# Hold master_instruments across multiple operations
-		with serv_master.master_instruments.mtx:
+		codec = serv_master.negotiate_codec(sa.app_data[CLIENT_ID], gc.data['CODECS'])
+		with serv_master.options.mtx:
+			threshold = serv_master.options.read(COMPRESS_THRESHOLD_OPTION, 0)
+		if threshold is None:
+			threshold = COMPRESS_DEFAULT_THRESHOLD
 		
-			# Get length to iterate over
-			param_len = serv_master.master_instruments.len()
-			
-			# Loop over length
-			for fidx in range(param_len):
-				
-				# Access database
-				rid.append(serv_master.master_instruments.read_attr(fidx, "remote_id"))
-				radr.append(serv_master.master_instruments.read_attr(fidx, "remote_addr"))
-				rdvr.append(serv_master.master_instruments.read_attr(fidx, "dvr"))
-				rctg.append(serv_master.master_instruments.read_attr(fidx, "ctg"))
-				ridn.append(serv_master.master_instruments.read_attr(fidx, "idn_model"))
+		sa.log.debug(f"Client {sa.app_data[CLIENT_ID]} negotiated compression codec {codec}.")
 		
 		# Populate GenData response
-		gdata = GenData({"STATUS":True, "REMOTE-ID":rid, "REMOTE-ADDR": radr, "CTG":rctg, "DVR":rdvr, "IDN-MODEL":ridn})
+		gdata = GenData({"STATUS":True, "CODEC":codec, "THRESHOLD":threshold})
 		return gdata
 	
-	elif gc.command == "DL-LISTEN": # Driver/Listener client is listening for new commands from server
+	elif gc.command == "SUBSCRIBE": # Subscribe to values sampled from an instrument
 		
-		#NOTE: Validation not performed because no additional parameters are expected
+		# Check fields present
+		if not gc.validate_command(["REMOTE-ID", "REMOTE-ADDR", "FUNCTION", "ARGS", "KWARGS", "RATE"], log):
+			gd_err.metadata['error_str'] = "Failed to validate command."
+			return gd_err
 		
-		# Get timeout time from server master
-		with serv_master.options.mtx:
-			timeout_s = serv_master.options.read(DL_LISTEN_TIMEOUT_OPTION, 0)
-			t_check_s = serv_master.options.read(DL_LISTEN_CHECK_OPTION, 0)
+		if len(sa.app_data[CLIENT_ID]) == 0:
+			gd_err.metadata['error_str'] = "Client must register a client-id before subscribing."
+			return gd_err
 		
-		# Check for option read error
-		if timeout_s is None:
-			timeout_s = 0.5
-		if t_check_s is None:
-			t_check_s = 0.2
+		# Find instrument
+		nid = serv_master.master_instruments.locate(gc.data['REMOTE-ID'], gc.data['REMOTE-ADDR'])
+		if nid is None:
+			gd_err.metadata['error_str'] = "Failed to find specified instrument registered on server."
+			return gd_err
 		
-		# Record start time
-		t0 = time.time()
+		if gc.data['RATE'] <= 0:
+			gd_err.metadata['error_str'] = "Subscription rate must be positive."
+			return gd_err
 		
-		# Loop until timeout or commands found
-		fid = []
-		while True:
-			
-			# Access mutex
-			with serv_master.master_net_cmd.mtx:
-				
-				# Look for NetworkCommands addressed to this client-id
-				fid = serv_master.master_net_cmd.find_attr("target_client", sa.app_data[CLIENT_ID])
-				
-				# If any commands are found...
-				if len(fid) != 0:
-					
-					# Process each command
-					nc_list = []
-					for idx in fid:
-						
-						# Access each net command
-						nc = serv_master.master_net_cmd.read(idx)
-						
-						# Pack NetworkCommand and add to list
-						nc_list.append(nc.pack())
-						
-					# Create GenData for reply
-					gdata = GenData({"STATUS":True, "NETCOMS":nc_list})
-					serv_master.log.debug(f"Sending {len(nc_list)} NetComs to D/L client.", detail=f"List contents: {nc_list}")
-					
-					# Delete processed commands
-					for idx in fid:
-						serv_master.master_net_cmd.remove(idx)
-						
-					# Exit loop
-					break
-			
-			# Break if timeout
-			if time.time() >= t0 + timeout_s:
-				
-				# Create GenData for reply
-				gdata = GenData({"STATUS":True, "NETCOMS":[]})
-				
-				break
-			
-			# Pause before checking again
-			time.sleep(t_check_s)
+		ch = serv_master.subscribe(sa.app_data[CLIENT_ID], nid, gc.data['FUNCTION'], gc.data['ARGS'], gc.data['KWARGS'], gc.data['RATE'])
+		sa.log.debug(f"Client {sa.app_data[CLIENT_ID]} subscribed to channel {ch.channel_id} ({nid.remote_id}.{ch.function}, period={ch.period_s} s).")
 		
-		# Return packet
+		gdata = GenData({"STATUS":True, "CHANNEL":ch.channel_id, "REMOTE-ID":nid.remote_id, "REMOTE-ADDR":nid.remote_addr, "PERIOD":ch.period_s})
 		return gdata
 	
-	elif gc.command == "TC-LISTEN": # Terminal/Command client is listening for replies from D/L clients via the server
+	elif gc.command == "SERVER-STATS": # Return queue depths, traffic and latency statistics
 		
 		#NOTE: Validation not performed because no additional parameters are expected
 		
-		# Get timeout time from server master
-		with serv_master.options.mtx:
-			timeout_s = serv_master.options.read(TC_LISTEN_TIMEOUT_OPTION, 0)
-			t_check_s = serv_master.options.read(TC_LISTEN_CHECK_OPTION, 0)
+		gdata = GenData({"STATUS":True, "STATS":serv_master.get_stats()})
+		return gdata
+	
+	elif gc.command == "LIST-INST": # Return a list of all network-registered instruments
 		
-		# Check for option read error
-		if timeout_s is None:
-			timeout_s = 0.1
-		if t_check_s is None:
-			t_check_s = 0.05
+		#NOTE: Validation not performed because no additional parameters are expected
 		
-		# Record start time
-		t0 = time.time()
+		# Read snapshot of directory (no lock required)
+		snap = serv_master.master_instruments.snapshot()
 		
-		# Loop until timeout or commands found
-		fid = []
-		while True:
-			
-			# Access mutex
-			with serv_master.master_net_reply.mtx:
-				
-				# Look for NetworkReplies addressed to this client-id
-				fid = serv_master.master_net_reply.find_attr("replyto_client", sa.app_data[CLIENT_ID])
-				
-				# If any replies are found...
-				if len(fid) != 0:
-					
-					# Process each reply
-					nr_list = []
-					for idx in fid:
-						
-						# Access each net reply
-						nr = serv_master.master_net_reply.read(idx)
-						
-						# Pack NetworkReply and add to list
-						nr_list.append(nr.pack())
-						
-					# Create GenData for reply
-					gdata = GenData({"STATUS":True, "NETREPLS":nr_list})
-					serv_master.log.debug(f"Sending {len(nr_list)} NetReplys to T/C client.", detail=f"List contents: {nr_list}")
-					
-					# Delete processed commands
-					for idx in fid:
-						serv_master.master_net_reply.remove(idx)
-						
-					# Exit loop
-					break
-			
-			# Break if timeout
-			if time.time() >= t0 + timeout_s:
-				
-				# Create GenData for reply
-				gdata = GenData({"STATUS":True, "NETREPLS":[]})
-				
-				break
-			
-			# Pause before checking again
-			time.sleep(t_check_s)
+		rid = [nid.remote_id for nid in snap]
+		radr = [nid.remote_addr for nid in snap]
+		rdvr = [nid.dvr for nid in snap]
+		rctg = [nid.ctg for nid in snap]
+		ridn = [nid.idn_model for nid in snap]
 		
-		# Return packet
+		# Populate GenData response
+		gdata = GenData({"STATUS":True, "REMOTE-ID":rid, "REMOTE-ADDR": radr, "CTG":rctg, "DVR":rdvr, "IDN-MODEL":ridn})
 		return gdata
+	
+	elif gc.command in ("DL-LISTEN", "TC-LISTEN"): # Driver/Listener client is listening for new commands, or Terminal/Command client for replies from D/L clients via the server
+		
+		#NOTE: Validation not performed because only optional parameters are expected
+		
+		# Wait for NetworkCommands (DL) or NetworkReplies (TC) addressed to this client-id
+		timeout_s, t_check_s, max_bytes = serv_master.listen_options(gc)
+		items = serv_master.listen_queue(gc, sa.app_data[CLIENT_ID]).wait_take_all(timeout_s, t_check_s, max_bytes)
+		
+		# Return packet
+		return serv_master.listen_reply(gc, items)
 		
 	# Return None if command is not recognized
 	return None
\ No newline at end of file
@@ -1,6 +1,12 @@
 from pyfrost.base import *
 from pyfrost.pf_client import *
 from heimdallr.base import *
+from heimdallr.instrument_control.fleet import *
+from heimdallr.instrument_control.driver_actor import *
+from heimdallr.networking.codec import *
+from heimdallr.networking.tracing import *
+from heimdallr.networking.bulk import *
+from heimdallr.networking.framing import *
 
 class NetworkCommand(Packable):
 	''' Object used to represent a function call passed over the Heimdallr
@@ -21,11 +27,28 @@ class NetworkCommand(Packable):
 		self.function = {}
 		self.args = {}
 		self.kwargs = {}
+		self.calls = [] # For REMCALL-BATCH, list of dicts with keys FUNCTION, ARGS and KWARGS. Empty for single calls.
+		
+		# Compression codec the source client accepts for the reply
+		self.reply_codec = COMPRESS_NONE
+		
+		# Publish/subscribe. If channel is set, the command is not a remote call but
+		# tells the D/L client to sample the function every period_s seconds (0 to
+		# stop) and PUBLISH the values on the channel.
+		self.channel = ""
+		self.period_s = 0
+		
+		# True if the source client can fetch large return values directly from the
+		# D/L client's BulkServer
+		self.bulk_ok = False
 		
 		# Source of command
 		self.source_client = ""
 		self.timestamp = str(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')) # From time object is created on server, not time it is sent from client.
 		
+		# Hop timestamps if the call is traced (see tracing.py). Empty if not traced.
+		self.trace = {}
+		
 		# Initialize from gc if provided
 		if gc is not None:
 			
@@ -33,9 +56,13 @@ class NetworkCommand(Packable):
 			self.remote_addr = gc.data['REMOTE-ADDR']
 			self.local_rcall_id = gc.data['LOCAL_RCALL_ID']
 			
-			self.function = gc.data['FUNCTION']
-			self.args = gc.data['ARGS']
-			self.kwargs = gc.data['KWARGS']
+			self.function = gc.data.get('FUNCTION', "")
+			self.args = gc.data.get('ARGS', {})
+			self.kwargs = gc.data.get('KWARGS', {})
+			self.calls = gc.data.get('CALLS', [])
+			self.reply_codec = gc.data.get('REPLY-CODEC', COMPRESS_NONE)
+			self.trace = gc.data.get(TRACE_KEY, {})
+			self.bulk_ok = gc.data.get('BULK-OK', False)
 			
 			try:
 				pipe_idx = self.remote_addr.find("|")
@@ -55,9 +82,15 @@ class NetworkCommand(Packable):
 		self.manifest.append("function")
 		self.manifest.append("args")
 		self.manifest.append("kwargs")
+		self.manifest.append("calls")
+		self.manifest.append("reply_codec")
+		self.manifest.append("channel")
+		self.manifest.append("period_s")
+		self.manifest.append("bulk_ok")
 		
 		self.manifest.append("source_client")
 		self.manifest.append("timestamp")
+		self.manifest.append("trace")
 
 class NetworkReply(Packable):
 	''' Object used to represent the return value (and success state) of a
@@ -78,19 +111,37 @@ class NetworkReply(Packable):
 		# Return value
 		self.rcall_status = False # Did remote call execute successfully?
 		self.rval = None # Return value from instrument call (if successful)
+		self.error = "" # Reason the call failed, if set by the server (ie. timed out)
+		self.channel = "" # Channel the value was published on (PUBLISH). Empty for remote call replies.
+		
+		# Chunked replies (REMREPLY-CHUNK). num_chunks is 0 for unchunked replies.
+		self.chunk_idx = 0
+		self.num_chunks = 0
+		self.chunk_info = {} # Chunk description from make_chunks()
+		self.chunk_data = "" # Chunk contents
 		
 		self.timestamp = str(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')) # From time object is created on server, not time it is sent from client.
 		
+		# Hop timestamps if the call is traced (see tracing.py). Empty if not traced.
+		self.trace = {}
+		
 		# Initialize from gc if provided
 		if gc is not None:
 			
 			self.remote_id = gc.data['REMOTE-ID']
 			self.remote_addr = gc.data['REMOTE-ADDR']
 			self.local_rcall_id = gc.data['LOCAL_RCALL_ID']
+			self.trace = gc.data.get(TRACE_KEY, {})
+			self.channel = gc.data.get('CHANNEL', "")
 			
 			self.rcall_status = gc.data['RCALL_STATUS']
-			self.rval = gc.data['RVAL']
+			self.rval = gc.data['RESULTS'] if 'RESULTS' in gc.data else gc.data.get('RVAL', None)
 			self.replyto_client = gc.data['REPLYTO_CLIENT']
+			
+			self.chunk_idx = gc.data.get('CHUNK_IDX', 0)
+			self.num_chunks = gc.data.get('NUM_CHUNKS', 0)
+			self.chunk_info = gc.data.get('CHUNK_INFO', {})
+			self.chunk_data = gc.data.get('DATA', "")
 	
 	def set_manifest(self):
 		
@@ -102,54 +153,325 @@ class NetworkReply(Packable):
 		
 		self.manifest.append("rcall_status")
 		self.manifest.append("rval")
+		self.manifest.append("error")
+		self.manifest.append("channel")
+		
+		self.manifest.append("chunk_idx")
+		self.manifest.append("num_chunks")
+		self.manifest.append("chunk_info")
+		self.manifest.append("chunk_data")
 		
 		self.manifest.append("timestamp")
+		self.manifest.append("trace")
 
 class DriverManager:
 	''' Accepts a number of driver instances and allows them to be interacted with
 	over a network.
-	'''
 	
-	#TODO: Implement multi-threading
+	If concurrent is True, each instrument gets a worker thread (DriverActor) and
+	dispatch_command() queues each NetworkCommand to the worker for its remote-addr.
+	Commands to one instrument run in order, commands to different instruments run
+	in parallel, and each reply is sent as soon as its call finishes.
+	'''
 	
-	def __init__(self, log:plf.LogPile, ca:ClientAgent=None):
+	def __init__(self, log:plf.LogPile, ca:ClientAgent=None, concurrent:bool=True):
 		
 		self.drivers = {} # Dictionary mapping key=remote-addr to value=Driver-objects
+		self.actors = {} # Dictionary mapping key=remote-addr to value=DriverActor (if concurrent)
+		self.concurrent = concurrent
+		
+		# Number of dispatched commands which have not been replied to. While any are
+		# active, listen() uses busy_listen_timeout_s so replies are not held behind
+		# DL-LISTEN on the shared socket.
+		self.active_mtx = threading.Lock()
+		self.num_active = 0
+		self.busy_listen_timeout_s = 0.01
 		self.log = log
 		
 		# ClientAgent - if None, will ignore all network operations
 		self.ca = ca 
+		
+		# Return values larger than this (bytes) are streamed to the server in chunks
+		# (REMREPLY-CHUNK). Set to 0 to disable chunking.
+		self.chunk_size = STREAM_CHUNK_SIZE
+		
+		# Server for fetching large return values directly (see start_bulk_server()).
+		# Return values larger than bulk_threshold (bytes) are sent through it when
+		# the caller supports it.
+		self.bulk_server = None
+		self.bulk_threshold = BULK_DEFAULT_THRESHOLD
+		
+		# Subscribed channels sampled by the sampler thread and published to the server
+		self.sampler_cond = threading.Condition()
+		self.samplers = {} # key = channel, value = dict with keys 'nc', 'period_s', 't_next' and 'fut'
+		self.sampler_thread = None
+		self.sampler_running = False
+	
+	def dispatch_command(self, command:NetworkCommand):
+		''' Executes a NetworkCommand and sends the reply. If the DriverManager is
+		concurrent, the command is queued to the worker thread of the target instrument
+		and this function returns immediately.
+		
+		Returns:
+			Future resolving to the success status of the reply if the command was
+			queued, else the success status of the reply.
+		'''
+		
+		# Sampling requests for subscribed channels are not executed immediately
+		if len(command.channel) > 0:
+			return self.set_sampling(command)
+		
+		actor = self.actors.get(command.remote_addr, None)
+		if actor is None:
+			return self.route_and_reply(command)
+		
+		with self.active_mtx:
+			self.num_active += 1
+		
+		fut = actor.submit_func(self.route_and_reply, command)
+		fut.add_done_callback(self._command_done)
+		return fut
+	
+	def _command_done(self, fut):
+		with self.active_mtx:
+			self.num_active -= 1
+	
+	def listen(self):
+		''' Receives NetworkCommands from the server with DL-LISTEN and dispatches
+		each one with dispatch_command(). Call repeatedly in the driver/listener main
+		loop.
+		
+		Returns:
+			Number of commands dispatched, or None if DL-LISTEN failed.
+		'''
+		
+		# Published samples must not wait behind DL-LISTEN either
+		with self.active_mtx:
+			busy = self.num_active > 0
+		with self.sampler_cond:
+			busy = busy or len(self.samplers) > 0
+		
+		net_cmds = self.ca.dl_listen(self.busy_listen_timeout_s if busy else None)
+		if net_cmds is None:
+			return None
+		
+		for nc in net_cmds:
+			self.dispatch_command(nc)
+		
+		return len(net_cmds)
+	
+	def start_bulk_server(self, host:str="0.0.0.0", port:int=0, advertise_host:str=None) -> bool:
+		''' Starts a BulkServer and registers its address with the Heimdallr server
+		(REG-BULK), so clients can fetch large return values directly from this host
+		instead of through the server. Must be called after register_client_id().
+		
+		Parameters:
+			host (str): Address to bind to.
+			port (int): Port to listen on. 0 picks a free port.
+			advertise_host (str): Address other clients should connect to. Defaults
+				to host, or this host's IP address if host is 0.0.0.0.
+		
+		Returns:
+			True if successful, else False.
+		'''
+		
+		bs = BulkServer(self.log, host, port, advertise_host)
+		if not bs.start():
+			return False
+		
+		if not self.ca.register_bulk(bs.advertise_host, bs.port):
+			bs.stop()
+			return False
+		
+		self.bulk_server = bs
+		return True
+	
+	def set_sampling(self, command:NetworkCommand) -> bool:
+		''' Starts, changes or stops sampling a subscribed channel, as described by a
+		NetworkCommand with channel set. Returns True if successful.'''
+		
+		if not command.remote_addr in self.drivers:
+			self.log.error(f"DriverManager unable to sample channel {command.channel} because requested remote-addr is not in lookup table.")
+			return False
+		
+		with self.sampler_cond:
+			if command.period_s <= 0:
+				self.samplers.pop(command.channel, None)
+				self.log.debug(f"Stopped sampling channel {command.channel}.")
+			else:
+				smp = self.samplers.get(command.channel, None)
+				if smp is None:
+					self.samplers[command.channel] = {"nc":command, "period_s":command.period_s, "t_next":time.monotonic(), "fut":None}
+				else:
+					smp['period_s'] = command.period_s
+				self.log.debug(f"Sampling channel {command.channel} ({command.function}() every {command.period_s} s).")
+			self.sampler_cond.notify_all()
+		
+		self.start_sampler()
+		return True
+	
+	def start_sampler(self):
+		''' Starts the sampler thread if it is not running.'''
+		
+		with self.sampler_cond:
+			if (self.sampler_thread is not None) and self.sampler_thread.is_alive():
+				return
+			self.sampler_running = True
+			self.sampler_thread = threading.Thread(target=self.run_sampler, name="DriverManagerSampler", daemon=True)
+			self.sampler_thread.start()
+	
+	def stop_sampler(self, wait:bool=True):
+		''' Stops the sampler thread.'''
+		
+		with self.sampler_cond:
+			self.sampler_running = False
+			thread = self.sampler_thread
+			self.sampler_thread = None
+			self.sampler_cond.notify_all()
+		
+		if wait and (thread is not None):
+			thread.join()
+	
+	def run_sampler(self):
+		''' Sampler thread main loop. Samples each channel when it is due. A channel
+		is skipped if its previous sample has not finished, so a slow instrument is
+		not sent a backlog of samples.'''
+		
+		while True:
+			
+			due = []
+			with self.sampler_cond:
+				
+				if not self.sampler_running:
+					return
+				
+				t_now = time.monotonic()
+				t_wake = None
+				for smp in self.samplers.values():
+					if smp['t_next'] <= t_now:
+						if (smp['fut'] is None) or smp['fut'].done():
+							due.append(smp)
+						smp['t_next'] = max(smp['t_next'] + smp['period_s'], t_now)
+					t_wake = smp['t_next'] if t_wake is None else min(t_wake, smp['t_next'])
+				
+				if len(due) == 0:
+					self.sampler_cond.wait(None if t_wake is None else t_wake - t_now)
+					continue
+			
+			# Sample on each instrument's worker thread, in order with remote calls
+			for smp in due:
+				actor = self.actors.get(smp['nc'].remote_addr, None)
+				if actor is None:
+					self.sample_and_publish(smp['nc'])
+				else:
+					smp['fut'] = actor.submit_func(self.sample_and_publish, smp['nc'])
+	
+	def sample_and_publish(self, nc:NetworkCommand) -> bool:
+		''' Calls the function of a subscribed channel and sends the result to the
+		server with PUBLISH. Returns True if successful.'''
+		
+		try:
+			status_rval = self.call_function(nc.remote_addr, nc.function, nc.args, nc.kwargs)
+		except Exception as e:
+			self.log.error(f"DriverManager failed to sample channel {nc.channel}.", detail=f"{e}")
+			status_rval = (False, None)
+		
+		# Published values are compressed with zlib (available to all subscribers) if
+		# this client uses compression
+		codec = COMPRESS_ZLIB if getattr(self.ca, "compress_codec", COMPRESS_NONE) != COMPRESS_NONE else COMPRESS_NONE
+		threshold = getattr(self.ca, "compress_threshold", COMPRESS_DEFAULT_THRESHOLD)
+		stats = getattr(self.ca, "compress_stats", None)
+		
+		try:
+			rval = pack_payload(status_rval[1], codec, threshold, stats) if status_rval[0] else None
+		except Exception as e:
+			self.log.error(f"DriverManager failed to encode sample of channel {nc.channel}.", detail=f"{e}")
+			status_rval = (False, None)
+			rval = None
+		
+		gc = GenCommand("PUBLISH", {"CHANNEL":nc.channel, "RCALL_STATUS":status_rval[0], "LOCAL_RCALL_ID":-1, "RVAL":rval, "REMOTE-ID": nc.remote_id, "REMOTE-ADDR": nc.remote_addr, "REPLYTO_CLIENT": ""})
+		
+		if not self.ca.send_command(gc):
+			self.log.error(f"Failed to publish sample of channel {nc.channel}. Received fail from server.")
+			return False
+		
+		return True
+	
+	def route_and_reply(self, command:NetworkCommand) -> bool:
+		''' Executes a NetworkCommand with route_command() and sends the reply with
+		dl_reply(). Returns the success status of the reply.'''
+		
+		trace_stamp(command.trace, HOP_EXEC_START)
+		try:
+			status_rval = self.route_command(command)
+		except Exception as e:
+			self.log.error(f"DriverManager call to {command.function}() raised an exception.", detail=f"driver remote address={command.remote_addr}, error message: ({e})")
+			status_rval = (False, None)
+		trace_stamp(command.trace, HOP_EXEC_END)
+		
+		return self.dl_reply(command, status_rval)
 	
 	def route_command(self, command:NetworkCommand) -> bool:
 		''' Executes a NetworkCommand by translating the relevant command into
-		a function call for the target driver. Returns a tuple with index 0: true false for succcess status, and index 1: return value from called function.'''
+		a function call for the target driver. Returns a tuple with index 0: true false for succcess status, and index 1: return value from called function.
+		
+		For batches (REMCALL-BATCH), each call is executed in order and index 1 is a
+		list of (status, return value) tuples, one per call.'''
+		
+		if len(command.calls) > 0:
+			return self.route_batch(command)
+		
+		return self.call_function(command.remote_addr, command.function, command.args, command.kwargs)
+	
+	def route_batch(self, command:NetworkCommand) -> tuple:
+		''' Executes each call of a REMCALL-BATCH NetworkCommand in order. A failed
+		call does not stop the calls after it. Returns a tuple with index 0: True if the
+		target instrument was found, and index 1: list of (status, return value) tuples.'''
 		
 		# Verify that target is in lookup table
 		if not command.remote_addr in self.drivers:
 			self.log.error(f"DriverManager unable to route NetworkCommand because requested remote-addr is not in lookup table.")
 			return (False, None)
 		
+		results = []
+		for call in command.calls:
+			results.append(self.call_function(command.remote_addr, call['FUNCTION'], call['ARGS'], call['KWARGS']))
+		
+		return (True, results)
+	
+	def call_function(self, remote_addr:str, function:str, args_dict:dict, kwargs:dict) -> tuple:
+		''' Calls a function of a driver with encoded arguments from a NetworkCommand.
+		Returns a tuple with index 0: true false for succcess status, and index 1:
+		return value from called function.'''
+		
+		# Verify that target is in lookup table
+		if not remote_addr in self.drivers:
+			self.log.error(f"DriverManager unable to route NetworkCommand because requested remote-addr is not in lookup table.")
+			return (False, None)
+		
 		# Translate NetworkCommand into a function call
 		
 		# Try to grab function handle
 		try:
 			# Try to get function handle from driver object
-			func_handle = getattr(self.drivers[command.remote_addr], command.function)
+			func_handle = getattr(self.drivers[remote_addr], function)
 		except AttributeError as e:
-			self.log.error(f"DriverManager unable to route command because the specified driver does not have the requested function.", detail=f"driver remote address={command.remote_addr}, function={command.function}(), error message: ({e})")
+			self.log.error(f"DriverManager unable to route command because the specified driver does not have the requested function.", detail=f"driver remote address={remote_addr}, function={function}(), error message: ({e})")
 			return (False, None)
 		
 		# Unpack args into list from dict
 		#TODO: Iterate over this better (should be ints, but should double check all consecutive and starting ffrom  zero and in order. )
+		stats = getattr(self.ca, "compress_stats", None)
 		args = []
-		for k, v in command.args.items():
-			args.append(v)
+		for k, v in args_dict.items():
+			args.append(decode_value(v, stats))
+		kwargs = decode_value(kwargs, stats)
 		
 		# Try to call function
 		try:
-			rval = func_handle(*args, **command.kwargs)
+			rval = func_handle(*args, **kwargs)
 		except TypeError as e:
-			self.log.error(f"DriverManager unable to route command because the specified function did not accept the provided arguemnts.", detail=f"Error message: ({e}). Args={args}, kwargs={command.kwargs}")
+			self.log.error(f"DriverManager unable to route command because the specified function did not accept the provided arguemnts.", detail=f"Error message: ({e}). Args={args}, kwargs={kwargs}")
 			return (False, None)
 		
 		# Return success code and return value from function (may be NOne)
@@ -159,6 +481,15 @@ class DriverManager:
 		''' Accepts a tuple from route_command() and sends the reply to the server
 		via a GenCommand.'''
 		
+		# Compress large return values if the T/C client accepts a codec supported here
+		codec = nc.reply_codec if nc.reply_codec in available_codecs() else COMPRESS_NONE
+		threshold = getattr(self.ca, "compress_threshold", COMPRESS_DEFAULT_THRESHOLD)
+		stats = getattr(self.ca, "compress_stats", None)
+		
+		# Batches are replied to in one REMREPLY-BATCH
+		if len(nc.calls) > 0:
+			return self.dl_reply_batch(nc, status_rval, codec, threshold, stats)
+		
 		try:
 			if not status_rval[0]: # An error occured when routing the command or when the driver communicated with the intrument.
 				
@@ -171,7 +502,21 @@ class DriverManager:
 				
 				# Send back a gencommand indicating: This is a remote_call return, the value returned successfully, the original function call was X, the T/C client that should receive this message is Y, and the return value from the function is Z (can be None).
 				
-				gc = GenCommand("REMREPLY", {"RCALL_STATUS":True, "LOCAL_RCALL_ID":nc.local_rcall_id, "RVAL":status_rval[1], "REMOTE-ID": nc.remote_id, "REMOTE-ADDR": nc.remote_addr, "REPLYTO_CLIENT": nc.source_client})
+				# Hand large return values to the BulkServer, for the caller to fetch directly
+				if nc.bulk_ok and (self.bulk_server is not None):
+					arr = stream_array(status_rval[1])
+					if (arr is not None) and (arr.nbytes > self.bulk_threshold):
+						ticket = self.bulk_server.offer(status_rval[1])
+						if ticket is not None:
+							status_rval = (True, {BULK_KEY:ticket})
+				
+				# Stream large return values in chunks
+				if self.chunk_size > 0:
+					chunks = make_chunks(status_rval[1], self.chunk_size, codec, stats)
+					if chunks is not None:
+						return self.dl_reply_chunks(nc, chunks)
+				
+				gc = GenCommand("REMREPLY", {"RCALL_STATUS":True, "LOCAL_RCALL_ID":nc.local_rcall_id, "RVAL":pack_payload(status_rval[1], codec, threshold, stats), "REMOTE-ID": nc.remote_id, "REMOTE-ADDR": nc.remote_addr, "REPLYTO_CLIENT": nc.source_client})
 				
 		except:
 			self.log.error(f"DriverManager.route_command() returned an invalid tuple! This could is likely an error with route_command().")
@@ -179,6 +524,10 @@ class DriverManager:
 			# Send back a gencommand indicating: THis is a remote_call return, the value returned as an error, the original function call was X, the T/C client that should receive this message is Y.
 			gc = GenCommand("REMREPLY", {"RCALL_STATUS":False, "LOCAL_RCALL_ID":nc.local_rcall_id, "RVAL":None, "REMOTE-ID": nc.remote_id, "REMOTE-ADDR": nc.remote_addr, "REPLYTO_CLIENT": nc.source_client})
 		
+		# Return trace to caller
+		if nc.trace:
+			gc.data[TRACE_KEY] = nc.trace
+		
 		# Send command to server and check for status
 		if not self.ca.send_command(gc):
 			self.log.error("Failed to send remote call reply. Received fail from server.")
@@ -186,7 +535,57 @@ class DriverManager:
 		else:
 			self.log.debug(f"Successfully sent remote call reply.")
 			return True
+	
+	def dl_reply_batch(self, nc:NetworkCommand, status_rval:tuple, codec:str, threshold:int, stats:CompressionStats) -> bool:
+		''' Sends the results of a REMCALL-BATCH as one REMREPLY-BATCH, with a status
+		and return value for each call, in order.'''
+		
+		results = []
+		try:
+			if status_rval[0]:
+				for call_status, call_rval in status_rval[1]:
+					results.append({"STATUS":call_status, "RVAL":pack_payload(call_rval, codec, threshold, stats) if call_status else None})
+			rcall_status = status_rval[0]
+		except Exception as e:
+			self.log.error(f"DriverManager.route_batch() returned an invalid tuple! ({e})")
+			results = []
+			rcall_status = False
+		
+		gc = GenCommand("REMREPLY-BATCH", {"RCALL_STATUS":rcall_status, "LOCAL_RCALL_ID":nc.local_rcall_id, "RESULTS":results, "REMOTE-ID": nc.remote_id, "REMOTE-ADDR": nc.remote_addr, "REPLYTO_CLIENT": nc.source_client})
+		if nc.trace:
+			gc.data[TRACE_KEY] = nc.trace
+		
+		# Send command to server and check for status
+		if not self.ca.send_command(gc):
+			self.log.error("Failed to send remote call batch reply. Received fail from server.")
+			return False
+		else:
+			self.log.debug(f"Successfully sent remote call batch reply ({len(results)} results).")
+			return True
+	
+	def dl_reply_chunks(self, nc:NetworkCommand, chunks:list) -> bool:
+		''' Sends a successful reply as a sequence of REMREPLY-CHUNK commands. The
+		server forwards each chunk as it arrives, so replies to other calls can be
+		delivered between chunks.'''
+		
+		num_chunks = len(chunks)
+		self.log.debug(f"Sending remote call reply in {num_chunks} chunks.")
 		
+		for idx, (info, data) in enumerate(chunks):
+			
+			gc = GenCommand("REMREPLY-CHUNK", {"RCALL_STATUS":True, "LOCAL_RCALL_ID":nc.local_rcall_id, "REMOTE-ID": nc.remote_id, "REMOTE-ADDR": nc.remote_addr, "REPLYTO_CLIENT": nc.source_client, "CHUNK_IDX":idx, "NUM_CHUNKS":num_chunks, "CHUNK_INFO":info, "DATA":data})
+			
+			# Trace is returned with the last chunk, when the reply is complete
+			if nc.trace and idx == num_chunks-1:
+				gc.data[TRACE_KEY] = nc.trace
+			
+			if not self.ca.send_command(gc):
+				self.log.error(f"Failed to send remote call reply chunk {idx+1}/{num_chunks}. Received fail from server.")
+				return False
+		
+		self.log.debug(f"Successfully sent remote call reply.")
+		return True
+	
 	def add_instrument(self, instrument:Driver) -> bool:
 		''' Adds an instrument to the DriverManager and will register it
 		with the server if a ClientAgent was provided.
@@ -214,4 +613,41 @@ class DriverManager:
 		# Add to driver dictionary
 		self.drivers[instrument.id.remote_addr] = instrument
 		
-		return True
\ No newline at end of file
+		# Start worker thread
+		if self.concurrent:
+			self.actors[instrument.id.remote_addr] = DriverActor(instrument)
+		
+		return True
+	
+	def stop_workers(self, wait:bool=True):
+		''' Stops the sampler thread, and all worker threads after their queued
+		commands finish. Commands dispatched afterwards run in the calling thread.'''
+		
+		self.stop_sampler(wait=wait)
+		
+		if self.bulk_server is not None:
+			self.bulk_server.stop()
+			self.bulk_server = None
+		
+		actors = self.actors
+		self.actors = {}
+		for actor in actors.values():
+			actor.stop(wait=wait)
+	
+	def connect_all(self, check_id:bool=True, refresh:bool=False, timeout_s:float=10) -> list:
+		''' Connects all drivers in parallel. See DriverFleet.connect_all().
+		
+		Returns:
+			List of FleetResult objects.
+		'''
+		
+		return DriverFleet(self.log, list(self.drivers.values())).connect_all(check_id=check_id, refresh=refresh, timeout_s=timeout_s)
+	
+	def refresh_all(self, timeout_s:float=10) -> list:
+		''' Calls refresh_state() on all drivers in parallel. See DriverFleet.refresh_all().
+		
+		Returns:
+			List of FleetResult objects.
+		'''
+		
+		return DriverFleet(self.log, list(self.drivers.values())).refresh_all(timeout_s=timeout_s)
\ No newline at end of file
@@ -0,0 +1,166 @@
+''' Tracing of remote calls across each hop of the Heimdallr network, so the time a
+call spends in the network, in the server queues and in the instrument can be
+compared.
+'''
+
+import time
+import json
+import threading
+from collections import deque
+
+# Key of trace dictionary in REMCALL/REMREPLY GenCommands
+TRACE_KEY = "TRACE"
+
+# Hops stamped on each traced remote call, in the order they occur
+HOP_CLIENT_SEND = "client_send" # T/C client sends REMCALL
+HOP_SERVER_ENQUEUE = "server_enqueue" # Server queues NetworkCommand for D/L client
+HOP_DL_DEQUEUE = "dl_dequeue" # D/L client receives NetworkCommand from DL-LISTEN
+HOP_EXEC_START = "exec_start" # Driver starts executing the call
+HOP_EXEC_END = "exec_end" # Driver finishes executing the call
+HOP_REPLY_ENQUEUE = "reply_enqueue" # Server queues NetworkReply for T/C client
+HOP_CALLER_RECEIPT = "caller_receipt" # T/C client receives NetworkReply
+TRACE_HOPS = [HOP_CLIENT_SEND, HOP_SERVER_ENQUEUE, HOP_DL_DEQUEUE, HOP_EXEC_START, HOP_EXEC_END, HOP_REPLY_ENQUEUE, HOP_CALLER_RECEIPT]
+
+# Name of each stage between consecutive hops
+TRACE_STAGES = ["request network", "server queue", "driver queue", "instrument", "reply network", "reply queue"]
+
+# Default number of completed traces kept
+MAX_TRACES = 10000
+
+def trace_stamp(trace:dict, hop:str):
+	''' Records the time (time.monotonic_ns()) of a hop in a trace. Does nothing if
+	the call is not traced (trace is None or empty).'''
+	
+	if trace:
+		trace[hop] = time.monotonic_ns()
+
+def trace_stages(trace:dict) -> list:
+	''' Returns a list of (stage name, start ns, duration ns) tuples for each stage
+	of a trace where both hops were stamped.'''
+	
+	stages = []
+	for idx, name in enumerate(TRACE_STAGES):
+		t0 = trace.get(TRACE_HOPS[idx], None)
+		t1 = trace.get(TRACE_HOPS[idx+1], None)
+		if t0 is None or t1 is None:
+			continue
+		stages.append((name, t0, t1 - t0))
+	return stages
+
+class CallTracer:
+	''' Traces remote calls sent by a client. Each traced call carries a dictionary
+	of hop timestamps through the server and the driver/listener client, and the
+	completed trace is recorded when the reply is received.
+	
+	Timestamps are from time.monotonic_ns() on each machine. They are comparable
+	when all clients and the server run on one host. Across hosts, only stages
+	measured on one machine (ie. instrument) are meaningful.
+	'''
+	
+	def __init__(self, log, max_traces:int=MAX_TRACES):
+		
+		self.log = log
+		self.enabled = False
+		self.max_traces = max_traces
+		
+		self.mtx = threading.Lock()
+		self.pending = {} # key = local_rcall_id, value = label of call
+		self.traces = deque(maxlen=max_traces) # Completed traces, oldest first
+	
+	def start(self, rcall_id:int, label:str) -> dict:
+		''' Starts tracing a remote call.
+		
+		Returns:
+			Trace dictionary to send with the call, or None if tracing is disabled.
+		'''
+		
+		if not self.enabled:
+			return None
+		
+		with self.mtx:
+			if len(self.pending) >= self.max_traces:
+				return None
+			self.pending[rcall_id] = label
+		
+		return {HOP_CLIENT_SEND:time.monotonic_ns()}
+	
+	def finish(self, rcall_id:int, trace:dict):
+		''' Records the trace of a remote call when its reply is received.'''
+		
+		with self.mtx:
+			label = self.pending.pop(rcall_id, None)
+		if label is None or not trace:
+			return
+		
+		trace_stamp(trace, HOP_CALLER_RECEIPT)
+		with self.mtx:
+			self.traces.append({"rcall_id":rcall_id, "label":label, "hops":trace})
+	
+	def discard(self, rcall_id:int):
+		''' Stops tracing a remote call which will not receive a reply.'''
+		
+		with self.mtx:
+			self.pending.pop(rcall_id, None)
+	
+	def get_traces(self) -> list:
+		''' Returns a list of completed traces, oldest first.'''
+		
+		with self.mtx:
+			return list(self.traces)
+	
+	def clear(self):
+		''' Removes all completed traces.'''
+		
+		with self.mtx:
+			self.traces.clear()
+	
+	def summary(self) -> dict:
+		''' Returns a dictionary with the mean and max time (seconds) of each stage
+		over all completed traces.'''
+		
+		totals = {}
+		for tr in self.get_traces():
+			for name, t0, dt in trace_stages(tr['hops']):
+				n, tot, mx = totals.get(name, (0, 0, 0))
+				totals[name] = (n+1, tot+dt, max(mx, dt))
+		
+		return {name:{"count":n, "mean_s":tot/n*1e-9, "max_s":mx*1e-9} for name, (n, tot, mx) in totals.items()}
+	
+	def export_jsonl(self, filename:str) -> bool:
+		''' Saves completed traces as JSON lines, one trace per line.
+		
+		Returns:
+			True if successful, else False.
+		'''
+		
+		try:
+			with open(filename, 'w') as fh:
+				for tr in self.get_traces():
+					fh.write(json.dumps(tr) + "\n")
+		except Exception as e:
+			self.log.error(f"Failed to export traces to {filename}.", detail=f"{e}")
+			return False
+		
+		return True
+	
+	def export_chrome(self, filename:str) -> bool:
+		''' Saves completed traces in Chrome trace format, which can be opened in
+		chrome://tracing or Perfetto. Each call is a row, with an event for each stage.
+		
+		Returns:
+			True if successful, else False.
+		'''
+		
+		events = []
+		for tr in self.get_traces():
+			for name, t0, dt in trace_stages(tr['hops']):
+				events.append({"name":name, "cat":tr['label'], "ph":"X", "ts":t0/1e3, "dur":dt/1e3, "pid":0, "tid":tr['rcall_id'], "args":{"label":tr['label']}})
+		
+		try:
+			with open(filename, 'w') as fh:
+				json.dump({"traceEvents":events, "displayTimeUnit":"ms"}, fh)
+		except Exception as e:
+			self.log.error(f"Failed to export traces to {filename}.", detail=f"{e}")
+			return False
+		
+		return True
@@ -0,0 +1,68 @@
+''' Tests of direct peer-to-peer transfers (see bulk.py), on localhost.'''
+
+import time
+import pytest
+import numpy as np
+import pylogfile.base as plf
+from heimdallr.base import *
+from heimdallr.networking.bulk import *
+
+@pytest.fixture
+def server():
+	log = plf.LogPile()
+	log.terminal_output_enable = False
+	srv = BulkServer(log, host="127.0.0.1")
+	assert srv.start()
+	yield srv
+	srv.stop()
+
+def test_large_ndarray_is_fetched(server):
+	
+	arr = np.random.default_rng(0).standard_normal(2*1048576)
+	ticket = server.offer(arr)
+	assert ticket["nbytes"] == arr.nbytes
+	
+	out = fetch_bulk("127.0.0.1", server.port, ticket)
+	assert out.dtype == arr.dtype
+	assert np.array_equal(out, arr)
+	assert server.num_served == 1
+
+def test_tracedata_is_fetched(server):
+	
+	td = TraceData(np.arange(1000, dtype=np.complex64), x_units="Hz", x_start=1e9, x_stop=2e9)
+	out = fetch_bulk("127.0.0.1", server.port, server.offer(td))
+	
+	assert isinstance(out, TraceData)
+	assert np.array_equal(out.y, td.y)
+	assert out.x_start == 1e9
+
+def test_non_array_values_are_not_offered(server):
+	assert server.offer([1, 2, 3]) is None
+
+def test_ticket_is_single_use(server):
+	
+	ticket = server.offer(np.zeros(10))
+	fetch_bulk("127.0.0.1", server.port, ticket)
+	
+	with pytest.raises(ConnectionError):
+		fetch_bulk("127.0.0.1", server.port, ticket)
+
+def test_expired_ticket_is_rejected(server):
+	
+	server.ticket_ttl_s = 0.05
+	ticket = server.offer(np.zeros(10))
+	time.sleep(0.1)
+	
+	with pytest.raises(ConnectionError):
+		fetch_bulk("127.0.0.1", server.port, ticket)
+	
+	# Expired tickets are purged when new values are offered
+	server.offer(np.zeros(10))
+	time.sleep(0.1)
+	server.offer(np.zeros(10))
+	assert len(server.tickets) == 1
+
+def test_unknown_ticket_is_rejected(server):
+	
+	with pytest.raises(ConnectionError):
+		fetch_bulk("127.0.0.1", server.port, {"ticket":"0"*32, "nbytes":0})
@@ -0,0 +1,157 @@
+''' Tests of the typed encoding of remote call values (see codec.py).'''
+
+import json
+import pytest
+import numpy as np
+from heimdallr.base import *
+from heimdallr.networking.codec import *
+
+def roundtrip(val):
+	''' Encodes a value, passes it through JSON as the network does, and decodes it.'''
+	return decode_value(json.loads(json.dumps(encode_value(val))))
+
+def test_complex_ndarray_roundtrips_exactly():
+	
+	arr = (np.arange(12) + 1j*np.linspace(-1, 1, 12)).reshape(3, 4).astype(np.complex128)
+	out = roundtrip(arr)
+	
+	assert out.dtype == arr.dtype
+	assert out.shape == (3, 4)
+	assert np.array_equal(out, arr)
+	
+	# Decoded arrays can be modified in place
+	out[0, 0] = 0
+	assert out[0, 0] == 0
+
+def test_byte_order_is_kept():
+	
+	arr = np.arange(5, dtype='>f4')
+	out = roundtrip(arr)
+	
+	assert out.dtype == arr.dtype
+	assert np.array_equal(out, arr)
+
+def test_nested_values_roundtrip():
+	
+	val = {"s21":np.ones(3, dtype=np.complex64), "gain":np.float32(2.5), "z":1+2j, "pair":(1, "a"), "none":None}
+	out = roundtrip(val)
+	
+	assert out["s21"].dtype == np.complex64
+	assert np.array_equal(out["s21"], val["s21"])
+	assert out["gain"] == 2.5 and isinstance(out["gain"], float)
+	assert out["z"] == 1+2j
+	assert out["pair"] == [1, "a"]
+	assert out["none"] is None
+
+def test_object_ndarray_roundtrips_elementwise():
+	
+	arr = np.array([1, "two", 3+0j], dtype=object)
+	out = roundtrip(arr)
+	
+	assert out.dtype == object
+	assert list(out) == [1, "two", 3+0j]
+
+def test_tracedata_keeps_lazy_x_axis():
+	
+	td = TraceData(np.linspace(0, 1, 101), x_units="Hz", y_units="dB", x_start=1e9, x_stop=2e9, timestamp=123.0)
+	out = roundtrip(td)
+	
+	assert isinstance(out, TraceData)
+	assert np.array_equal(out.y, td.y)
+	assert out._x is None
+	assert out.x_start == 1e9 and out.x_stop == 2e9
+	assert out.x_units == "Hz" and out.y_units == "dB"
+	assert out.timestamp == 123.0
+
+def test_large_ndarray_is_compressed_and_restored():
+	
+	arr = np.zeros(100000, dtype=np.float64)
+	stats = CompressionStats()
+	enc = json.loads(json.dumps(pack_payload(arr, COMPRESS_ZLIB, stats=stats)))
+	
+	assert enc[COMPRESSED_KEY] == COMPRESS_ZLIB
+	assert np.array_equal(decode_value(enc, stats), arr)
+	assert stats.summary()["num_compressed"] == 1
+	assert stats.summary()["num_decompressed"] == 1
+
+def test_small_or_incompressible_values_are_sent_raw():
+	
+	small = np.zeros(10)
+	assert COMPRESSED_KEY not in pack_payload(small, COMPRESS_ZLIB)
+	
+	noise = np.random.default_rng(0).bytes(200000)
+	arr = np.frombuffer(noise, dtype=np.uint8)
+	enc = pack_payload(arr, COMPRESS_ZLIB)
+	assert COMPRESSED_KEY not in enc
+	assert np.array_equal(decode_value(enc), arr)
+
+def test_large_list_is_compressed_as_json():
+	
+	val = [0.5]*50000
+	enc = json.loads(json.dumps(pack_payload(val, COMPRESS_ZLIB)))
+	
+	assert enc[COMPRESSED_KEY] == COMPRESS_ZLIB
+	assert decode_value(enc) == val
+
+def test_codecs_fall_back_without_lz4(monkeypatch):
+	
+	import heimdallr.networking.codec as codec
+	monkeypatch.setattr(codec, "lz4_frame", None)
+	
+	assert codec.available_codecs() == [COMPRESS_ZLIB, COMPRESS_NONE]
+	
+	# A peer which agreed on no compression receives plain values
+	arr = np.zeros(100000)
+	assert COMPRESSED_KEY not in pack_payload(arr, COMPRESS_NONE)
+	
+	# An lz4 payload can not be decoded here
+	with pytest.raises(ValueError):
+		codec.decompress_bytes(b"\x04\x22\x4d\x18", COMPRESS_LZ4)
+
+def test_small_values_are_not_chunked():
+	
+	assert make_chunks(np.zeros(10), chunk_size=1024) is None
+	assert make_chunks([1, 2, 3], chunk_size=1024) is None
+
+def test_ndarray_chunks_reassemble_in_any_order():
+	
+	arr = (np.arange(5000) * (1+1j)).astype(np.complex128)
+	chunks = make_chunks(arr, chunk_size=4096, codec=COMPRESS_ZLIB)
+	assert len(chunks) == int(np.ceil(arr.nbytes/4096))
+	
+	asm = ChunkAssembler(len(chunks))
+	order = list(reversed(range(len(chunks))))
+	for n, i in enumerate(order):
+		info, data = json.loads(json.dumps(chunks[i]))
+		assert asm.add(i, info, data) == (n == len(chunks)-1)
+	
+	# Duplicate chunks are ignored
+	assert asm.add(0, *chunks[0])
+	assert np.array_equal(asm.value(), arr)
+
+def test_tracedata_chunks_keep_template():
+	
+	td = TraceData(np.linspace(0, 1, 2000), x_units="Hz", x_start=1e9, x_stop=2e9)
+	chunks = make_chunks(td, chunk_size=1000)
+	
+	asm = ChunkAssembler(len(chunks))
+	for i, (info, data) in enumerate(chunks):
+		asm.add(i, info, data)
+	out = asm.value()
+	
+	assert isinstance(out, TraceData)
+	assert np.array_equal(out.y, td.y)
+	assert out.x_start == 1e9 and out.x_units == "Hz"
+
+def test_json_chunks_reassemble():
+	
+	val = {"waveform":[float(i) for i in range(5000)], "name":"ch1"}
+	chunks = make_chunks(val, chunk_size=2048)
+	assert all(info["mode"] == STREAM_JSON for info, data in chunks)
+	
+	asm = ChunkAssembler(len(chunks))
+	for i in [2, 0, 1] + list(range(3, len(chunks))):
+		asm.add(i, *chunks[i])
+	
+	assert asm.complete()
+	assert asm.value() == val
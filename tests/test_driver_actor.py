@@ -0,0 +1,41 @@
+''' Tests of DriverActor (see driver_actor.py).'''
+
+import time
+import pylogfile.base as plf
+from heimdallr.base import *
+from heimdallr.instrument_control.driver_actor import DriverActor
+
+class FakeDriver(Driver):
+	
+	def __init__(self):
+		super().__init__("TCPIP::fake::INSTR", plf.LogPile(), defer_connect=True)
+		self.log.terminal_output_enable = False
+		self.online = True
+	
+	def wait_for(self, delay_s:float=0, timeout_s:float=1):
+		''' Sleeps for delay_s and returns the timeout it was called with.'''
+		time.sleep(delay_s)
+		return timeout_s
+	
+	def refresh_state(self):
+		pass
+	
+	def apply_state(self, new_state:dict):
+		pass
+
+def test_proxy_passes_timeout_to_driver():
+	
+	actor = DriverActor(FakeDriver())
+	try:
+		assert actor.wait_for(timeout_s=5) == 5
+		assert actor.wait_for(delay_s=0.2, timeout_s=0.05) == 0.05
+	finally:
+		actor.stop()
+
+def test_call_separates_actor_timeout_from_driver_timeout():
+	
+	actor = DriverActor(FakeDriver())
+	try:
+		assert actor.call("wait_for", timeout_s=7, actor_timeout_s=2) == 7
+	finally:
+		actor.stop()
@@ -0,0 +1,165 @@
+''' Tests of the Driver settings cache (see Driver.enable_cache()).'''
+
+import numpy as np
+import pylogfile.base as plf
+from heimdallr.base import *
+
+class FakeVNAInstrument:
+	''' Stands in for a PyVISA resource, answering frequency and power queries and
+	recording every command sent. Start frequencies above 8.5 GHz are clamped.'''
+	
+	FREQ_MAX = 8.5e9
+	
+	def __init__(self):
+		self.commands = []
+		self.timeout = 2000
+		self.freq_start = 1e9
+		self.power = {1:-10.0, 2:-20.0}
+	
+	def write(self, cmd:str):
+		self.commands.append(cmd)
+		if ":FREQ:STAR " in cmd:
+			self.freq_start = min(float(cmd.split()[-1]), FakeVNAInstrument.FREQ_MAX)
+		elif ":POW" in cmd:
+			self.power[int(cmd.split()[0][-1])] = float(cmd.split()[-1])
+	
+	def query(self, cmd:str):
+		self.commands.append(cmd)
+		if "FREQ:STAR?" in cmd:
+			return str(self.freq_start)
+		if "FREQ:STOP?" in cmd:
+			return "2e9"
+		if ":POW" in cmd:
+			return str(self.power[int(cmd[-2])])
+		return "0"
+	
+	def close(self):
+		pass
+
+class FakeVNA(Driver):
+	
+	FREQ_START = "freq-start[Hz]"
+	FREQ_END = "freq-end[Hz]"
+	POWER = "power[dBm]"
+	
+	def __init__(self):
+		super().__init__("TCPIP::fake::INSTR", plf.LogPile(), defer_connect=True)
+		self.log.terminal_output_enable = False
+		self.state[FakeVNA.FREQ_START] = []
+		self.state[FakeVNA.FREQ_END] = []
+		self.state[FakeVNA.POWER] = []
+		self.inst = FakeVNAInstrument()
+		self.online = True
+	
+	def set_freq_start(self, f_Hz:float, channel:int=1):
+		self.write(f"SENS{channel}:FREQ:STAR {f_Hz}")
+		self.modify_state(self.get_freq_start, FakeVNA.FREQ_START, f_Hz, channel=channel)
+	def get_freq_start(self, channel:int=1):
+		return self.modify_state(None, FakeVNA.FREQ_START, float(self.query(f"SENS{channel}:FREQ:STAR?")), channel=channel)
+	
+	def get_freq_end(self, channel:int=1):
+		return self.modify_state(None, FakeVNA.FREQ_END, float(self.query(f"SENS{channel}:FREQ:STOP?")), channel=channel)
+	
+	def set_power(self, p_dBm:float, channel:int=1, port:int=1):
+		self.write(f"SOUR{channel}:POW{port} {p_dBm}")
+		self.modify_state(self.get_power, FakeVNA.POWER, p_dBm, channel=channel)
+	def get_power(self, channel:int=1, port:int=1):
+		return self.modify_state(None, FakeVNA.POWER, float(self.query(f"SOUR{channel}:POW{port}?")), channel=channel)
+	
+	def get_trace_data(self, channel:int, trace:int):
+		''' Reads settings with nested get_ calls, as the VNA and spectrum analyzer
+		drivers do.'''
+		
+		self.query(f"CALC{channel}:DATA? SDATA")
+		f0 = self.get_freq_start(channel)
+		fe = self.get_freq_end(channel)
+		return TraceData(np.zeros(11), x_units='Hz', x_start=f0, x_stop=fe)
+	
+	def refresh_state(self):
+		self.get_freq_start()
+		self.get_freq_end()
+	
+	def apply_state(self, new_state:dict):
+		pass
+
+def test_getter_calling_getter_is_not_cached_as_setting():
+	
+	vna = FakeVNA()
+	vna.enable_cache(True)
+	
+	first = vna.get_trace_data(1, 1)
+	second = vna.get_trace_data(1, 1)
+	
+	assert isinstance(first, TraceData)
+	assert isinstance(second, TraceData)
+	assert second.x_start == 1e9
+	
+	# Trace data is re-read, but the nested settings are served from the cache
+	assert vna.inst.commands.count("CALC1:DATA? SDATA") == 2
+	assert vna.inst.commands.count("SENS1:FREQ:STAR?") == 1
+	assert vna.inst.commands.count("SENS1:FREQ:STOP?") == 1
+
+def test_setter_is_skipped_when_value_cached():
+	
+	vna = FakeVNA()
+	vna.enable_cache(True)
+	vna.get_freq_start()
+	vna.inst.commands = []
+	
+	# The first set is read back by the next get, after which an identical set is skipped
+	vna.set_freq_start(5e9)
+	assert vna.get_freq_start() == 5e9
+	vna.set_freq_start(5e9)
+	
+	assert vna.get_freq_start() == 5e9
+	assert vna.inst.commands == ["SENS1:FREQ:STAR 5000000000.0", "SENS1:FREQ:STAR?"]
+
+def test_setter_caches_value_applied_by_instrument():
+	
+	vna = FakeVNA()
+	vna.enable_cache(True)
+	vna.get_freq_start()
+	
+	# Instrument clamps the start frequency, so the requested value must not be cached
+	vna.set_freq_start(20e9)
+	assert vna.get_freq_start() == FakeVNAInstrument.FREQ_MAX
+	
+	# Requesting the same out-of-range value again is not skipped
+	vna.inst.commands = []
+	vna.set_freq_start(20e9)
+	assert vna.inst.commands == ["SENS1:FREQ:STAR 20000000000.0"]
+
+def test_getter_with_port_argument_is_not_cached():
+	
+	vna = FakeVNA()
+	vna.enable_cache(True)
+	
+	assert vna.get_power(1, port=1) == -10
+	assert vna.get_power(1, port=2) == -20
+	
+	vna.set_power(-5, 1, port=2)
+	vna.set_power(-5, 1, port=2)
+	assert vna.get_power(1, port=1) == -10
+	assert vna.get_power(1, port=2) == -5
+	
+	assert vna.inst.commands.count("SOUR1:POW2 -5") == 2
+
+class BatchedFakeVNA(FakeVNA):
+	
+	@batchfunction
+	def get_trace_data(self, channel:int, trace:int):
+		''' Reads trace data inside a batch, as PNA get_trace_data() does.'''
+		return super().get_trace_data(channel, trace)
+
+def test_batchfunction_getter_is_excluded_from_cache():
+	
+	vna = BatchedFakeVNA()
+	vna.enable_cache(True)
+	
+	assert vna.get_trace_data.__name__ == "get_trace_data"
+	assert "inside a batch" in vna.get_trace_data.__doc__
+	
+	vna.get_trace_data(1, 1)
+	vna.get_trace_data(1, 1)
+	
+	assert vna.inst.commands.count("CALC1:DATA? SDATA") == 2
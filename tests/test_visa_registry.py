@@ -0,0 +1,66 @@
+''' Tests of the pooled VISA sessions (see VisaRegistry).'''
+
+import threading
+from heimdallr.base import *
+
+class FakeResource:
+	
+	def __init__(self, address:str):
+		self.address = address
+		self.closed = False
+	
+	def close(self):
+		self.closed = True
+
+class FakeResourceManager:
+	
+	def open_resource(self, address:str):
+		return FakeResource(address)
+
+def make_registry() -> VisaRegistry:
+	reg = VisaRegistry()
+	reg.managers[""] = FakeResourceManager()
+	return reg
+
+def test_discard_closes_only_when_released():
+	
+	reg = make_registry()
+	sess_a = reg.open_session("TCPIP::a::INSTR")
+	sess_b = reg.open_session("TCPIP::a::INSTR")
+	assert sess_a is sess_b
+	
+	# Still held by the second driver, so only marked stale
+	reg.release_session(sess_a)
+	reg.discard_session("TCPIP::a::INSTR")
+	assert sess_a.stale
+	assert not sess_a.inst.closed
+	
+	# New opens get a new resource
+	sess_c = reg.open_session("TCPIP::a::INSTR")
+	assert sess_c is not sess_a
+	
+	reg.release_session(sess_b)
+	assert sess_a.inst.closed
+	assert not sess_c.inst.closed
+
+def test_discard_does_not_block_other_addresses():
+	
+	reg = make_registry()
+	busy = reg.open_session("TCPIP::busy::INSTR")
+	reg.release_session(busy)
+	
+	# Simulate a long transaction on the busy session while it is discarded
+	busy.lock.acquire()
+	th = threading.Thread(target=reg.discard_session, args=("TCPIP::busy::INSTR",), daemon=True)
+	th.start()
+	th.join(0.2)
+	
+	try:
+		other = reg.open_session("TCPIP::other::INSTR")
+		assert other.refcount == 1
+		assert reg.get_manager("") is not None
+	finally:
+		busy.lock.release()
+	
+	th.join(1)
+	assert busy.inst.closed
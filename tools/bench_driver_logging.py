@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+''' Measures Driver transactions per second against a simulated instrument with
+logging gated at INFO versus ungated (default), which records every LOWDEBUG log. Shows the
+overhead of log message formatting on the write/query hot paths.
+'''
+
+import time
+import argparse
+import numpy as np
+import pylogfile.base as plf
+
+from heimdallr.base import Driver
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-n', '--num', help='Number of transactions per test', type=int, default=20000)
+parser.add_argument('--points', help='Number of points in simulated waveform state', type=int, default=10000)
+args = parser.parse_args()
+
+class SimulatedInstrument:
+	''' Minimal stand-in for a PyVISA resource which responds instantly.'''
+	
+	def __init__(self):
+		self.timeout = 2000
+	
+	def write(self, cmd:str):
+		pass
+	
+	def query(self, cmd:str):
+		return "1.0\n"
+	
+	def read(self):
+		return "1.0\n"
+	
+	def close(self):
+		pass
+
+class SimulatedDriver(Driver):
+	
+	WAVEFORM = "waveform[V]"
+	FREQ = "freq[Hz]"
+	
+	def __init__(self, log:plf.LogPile):
+		super().__init__("SIM::INSTR", log)
+		
+		self.state[SimulatedDriver.WAVEFORM] = None
+		self.state[SimulatedDriver.FREQ] = None
+	
+	def connect(self, check_id:bool=True):
+		self.inst = SimulatedInstrument()
+		self.online = True
+	
+	def set_freq(self, f_Hz:float):
+		self.write(f"FREQ {f_Hz}")
+		self.modify_state(None, SimulatedDriver.FREQ, f_Hz)
+	def get_freq(self):
+		return self.modify_state(None, SimulatedDriver.FREQ, float(self.query("FREQ?")))
+	
+	def refresh_state(self):
+		self.get_freq()
+	
+	def apply_state(self, new_state:dict):
+		pass
+
+def run_test(gate_level:int, waveform):
+	''' Returns transactions per second for write/query and waveform state updates.'''
+	
+	log = plf.LogPile()
+	log.terminal_output_enable = False
+	dvr = SimulatedDriver(log)
+	dvr.log_gate_level = gate_level
+	
+	# Write/query transactions
+	t0 = time.perf_counter()
+	for i in range(args.num):
+		dvr.set_freq(1e9 + i)
+		dvr.get_freq()
+	t_txn = time.perf_counter() - t0
+	
+	# Waveform state updates
+	num_wav = max(1, args.num // 100)
+	t0 = time.perf_counter()
+	for i in range(num_wav):
+		dvr.modify_state(None, SimulatedDriver.WAVEFORM, waveform)
+	t_wav = time.perf_counter() - t0
+	
+	return 2*args.num/t_txn, num_wav/t_wav, len(log.logs)
+
+waveform = list(np.random.normal(size=args.points))
+
+print(f"Transactions per test: {args.num}, waveform points: {args.points}")
+for name, lvl in [("INFO", plf.INFO), ("None", None)]:
+	txn_rate, wav_rate, nlogs = run_test(lvl, waveform)
+	print(f"  Log gate {name:>8}: {txn_rate:10.0f} transactions/s, {wav_rate:8.0f} waveform updates/s, {nlogs} logs recorded")
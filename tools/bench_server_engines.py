@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+''' Compares the pyfrost (thread per client) and asyncio Heimdallr server engines.
+For each number of simulated clients, the server is started in a subprocess and
+the clients connect and wait in TC-LISTEN long-polls, as clients waiting for
+publications do (see --listen-timeout). A driver client and a terminal client
+then exchange remote calls, and the round trip time, server CPU use, server
+thread count and rate of idle client polls are reported.
+
+Both engines log clients in against the user database with the default admin
+account (as used by examples/server_net_ex1.py), so by default the servers are run
+in the examples directory. The engines use different protocols, so pyfrost clients
+are HeimdallrClientAgents and asyncio clients are FramedClientAgents. Simulated
+pyfrost clients each need a thread in this process.
+'''
+
+import os
+import time
+import socket
+import asyncio
+import argparse
+import threading
+import multiprocessing
+import numpy as np
+import pylogfile.base as plf
+
+from pyfrost.base import *
+from heimdallr.networking.net_client import *
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--clients', help='Comma separated numbers of simulated idle clients', type=str, default="10,100,1000")
+parser.add_argument('--engines', help='Comma separated engines to test (pyfrost, asyncio)', type=str, default="pyfrost,asyncio")
+parser.add_argument('-n', '--num', help='Number of remote calls timed per test', type=int, default=200)
+parser.add_argument('--listen-timeout', help='TC-LISTEN timeout (s) requested by idle clients, as clients waiting for publications do. 0 for the server default.', type=float, default=5)
+parser.add_argument('--port', help='Port used by the servers', type=int, default=5655)
+parser.add_argument('--workdir', help='Directory the servers run in (must contain the pyfrost user database)', type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples"))
+args = parser.parse_args()
+
+ENGINE_PYFROST = "pyfrost"
+ENGINE_ASYNCIO = "asyncio"
+
+DRIVER_ADDR = "bench_drv|SIM"
+
+# TC-LISTEN timeout requested by idle clients. None for the server's.
+IDLE_LISTEN_TIMEOUT = args.listen_timeout if args.listen_timeout > 0 else None
+
+def serve_pyfrost(port:int, workdir:str):
+	''' Server subprocess for the pyfrost engine.'''
+	
+	os.chdir(workdir)
+	from pyfrost.pf_server import server_main, SOCKET_TIMEOUT
+	from heimdallr.networking.net_server import serv_master, server_callback_query, server_callback_send, server_init_function
+	serv_master.log.terminal_output_enable = False
+	
+	sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	sock.settimeout(SOCKET_TIMEOUT)
+	sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	sock.bind(("localhost", port))
+	sock.listen()
+	server_main(sock, query_func=server_callback_query, send_func=server_callback_send, sa_init_func=server_init_function)
+
+def serve_asyncio(port:int, workdir:str):
+	''' Server subprocess for the asyncio engine.'''
+	
+	os.chdir(workdir)
+	from heimdallr.networking.async_server import serv_master, run_async_server
+	serv_master.log.terminal_output_enable = False
+	run_async_server("localhost", port)
+
+def read_proc_stats(pid:int) -> tuple:
+	''' Returns (CPU time in seconds, number of threads) of a process, or (None, None)
+	if /proc is not available.'''
+	
+	try:
+		with open(f"/proc/{pid}/stat") as fh:
+			fields = fh.read().rsplit(")", 1)[1].split()
+		cpu_s = (int(fields[11]) + int(fields[12]))/os.sysconf("SC_CLK_TCK")
+		num_threads = int(fields[17])
+	except (OSError, ValueError, IndexError):
+		return (None, None)
+	return (cpu_s, num_threads)
+
+def make_client(engine:str, log:plf.LogPile, client_id:str) -> HeimdallrClientAgent:
+	''' Connects and registers a client agent for an engine. Returns None on failure.'''
+	
+	if engine == ENGINE_ASYNCIO:
+		ca = FramedClientAgent(log)
+	else:
+		ca = HeimdallrClientAgent(log)
+	ca.set_addr("localhost", args.port)
+	ca.connect_socket()
+	if not ca.login("admin", "password"):
+		return None
+	if not ca.register_client_id(client_id):
+		return None
+	return ca
+
+def run_pyfrost_idle_clients(num:int, log:plf.LogPile, stop:threading.Event, polls:list) -> list:
+	''' Starts idle pyfrost clients, each on its own thread, which long-poll
+	TC-LISTEN until stop is set. Each poll increments polls[0].'''
+	
+	def idle(idx:int):
+		ca = make_client(ENGINE_PYFROST, log, f"idle{idx}")
+		if ca is None:
+			return
+		while not stop.is_set():
+			polls[0] += 1
+			ca.tc_listen(IDLE_LISTEN_TIMEOUT)
+	
+	threads = [threading.Thread(target=idle, args=(i,), daemon=True) for i in range(num)]
+	for th in threads:
+		th.start()
+	return threads
+
+def run_asyncio_idle_clients(num:int, stop:threading.Event, polls:list) -> threading.Thread:
+	''' Starts idle asyncio-engine clients on one event loop thread, which long-poll
+	TC-LISTEN until stop is set. Each poll increments polls[0].'''
+	
+	async def idle(idx:int):
+		reader, writer = await asyncio.open_connection("localhost", args.port)
+		
+		# Set up session and log in
+		key_frame, cipher = client_key_exchange(unpack_frame(await read_frame_async(reader)))
+		writer.write(key_frame)
+		
+		async def transact(obj:dict):
+			writer.write(cipher.seal(obj))
+			await writer.drain()
+			return cipher.open(await read_frame_async(reader))
+		
+		if not (await transact({"type":FRAME_LOGIN, "username":"admin", "password":"password"}))['status']:
+			return
+		await transact({"type":FRAME_SEND, "command":"REG-CLIENT", "data":{"ID":f"idle{idx}"}})
+		while not stop.is_set():
+			polls[0] += 1
+			await transact({"type":FRAME_QUERY, "command":"TC-LISTEN", "data":{} if IDLE_LISTEN_TIMEOUT is None else {"TIMEOUT":IDLE_LISTEN_TIMEOUT}})
+		writer.close()
+	
+	async def idle_all():
+		await asyncio.gather(*[idle(i) for i in range(num)], return_exceptions=True)
+	
+	th = threading.Thread(target=asyncio.run, args=(idle_all(),), daemon=True)
+	th.start()
+	return th
+
+def run_driver(dca:HeimdallrClientAgent, stop:threading.Event):
+	''' Replies to each remote call with its first argument.'''
+	
+	while not stop.is_set():
+		ncs = dca.dl_listen()
+		for nc in ncs or []:
+			gc = GenCommand("REMREPLY", {"RCALL_STATUS":True, "LOCAL_RCALL_ID":nc.local_rcall_id, "RVAL":nc.args.get('0', None), "REMOTE-ID":nc.remote_id, "REMOTE-ADDR":nc.remote_addr, "REPLYTO_CLIENT":nc.source_client})
+			dca.send_command(gc)
+
+def time_calls(tca:HeimdallrClientAgent, num:int) -> list:
+	''' Sends remote calls one at a time and returns the round trip time of each.'''
+	
+	times = []
+	for idx in range(num):
+		t0 = time.perf_counter()
+		gc = GenCommand("REMCALL", {"LOCAL_RCALL_ID":idx, "REMOTE-ID":"SIM", "REMOTE-ADDR":DRIVER_ADDR, "FUNCTION":"echo", "ARGS":{0:idx}, "KWARGS":{}})
+		tca.send_command(gc)
+		
+		received = False
+		while not received:
+			for nr in tca.tc_listen() or []:
+				received = received or (nr.local_rcall_id == idx)
+		times.append(time.perf_counter() - t0)
+	return times
+
+def run_test(engine:str, num_clients:int) -> dict:
+	''' Runs one engine with num_clients idle clients. Returns dictionary of results.'''
+	
+	log = plf.LogPile()
+	log.terminal_output_enable = False
+	
+	target = serve_asyncio if engine == ENGINE_ASYNCIO else serve_pyfrost
+	proc = multiprocessing.Process(target=target, args=(args.port, args.workdir), daemon=True)
+	proc.start()
+	time.sleep(1)
+	
+	stop = threading.Event()
+	polls = [0] # Number of TC-LISTEN polls sent by idle clients
+	result = {"engine":engine, "clients":num_clients}
+	try:
+		# Connect idle clients
+		t0 = time.perf_counter()
+		if engine == ENGINE_ASYNCIO:
+			run_asyncio_idle_clients(num_clients, stop, polls)
+		else:
+			run_pyfrost_idle_clients(num_clients, log, stop, polls)
+		time.sleep(max(2, num_clients/200))
+		result['connect_s'] = time.perf_counter() - t0
+		
+		# Start driver and terminal clients
+		dca = make_client(engine, log, "bench_drv")
+		tca = make_client(engine, log, "bench_term")
+		if dca is None or tca is None:
+			result['error'] = "Failed to connect"
+			return result
+		threading.Thread(target=run_driver, args=(dca, stop), daemon=True).start()
+		
+		# Time remote calls
+		cpu0, _ = read_proc_stats(proc.pid)
+		polls0 = polls[0]
+		t0 = time.perf_counter()
+		times = time_calls(tca, args.num)
+		dt = time.perf_counter() - t0
+		cpu1, num_threads = read_proc_stats(proc.pid)
+		
+		result['calls_per_s'] = args.num/dt
+		result['p50_ms'] = np.percentile(times, 50)*1e3
+		result['p99_ms'] = np.percentile(times, 99)*1e3
+		result['cpu_pct'] = None if cpu0 is None else (cpu1 - cpu0)/dt*100
+		result['threads'] = num_threads
+		result['idle_polls_per_s'] = (polls[0] - polls0)/dt
+	finally:
+		stop.set()
+		proc.terminate()
+		proc.join()
+		time.sleep(0.5)
+	
+	return result
+
+def fmt(val, spec:str) -> str:
+	return "--" if val is None else format(val, spec)
+
+if __name__ == "__main__":
+	
+	print(f"Remote calls per test: {args.num}, idle client TC-LISTEN timeout: {'server default' if IDLE_LISTEN_TIMEOUT is None else f'{IDLE_LISTEN_TIMEOUT} s'}")
+	print(f"{'engine':>8} {'clients':>8} {'calls/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'CPU (%)':>8} {'threads':>8} {'idle polls/s':>13}")
+	for engine in args.engines.split(","):
+		for num_clients in [int(n) for n in args.clients.split(",")]:
+			r = run_test(engine, num_clients)
+			if 'error' in r:
+				print(f"{engine:>8} {num_clients:>8} {r['error']}")
+				continue
+			print(f"{engine:>8} {num_clients:>8} {fmt(r['calls_per_s'], '9.1f')} {fmt(r['p50_ms'], '9.2f')} {fmt(r['p99_ms'], '9.2f')} {fmt(r['cpu_pct'], '8.1f')} {fmt(r['threads'], '8d')} {fmt(r['idle_polls_per_s'], '13.0f')}")